@@ -0,0 +1,350 @@
+using System;
+using System.Collections.Concurrent;
+using System.IO;
+using System.Linq;
+using System.Net;
+using System.Net.Sockets;
+using System.Text;
+using System.Threading;
+using UnityEditor;
+using UnityEditor.Build.Reporting;
+using UnityEditor.Compilation;
+using UnityEditor.TestTools.TestRunner.Api;
+using UnityEngine;
+
+namespace MudLike.Agent
+{
+    /// <summary>
+    /// Слушатель команд бэкграунд агента в резидентном Unity Editor
+    /// Запуск: -batchmode -executeMethod MudLike.Agent.AgentEditorListener.Run -agentPort N (без -quit)
+    /// Протокол: одно TCP-подключение к 127.0.0.1 на запрос, одна JSON-строка в каждую сторону
+    /// </summary>
+    [InitializeOnLoad]
+    public static class AgentEditorListener
+    {
+        private const string PortKey = "MudLike.Agent.Port";
+        private const string ActiveKey = "MudLike.Agent.Active";
+        private const string DeadlineKey = "MudLike.Agent.Deadline";
+        private const string ResultsKey = "MudLike.Agent.Results";
+        private const int MaxStoredResults = 32;
+
+        private static readonly ConcurrentQueue<AgentCommand> _pending = new ConcurrentQueue<AgentCommand>();
+        private static readonly ConcurrentDictionary<string, AgentResponse> _results = new ConcurrentDictionary<string, AgentResponse>();
+        private static readonly ConcurrentDictionary<string, bool> _accepted = new ConcurrentDictionary<string, bool>();
+        private static TcpListener _listener;
+        private static Thread _acceptThread;
+        private static AgentCommand _current;
+        private static int _pid;
+
+        static AgentEditorListener()
+        {
+            // После domain reload слушатель поднимается заново на том же порту
+            int port = SessionState.GetInt(PortKey, 0);
+            if (port <= 0)
+            {
+                return;
+            }
+
+            RestoreState();
+            StartListener(port);
+        }
+
+        /// <summary>
+        /// Точка входа для -executeMethod
+        /// </summary>
+        public static void Run()
+        {
+            int port = ReadPortArgument();
+            if (port <= 0)
+            {
+                Debug.LogError("❌ AgentEditorListener: не указан -agentPort");
+                EditorApplication.Exit(1);
+                return;
+            }
+
+            SessionState.SetInt(PortKey, port);
+            StartListener(port);
+        }
+
+        private static int ReadPortArgument()
+        {
+            var args = Environment.GetCommandLineArgs();
+            int index = Array.IndexOf(args, "-agentPort");
+            if (index < 0 || index + 1 >= args.Length)
+            {
+                return 0;
+            }
+            return int.TryParse(args[index + 1], out int port) ? port : 0;
+        }
+
+        private static void StartListener(int port)
+        {
+            _pid = System.Diagnostics.Process.GetCurrentProcess().Id;
+            _listener = new TcpListener(IPAddress.Loopback, port);
+            _listener.Server.SetSocketOption(SocketOptionLevel.Socket, SocketOptionName.ReuseAddress, true);
+            _listener.Start();
+
+            _acceptThread = new Thread(AcceptLoop) { IsBackground = true, Name = "MudLike.Agent" };
+            _acceptThread.Start();
+
+            EditorApplication.update += Update;
+            AssemblyReloadEvents.beforeAssemblyReload += StopListener;
+            Debug.Log($"🔗 AgentEditorListener: ожидание команд на 127.0.0.1:{port}");
+        }
+
+        private static void StopListener()
+        {
+            EditorApplication.update -= Update;
+            _listener?.Stop();
+            _listener = null;
+        }
+
+        private static void AcceptLoop()
+        {
+            var listener = _listener;
+            while (listener != null)
+            {
+                try
+                {
+                    using (var client = listener.AcceptTcpClient())
+                    using (var stream = client.GetStream())
+                    using (var reader = new StreamReader(stream, Encoding.UTF8))
+                    using (var writer = new StreamWriter(stream, new UTF8Encoding(false)) { AutoFlush = true })
+                    {
+                        var command = JsonUtility.FromJson<AgentCommand>(reader.ReadLine() ?? "{}");
+                        writer.WriteLine(JsonUtility.ToJson(Handle(command)));
+                    }
+                }
+                catch (SocketException)
+                {
+                    // Слушатель остановлен перед domain reload
+                    return;
+                }
+                catch (ObjectDisposedException)
+                {
+                    return;
+                }
+                catch (Exception e)
+                {
+                    Debug.LogWarning($"⚠️ AgentEditorListener: {e.Message}");
+                }
+            }
+        }
+
+        /// <summary>
+        /// Обработка запроса в потоке слушателя: ping и result не ждут главный поток
+        /// </summary>
+        private static AgentResponse Handle(AgentCommand command)
+        {
+            switch (command.op)
+            {
+                case "ping":
+                    return new AgentResponse { ok = true, state = _current == null ? "idle" : "busy", pid = _pid };
+                case "result":
+                    // Готовый результат отдается один раз
+                    string id = command.id ?? "";
+                    if (_results.TryRemove(id, out var result))
+                    {
+                        return result;
+                    }
+                    bool running = _accepted.ContainsKey(id);
+                    return new AgentResponse { id = command.id, ok = running, state = running ? "running" : "unknown", pid = _pid };
+                case "run":
+                case "quit":
+                    _accepted[command.id ?? ""] = true;
+                    _pending.Enqueue(command);
+                    return new AgentResponse { id = command.id, ok = true, state = "accepted", pid = _pid };
+                default:
+                    return new AgentResponse { id = command.id, ok = false, state = "error", error = $"unknown op '{command.op}'" };
+            }
+        }
+
+        private static void Update()
+        {
+            if (_current != null)
+            {
+                PollCompilation();
+                return;
+            }
+
+            if (_pending.TryDequeue(out var command))
+            {
+                Begin(command);
+            }
+        }
+
+        private static void Begin(AgentCommand command)
+        {
+            if (command.op == "quit")
+            {
+                EditorApplication.Exit(0);
+                return;
+            }
+
+            Debug.Log($"🚀 AgentEditorListener: задача {command.id} ({command.type})");
+            try
+            {
+                switch (command.type)
+                {
+                    case "compile":
+                        _current = command;
+                        SessionState.SetString(ActiveKey, JsonUtility.ToJson(command));
+                        SessionState.SetFloat(DeadlineKey, (float)EditorApplication.timeSinceStartup + 1f);
+                        AssetDatabase.Refresh();
+                        CompilationPipeline.RequestScriptCompilation();
+                        break;
+                    case "build":
+                        Complete(command, Build(command), null);
+                        break;
+                    case "test":
+                        Complete(command, RunTests(command), null);
+                        break;
+                    default:
+                        Complete(command, false, $"unsupported task type '{command.type}'");
+                        break;
+                }
+            }
+            catch (Exception e)
+            {
+                Complete(command, false, e.Message);
+            }
+        }
+
+        /// <summary>
+        /// Компиляция может вызвать domain reload, поэтому состояние задачи хранится в SessionState
+        /// </summary>
+        private static void PollCompilation()
+        {
+            if (EditorApplication.timeSinceStartup < SessionState.GetFloat(DeadlineKey, 0f))
+            {
+                return;
+            }
+            if (EditorApplication.isCompiling || EditorApplication.isUpdating)
+            {
+                return;
+            }
+
+            bool failed = EditorUtility.scriptCompilationFailed;
+            Complete(_current, !failed, failed ? "script compilation failed" : null);
+        }
+
+        private static bool Build(AgentCommand command)
+        {
+            AssetDatabase.Refresh();
+            var target = (BuildTarget)Enum.Parse(typeof(BuildTarget), command.target, true);
+            var options = new BuildPlayerOptions
+            {
+                scenes = EditorBuildSettings.scenes.Where(s => s.enabled).Select(s => s.path).ToArray(),
+                locationPathName = command.buildPath,
+                target = target,
+                targetGroup = BuildPipeline.GetBuildTargetGroup(target),
+            };
+            BuildReport report = BuildPipeline.BuildPlayer(options);
+            return report.summary.result == BuildResult.Succeeded;
+        }
+
+        private static bool RunTests(AgentCommand command)
+        {
+            AssetDatabase.Refresh();
+            var api = ScriptableObject.CreateInstance<TestRunnerApi>();
+            var callbacks = new ResultCallbacks(command.resultsPath);
+            api.RegisterCallbacks(callbacks);
+
+            var filter = new Filter { testMode = TestMode.EditMode };
+            if (!string.IsNullOrEmpty(command.filter))
+            {
+                filter.testNames = command.filter.Split(';');
+            }
+            api.Execute(new ExecutionSettings(filter) { runSynchronously = true });
+            api.UnregisterCallbacks(callbacks);
+            return callbacks.Passed;
+        }
+
+        private static void Complete(AgentCommand command, bool ok, string error)
+        {
+            _current = null;
+            SessionState.EraseString(ActiveKey);
+            _results[command.id ?? ""] = new AgentResponse { id = command.id, ok = ok, state = "done", error = error, pid = _pid };
+            _accepted.TryRemove(command.id ?? "", out _);
+            PersistResults();
+            Debug.Log(ok ? $"✅ AgentEditorListener: задача {command.id} выполнена" : $"❌ AgentEditorListener: задача {command.id}: {error}");
+        }
+
+        private static void PersistResults()
+        {
+            var stored = new AgentResponseList { items = _results.Values.Take(MaxStoredResults).ToArray() };
+            SessionState.SetString(ResultsKey, JsonUtility.ToJson(stored));
+        }
+
+        private static void RestoreState()
+        {
+            var stored = JsonUtility.FromJson<AgentResponseList>(SessionState.GetString(ResultsKey, "{}"));
+            foreach (var item in stored?.items ?? Array.Empty<AgentResponse>())
+            {
+                _results[item.id ?? ""] = item;
+            }
+
+            string active = SessionState.GetString(ActiveKey, "");
+            if (!string.IsNullOrEmpty(active))
+            {
+                _current = JsonUtility.FromJson<AgentCommand>(active);
+                _accepted[_current.id ?? ""] = true;
+            }
+        }
+
+        private class ResultCallbacks : ICallbacks
+        {
+            private readonly string _resultsPath;
+
+            public bool Passed { get; private set; }
+
+            public ResultCallbacks(string resultsPath)
+            {
+                _resultsPath = resultsPath;
+            }
+
+            public void RunStarted(ITestAdaptor testsToRun) { }
+
+            public void RunFinished(ITestResultAdaptor result)
+            {
+                Passed = result.FailCount == 0;
+                if (!string.IsNullOrEmpty(_resultsPath))
+                {
+                    File.WriteAllText(_resultsPath, result.ToXml().OuterXml);
+                }
+            }
+
+            public void TestStarted(ITestAdaptor test) { }
+
+            public void TestFinished(ITestResultAdaptor result) { }
+        }
+    }
+
+    [Serializable]
+    public class AgentCommand
+    {
+        public string op;
+        public string id;
+        public string type;
+        public string target;
+        public string buildPath;
+        public string filter;
+        public string resultsPath;
+    }
+
+    [Serializable]
+    public class AgentResponse
+    {
+        public string id;
+        public bool ok;
+        public string state;
+        public string error;
+        public int pid;
+    }
+
+    [Serializable]
+    public class AgentResponseList
+    {
+        public AgentResponse[] items;
+    }
+}
@@ -0,0 +1,217 @@
+using System;
+using System.Collections.Generic;
+using System.IO;
+using Unity.Entities;
+using Unity.Profiling;
+using Unity.Profiling.LowLevel.Unsafe;
+using UnityEngine;
+using UnityEngine.SceneManagement;
+
+namespace MudLike.Profiler
+{
+    /// <summary>
+    /// Экспорт покадровых данных профилирования для Scripts/run_profiler.py
+    /// frames.bin - записи фиксированного размера (little-endian), frames.json - описание полей и маркеров
+    /// Параметры командной строки: -mudlikeProfilerOutput DIR, -mudlikeCaptureFrames N (выход после N кадров)
+    /// </summary>
+    [DisableAutoCreation]
+    [UpdateInGroup(typeof(PresentationSystemGroup), OrderLast = true)]
+    public partial class ProfilerFrameExportSystem : SystemBase
+    {
+        public const int FormatVersion = 1;
+        public const string DataFileName = "frames.bin";
+        public const string MetaFileName = "frames.json";
+
+        // Поля записи кадра перед временами маркеров (uint32 + float32)
+        private static readonly string[] FrameFields =
+        {
+            "frame", "time_s", "frame_ms", "main_thread_ms", "gpu_ms", "total_used_mb", "gc_used_mb", "gc_alloc_kb"
+        };
+
+        // Маркеры проекта, которые пишутся всегда, если доступны
+        private static readonly string[] ProjectMarkers =
+        {
+            "MudLike.Profiler", "PerformanceProfiler.Update", "Physics.Calculation",
+            "Rendering.Process", "Networking.Sync", "Audio.Process", "UI.Update"
+        };
+
+        private readonly List<string> _markerNames = new List<string>();
+        private readonly List<ProfilerRecorder> _markerRecorders = new List<ProfilerRecorder>();
+        private ProfilerRecorder _mainThread;
+        private ProfilerRecorder _cpuFrame;
+        private ProfilerRecorder _gpuFrame;
+        private ProfilerRecorder _totalUsed;
+        private ProfilerRecorder _gcUsed;
+        private ProfilerRecorder _gcAlloc;
+
+        private BinaryWriter _writer;
+        private FrameExportMeta _meta;
+        private string _outputDirectory;
+        private uint _frame;
+        private int _captureFrames;
+
+        protected override void OnCreate()
+        {
+            _outputDirectory = ProfilerStarter.ReadArgument("-mudlikeProfilerOutput")
+                ?? Path.Combine(Application.dataPath, "..", "ProfilerData");
+            int.TryParse(ProfilerStarter.ReadArgument("-mudlikeCaptureFrames"), out _captureFrames);
+            Directory.CreateDirectory(_outputDirectory);
+
+            _mainThread = ProfilerRecorder.StartNew(ProfilerCategory.Internal, "Main Thread", 1);
+            _cpuFrame = ProfilerRecorder.StartNew(ProfilerCategory.Internal, "CPU Total Frame Time", 1);
+            _gpuFrame = ProfilerRecorder.StartNew(ProfilerCategory.Render, "GPU Frame Time", 1);
+            _totalUsed = ProfilerRecorder.StartNew(ProfilerCategory.Memory, "Total Used Memory", 1);
+            _gcUsed = ProfilerRecorder.StartNew(ProfilerCategory.Memory, "GC Used Memory", 1);
+            _gcAlloc = ProfilerRecorder.StartNew(ProfilerCategory.Memory, "GC Allocated In Frame", 1);
+            StartMarkerRecorders();
+
+            var stream = new FileStream(Path.Combine(_outputDirectory, DataFileName), FileMode.Create,
+                FileAccess.Write, FileShare.Read, 1 << 16);
+            _writer = new BinaryWriter(stream);
+            _meta = new FrameExportMeta
+            {
+                version = FormatVersion,
+                record_size = 4 * (FrameFields.Length + _markerNames.Count),
+                fields = FrameFields,
+                markers = _markerNames.ToArray(),
+                unity_version = Application.unityVersion,
+                platform = Application.platform.ToString(),
+                scene = SceneManager.GetActiveScene().name,
+                started_at = DateTime.Now.ToString("yyyy-MM-ddTHH:mm:ss"),
+                frame_count = -1
+            };
+            WriteMeta();
+            Debug.Log($"📊 Экспорт кадров профилирования: {_outputDirectory} ({_markerNames.Count} маркеров)");
+        }
+
+        protected override void OnUpdate()
+        {
+            if (_writer == null)
+            {
+                return;
+            }
+
+            float frameMs = _cpuFrame.Valid && _cpuFrame.LastValue > 0
+                ? _cpuFrame.LastValue * 1e-6f
+                : Time.unscaledDeltaTime * 1000f;
+
+            _writer.Write(_frame++);
+            _writer.Write(Time.realtimeSinceStartup);
+            _writer.Write(frameMs);
+            _writer.Write(NanosecondsToMs(_mainThread));
+            _writer.Write(NanosecondsToMs(_gpuFrame));
+            _writer.Write(BytesToMb(_totalUsed));
+            _writer.Write(BytesToMb(_gcUsed));
+            _writer.Write(_gcAlloc.Valid ? _gcAlloc.LastValue / 1024f : 0f);
+            foreach (var recorder in _markerRecorders)
+            {
+                _writer.Write(NanosecondsToMs(recorder));
+            }
+
+            if (_captureFrames > 0 && _frame >= _captureFrames)
+            {
+                Debug.Log($"📊 Записано кадров: {_frame}, завершение");
+                Finish();
+                Application.Quit(0);
+            }
+        }
+
+        protected override void OnDestroy()
+        {
+            Finish();
+            _mainThread.Dispose();
+            _cpuFrame.Dispose();
+            _gpuFrame.Dispose();
+            _totalUsed.Dispose();
+            _gcUsed.Dispose();
+            _gcAlloc.Dispose();
+            foreach (var recorder in _markerRecorders)
+            {
+                recorder.Dispose();
+            }
+            _markerRecorders.Clear();
+        }
+
+        /// <summary>
+        /// Маркеры ECS-систем мира и маркеры проекта среди доступных в профилировщике
+        /// </summary>
+        private void StartMarkerRecorders()
+        {
+            var wanted = new HashSet<string>(ProjectMarkers);
+            foreach (var system in World.Systems)
+            {
+                var type = system.GetType();
+                if (type.Namespace != null && type.Namespace.StartsWith("MudLike"))
+                {
+                    wanted.Add(type.Name);
+                    wanted.Add(type.FullName);
+                }
+            }
+            string extra = ProfilerStarter.ReadArgument("-mudlikeProfilerMarkers");
+            if (!string.IsNullOrEmpty(extra))
+            {
+                wanted.UnionWith(extra.Split(';'));
+            }
+
+            var handles = new List<ProfilerRecorderHandle>();
+            ProfilerRecorderHandle.GetAvailable(handles);
+            foreach (var handle in handles)
+            {
+                var description = ProfilerRecorderHandle.GetDescription(handle);
+                if (!wanted.Contains(description.Name) || _markerNames.Contains(description.Name))
+                {
+                    continue;
+                }
+                _markerNames.Add(description.Name);
+                _markerRecorders.Add(new ProfilerRecorder(handle, 1, ProfilerRecorderOptions.Default));
+            }
+        }
+
+        private void Finish()
+        {
+            if (_writer == null)
+            {
+                return;
+            }
+            _writer.Flush();
+            _writer.Dispose();
+            _writer = null;
+            _meta.frame_count = (int)_frame;
+            _meta.ended_at = DateTime.Now.ToString("yyyy-MM-ddTHH:mm:ss");
+            WriteMeta();
+        }
+
+        private void WriteMeta()
+        {
+            File.WriteAllText(Path.Combine(_outputDirectory, MetaFileName), JsonUtility.ToJson(_meta, true));
+        }
+
+        private static float NanosecondsToMs(ProfilerRecorder recorder)
+        {
+            return recorder.Valid ? recorder.LastValue * 1e-6f : 0f;
+        }
+
+        private static float BytesToMb(ProfilerRecorder recorder)
+        {
+            return recorder.Valid ? recorder.LastValue / (1024f * 1024f) : 0f;
+        }
+    }
+
+    /// <summary>
+    /// Описание экспорта кадров (frames.json)
+    /// </summary>
+    [Serializable]
+    public class FrameExportMeta
+    {
+        public int version;
+        public int record_size;
+        public string[] fields;
+        public string[] markers;
+        public string unity_version;
+        public string platform;
+        public string scene;
+        public string started_at;
+        public string ended_at;
+        public int frame_count;
+    }
+}
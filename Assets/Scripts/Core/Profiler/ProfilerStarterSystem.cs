@@ -2,6 +2,8 @@ using Unity.Entities;
 using Unity.Profiling;
 using UnityEngine;
 using UnityEngine.Profiling;
+using UnityEngine.SceneManagement;
+using System;
 using System.Collections.Generic;
 using System.IO;
 
@@ -15,6 +17,9 @@ namespace MudLike.Profiler
     {
         private static readonly ProfilerMarker _profilerMarker = new ProfilerMarker("MudLike.Profiler");
         
+        // Мир ECS еще не создан при BeforeSceneLoad - регистрация систем повторяется после загрузки сцены
+        private static bool _monitoringPending;
+        
         /// <summary>
         /// Запускает профилирование в Unity Editor
         /// </summary>
@@ -32,6 +37,9 @@ namespace MudLike.Profiler
             // Настраиваем мониторинг производительности
             SetupPerformanceMonitoring();
             
+            // Сцена бенчмарка из Scripts/run_profiler.py --benchmark
+            LoadRequestedScene();
+            
             Debug.Log("✅ Профилирование запущено успешно");
         }
         
@@ -61,14 +69,15 @@ namespace MudLike.Profiler
         {
             // Включаем профилирование
             Profiler.enabled = true;
-            Profiler.logFile = Path.Combine(Application.dataPath, "..", "ProfilerData", "profiler_data.raw");
             
-            // Создаем папку для данных профилирования
-            var profilerDataPath = Path.Combine(Application.dataPath, "..", "ProfilerData");
+            // Создаем папку для данных профилирования (у параллельных сессий своя папка)
+            var profilerDataPath = ReadArgument("-mudlikeProfilerOutput")
+                ?? Path.Combine(Application.dataPath, "..", "ProfilerData");
             if (!Directory.Exists(profilerDataPath))
             {
                 Directory.CreateDirectory(profilerDataPath);
             }
+            Profiler.logFile = Path.Combine(profilerDataPath, "profiler_data.raw");
             
             // Настраиваем параметры профилирования
             Profiler.maxUsedMemory = 1024 * 1024 * 1024; // 1GB
@@ -113,18 +122,127 @@ namespace MudLike.Profiler
         private static void SetupPerformanceMonitoring()
         {
             // Создаем систему мониторинга производительности
-            var world = World.DefaultGameObjectInjectionWorld;
-            if (world != null)
+            _monitoringPending = !RegisterMonitoringSystems();
+            if (_monitoringPending)
             {
-                world.GetOrCreateSystem<PerformanceMonitoringSystem>();
+                Debug.Log("⏳ Мир ECS еще не создан, системы мониторинга будут добавлены после загрузки сцены");
             }
             
-            // Настраиваем мониторинг FPS
-            Application.targetFrameRate = 60;
-            QualitySettings.vSyncCount = 1;
+            // Настраиваем мониторинг FPS (бенчмарк меряет без ограничения частоты кадров)
+            bool uncapped = Array.IndexOf(Environment.GetCommandLineArgs(), "-mudlikeUncapped") >= 0;
+            Application.targetFrameRate = uncapped ? -1 : 60;
+            QualitySettings.vSyncCount = uncapped ? 0 : 1;
+            
+            // Настройки качества сессии из profiler_config.json (свип Scripts/run_profiler.py --sweep)
+            ApplyPerformanceSettings(ReadArgument("-mudlikeProfilerConfig"), uncapped);
             
             Debug.Log("📈 Мониторинг производительности настроен");
         }
+        
+        /// <summary>
+        /// Добавляет системы мониторинга и покадрового экспорта в мир по умолчанию; false, если мира еще нет
+        /// </summary>
+        private static bool RegisterMonitoringSystems()
+        {
+            var world = World.DefaultGameObjectInjectionWorld;
+            if (world == null)
+            {
+                return false;
+            }
+            
+            world.GetOrCreateSystem<PerformanceMonitoringSystem>();
+            
+            // Покадровый экспорт для отчета Scripts/run_profiler.py
+            var exportSystem = world.GetOrCreateSystemManaged<ProfilerFrameExportSystem>();
+            world.GetOrCreateSystemManaged<PresentationSystemGroup>().AddSystemToUpdateList(exportSystem);
+            return true;
+        }
+        
+        /// <summary>
+        /// Повторная регистрация систем, если при BeforeSceneLoad мир ECS еще не был создан
+        /// </summary>
+        [RuntimeInitializeOnLoadMethod(RuntimeInitializeLoadType.AfterSceneLoad)]
+        private static void RegisterPendingMonitoring()
+        {
+            if (!_monitoringPending)
+            {
+                return;
+            }
+            
+            _monitoringPending = !RegisterMonitoringSystems();
+            if (_monitoringPending)
+            {
+                Debug.LogWarning("⚠️ World.DefaultGameObjectInjectionWorld не создан: покадровый экспорт (frames.bin) не будет записан");
+            }
+            else
+            {
+                Debug.Log("📈 Системы мониторинга добавлены после загрузки сцены");
+            }
+        }
+        
+        /// <summary>
+        /// Применяет performance_settings из конфигурации профилирования; -1 оставляет значение проекта
+        /// </summary>
+        private static void ApplyPerformanceSettings(string configPath, bool uncapped)
+        {
+            if (string.IsNullOrEmpty(configPath) || !File.Exists(configPath))
+            {
+                return;
+            }
+            
+            var settings = JsonUtility.FromJson<ProfilerConfigFile>(File.ReadAllText(configPath))?.performance_settings;
+            if (settings == null)
+            {
+                return;
+            }
+            
+            // Уровень качества сбрасывает остальные параметры, поэтому применяется первым
+            if (settings.quality_level >= 0)
+            {
+                QualitySettings.SetQualityLevel(settings.quality_level, true);
+            }
+            if (settings.anti_aliasing >= 0)
+            {
+                QualitySettings.antiAliasing = settings.anti_aliasing;
+            }
+            if (settings.anisotropic_filtering >= 0)
+            {
+                QualitySettings.anisotropicFiltering = (AnisotropicFiltering)settings.anisotropic_filtering;
+            }
+            if (!uncapped)
+            {
+                QualitySettings.vSyncCount = settings.vsync_count;
+                Application.targetFrameRate = settings.target_fps;
+            }
+            
+            Debug.Log($"🎚️ Качество: level {QualitySettings.GetQualityLevel()}, AA {QualitySettings.antiAliasing}, " +
+                      $"aniso {QualitySettings.anisotropicFiltering}, vsync {QualitySettings.vSyncCount}, fps {Application.targetFrameRate}");
+        }
+        
+        /// <summary>
+        /// Загружает сцену из аргумента -mudlikeScene, если она отличается от стартовой
+        /// </summary>
+        private static void LoadRequestedScene()
+        {
+            string scene = ReadArgument("-mudlikeScene");
+            if (string.IsNullOrEmpty(scene) || SceneManager.GetActiveScene().name == scene)
+            {
+                return;
+            }
+            
+            Debug.Log($"🎮 Загрузка сцены: {scene}");
+            SceneManager.LoadScene(scene);
+        }
+        
+        /// <summary>
+        /// Значение аргумента командной строки после name или null
+        /// </summary>
+        internal static string ReadArgument(string name)
+        {
+            var args = Environment.GetCommandLineArgs();
+            int index = Array.IndexOf(args, name);
+            return index >= 0 && index + 1 < args.Length ? args[index + 1] : null;
+        }
     }
     
     /// <summary>
@@ -261,7 +379,9 @@ namespace MudLike.Profiler
         /// </summary>
         private void SaveProfilerData()
         {
-            var profilerDataPath = Path.Combine(Application.dataPath, "..", "ProfilerData", "performance_data.json");
+            var profilerDataPath = Path.Combine(
+                ProfilerStarter.ReadArgument("-mudlikeProfilerOutput") ?? Path.Combine(Application.dataPath, "..", "ProfilerData"),
+                "performance_data.json");
             
             var data = new
             {
@@ -278,4 +398,23 @@ namespace MudLike.Profiler
             Debug.Log($"📊 Данные производительности сохранены: {profilerDataPath}");
         }
     }
+    
+    /// <summary>
+    /// profiler_config.json, который пишет Scripts/run_profiler.py
+    /// </summary>
+    [Serializable]
+    public class ProfilerConfigFile
+    {
+        public PerformanceSettings performance_settings;
+    }
+    
+    [Serializable]
+    public class PerformanceSettings
+    {
+        public int target_fps = 60;
+        public int vsync_count = 1;
+        public int quality_level = -1;
+        public int anti_aliasing = -1;
+        public int anisotropic_filtering = -1;
+    }
 }
@@ -11,20 +11,2643 @@ import time
 import json
 import signal
 import threading
+import select
+import ctypes
+import ctypes.util
+import struct
+import sqlite3
+import hashlib
+import shutil
+import socket
+import uuid
+import re
+import heapq
+import asyncio
+import gzip
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from datetime import datetime
 from pathlib import Path
+from glob import escape as glob_escape
 import logging
+import logging.handlers
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class TaskFileReader:
+    """Инкрементальное чтение файла задач: разбираются только новые записи"""
+
+    WHITESPACE = re.compile(r'\s*')
+
+    def __init__(self, path, logger=None):
+        self.path = Path(path)
+        self.logger = logger or logging.getLogger(__name__)
+        self._signature = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b''
+        # JSON-массив: конец последнего элемента, sha1 байтов до него и уже отданные элементы
+        self._array_end = None
+        self._array_hash = None
+        self._seen = set()
+
+    def read_new(self):
+        """Возвращает задачи, добавленные с момента прошлого чтения"""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return []
+
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if signature == self._signature:
+            return []
+        self._signature = signature
+
+        with open(self.path, 'rb') as f:
+            first = f.read(64).lstrip()[:1]
+            if first == b'[':
+                try:
+                    return self._read_array(f, stat)
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    # Файл дописывается: перечитаем при следующем изменении
+                    self._signature = None
+                    self.logger.warning(f"Файл задач {self.path} не разобран: {e}")
+                    return []
+
+            # JSON Lines: читаем только дописанные байты
+            self._array_end = None
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._inode = stat.st_ino
+                self._offset = 0
+                self._partial = b''
+            f.seek(self._offset)
+            chunk = f.read()
+            self._offset += len(chunk)
+
+        data = self._partial + chunk
+        lines = data.split(b'\n')
+        self._partial = lines.pop()
+        tasks = []
+        for line in lines:
+            task = self._parse_line(line)
+            if task is not None:
+                tasks.append(task)
+
+        # Последняя строка без перевода строки: если это законченный JSON-объект, задача уже записана целиком
+        if self._partial.strip():
+            try:
+                tail = json.loads(self._partial)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                tail = None
+            if isinstance(tail, dict):
+                tasks.append(tail)
+                self._partial = b''
+        return tasks
+
+    def _read_array(self, f, stat):
+        """Классический JSON-массив
+
+        Если начало файла до конца последнего элемента не изменилось, разбираются только дописанные элементы.
+        Иначе массив разбирается целиком, а отдаются элементы, которых не было при прошлом чтении.
+        """
+        self._offset = 0
+        self._partial = b''
+        if stat.st_ino == self._inode and self._array_end is not None and stat.st_size > self._array_end:
+            f.seek(0)
+            prefix = hashlib.sha1(f.read(self._array_end))
+            if prefix.digest() == self._array_hash:
+                tail = f.read()
+                appended = self._parse_appended(tail.decode('utf-8'), empty=not self._seen)
+                if appended is not None:
+                    entries, end = appended
+                    if entries:
+                        prefix.update(tail[:end])
+                        self._array_end += end
+                        self._array_hash = prefix.digest()
+                        self._seen.update(self._entry_key(entry) for entry in entries)
+                    return entries
+
+        f.seek(0)
+        data = f.read()
+        entries = json.loads(data)
+        if not isinstance(entries, list):
+            raise json.JSONDecodeError("ожидался массив задач", data.decode('utf-8', 'replace'), 0)
+        body = data.rstrip()[:-1].rstrip()
+        self._inode = stat.st_ino
+        self._array_end = len(body)
+        self._array_hash = hashlib.sha1(body).digest()
+        seen = self._seen
+        self._seen = {self._entry_key(entry) for entry in entries}
+        return [entry for entry in entries if self._entry_key(entry) not in seen]
+
+    @staticmethod
+    def _parse_appended(text, empty):
+        """Элементы, дописанные после прежнего последнего: (элементы, конец последнего в байтах)
+
+        None - хвост не похож на дописывание в конец массива. Незаконченный хвост - JSONDecodeError.
+        """
+        decoder = json.JSONDecoder()
+        entries = []
+        pos = end = 0
+        while True:
+            pos = TaskFileReader.WHITESPACE.match(text, pos).end()
+            if pos >= len(text):
+                raise json.JSONDecodeError("массив не закрыт", text, pos)
+            if text[pos] == ']':
+                break
+            if entries or not empty:
+                if text[pos] != ',':
+                    return None
+                pos = TaskFileReader.WHITESPACE.match(text, pos + 1).end()
+            entry, pos = decoder.raw_decode(text, pos)
+            entries.append(entry)
+            end = pos
+        if text[pos + 1:].strip():
+            return None
+        return entries, len(text[:end].encode('utf-8'))
+
+    @staticmethod
+    def _entry_key(entry):
+        return json.dumps(entry, sort_keys=True)
+
+    def _parse_line(self, line):
+        """Одна строка JSON Lines; некорректная строка пропускается с предупреждением"""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.logger.warning(f"Пропущена некорректная строка в {self.path.name}: {e}: {line[:200]!r}")
+            return None
+
+
+class TaskSourceWatcher:
+    """Пробуждение агента при изменении файла задач или drop-каталога (inotify с fallback на опрос)"""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, tasks_file, drop_dir, wakeup, logger, poll_interval=1.0):
+        self.tasks_file = Path(tasks_file)
+        self.drop_dir = Path(drop_dir)
+        self.wakeup = wakeup
+        self.logger = logger
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+        self._watches = {}
+
+    def start(self):
+        """Запуск потока наблюдения"""
+        self._fd = self._init_inotify()
+        target = self._inotify_loop if self._fd is not None else self._poll_loop
+        mode = 'inotify' if self._fd is not None else f'опрос каждые {self.poll_interval}с'
+        self.logger.info(f"Наблюдение за задачами: {mode}")
+        self._thread = threading.Thread(target=target, name='task-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка потока наблюдения"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _init_inotify(self):
+        """Инициализация inotify через libc, None если недоступно"""
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK)
+            if fd < 0:
+                return None
+            mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            for directory in (self.tasks_file.parent, self.drop_dir):
+                wd = libc.inotify_add_watch(fd, str(directory).encode(), mask)
+                if wd < 0:
+                    os.close(fd)
+                    return None
+                self._watches[wd] = directory
+            return fd
+        except (OSError, AttributeError) as e:
+            self.logger.warning(f"inotify недоступен: {e}")
+            return None
+
+    def _inotify_loop(self):
+        """Ожидание событий inotify"""
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], 1.0)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            if self._is_relevant(data):
+                self.wakeup.set()
+
+    def _is_relevant(self, data):
+        """Проверяет, относятся ли события к файлу задач или drop-каталогу"""
+        offset = 0
+        while offset < len(data):
+            wd, _mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            directory = self._watches.get(wd)
+            if directory == self.drop_dir or name == self.tasks_file.name:
+                return True
+        return False
+
+    def _poll_loop(self):
+        """Fallback: сравнение mtime/size с коротким интервалом"""
+        last = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            if current != last:
+                last = current
+                self.wakeup.set()
+
+    def _snapshot(self):
+        """Сигнатура файла задач и drop-каталога"""
+        result = []
+        for path in (self.tasks_file, self.drop_dir):
+            try:
+                stat = path.stat()
+                result.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                result.append(None)
+        return tuple(result)
+
+
+class TaskQueue:
+    """Персистентная очередь задач на SQLite: ID, приоритеты, статусы, зависимости между задачами"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    SKIPPED = 'skipped'
+    # Статусы, при которых зависимые задачи уже не будут выполнены
+    BROKEN = (FAILED, CANCELLED, SKIPPED)
+
+    class Full(Exception):
+        """Ожидающих задач уже max_pending: задача не принята"""
+
+        def __init__(self, pending, max_pending):
+            super().__init__(f"очередь заполнена: ожидающих задач {pending}, лимит {max_pending}")
+            self.pending = pending
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            type TEXT NOT NULL,
+            params TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            error TEXT,
+            depends_on TEXT NOT NULL DEFAULT '[]',
+            pipeline TEXT,
+            workspace TEXT
+        );
+        CREATE INDEX IF NOT EXISTS tasks_pending
+            ON tasks (status, priority DESC, seq);
+        CREATE TABLE IF NOT EXISTS dependencies (
+            task TEXT NOT NULL,
+            dependency TEXT NOT NULL,
+            PRIMARY KEY (task, dependency)
+        );
+        CREATE INDEX IF NOT EXISTS dependencies_dependency
+            ON dependencies (dependency);
+    """
+    # Ожидающие задачи, все зависимости которых выполнены (неизвестная зависимость ждет появления задачи)
+    READY = """
+        SELECT * FROM tasks AS t
+        WHERE t.status = :pending AND NOT EXISTS (
+            SELECT 1 FROM dependencies AS d LEFT JOIN tasks AS dep ON dep.id = d.dependency
+            WHERE d.task = t.id AND (dep.status IS NULL OR dep.status != :done))
+        ORDER BY t.priority DESC, t.seq
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        tables = {row['name'] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self._conn.executescript(self.SCHEMA)
+        self._migrate(tables)
+
+    def _migrate(self, tables):
+        """Добавление колонок и таблицы зависимостей в базу, созданную старой версией агента"""
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+        for name, ddl in (('depends_on', "TEXT NOT NULL DEFAULT '[]'"), ('pipeline', 'TEXT'), ('workspace', 'TEXT')):
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE tasks ADD COLUMN {name} {ddl}")
+        if 'tasks' in tables and 'dependencies' not in tables:
+            rows = self._conn.execute("SELECT id, depends_on FROM tasks WHERE depends_on != '[]'").fetchall()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO dependencies (task, dependency) VALUES (?, ?)",
+                [(row['id'], dep) for row in rows for dep in json.loads(row['depends_on'])])
+            broken = self._conn.execute(
+                f"SELECT DISTINCT d.dependency FROM dependencies AS d JOIN tasks AS dep ON dep.id = d.dependency "
+                f"WHERE dep.status IN ({','.join('?' * len(self.BROKEN))})", self.BROKEN).fetchall()
+            self._skip_dependents([row['dependency'] for row in broken])
+
+    @staticmethod
+    def task_id(task):
+        """ID задачи: явный 'id' или хэш содержимого ('nonce' позволяет повторить ту же задачу)"""
+        if task.get('id'):
+            return str(task['id'])
+        payload = json.dumps({
+            'type': task.get('type'),
+            'params': task.get('params', {}),
+            'timestamp': task.get('timestamp'),
+            'nonce': task.get('nonce'),
+        }, sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def validate(task):
+        """Проверка полей задачи до записи в очередь"""
+        priority = task.get('priority', 0)
+        if isinstance(priority, bool) or not isinstance(priority, (int, float, str)):
+            raise ValueError(f"priority должен быть целым числом: {priority!r}")
+        try:
+            int(priority)
+        except ValueError:
+            raise ValueError(f"priority должен быть целым числом: {priority!r}") from None
+        if not isinstance(task.get('params', {}), dict):
+            raise ValueError("params должен быть объектом")
+
+    def recover(self):
+        """Возврат прерванных задач в очередь после перезапуска"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = ?, started_at = NULL WHERE status = ?",
+                (self.PENDING, self.RUNNING))
+            return cursor.rowcount
+
+    def add(self, task, max_pending=None):
+        """Добавление задачи; возвращает (id, добавлена ли), некорректная задача - ValueError
+
+        max_pending - лимит ожидающих задач: проверка и запись идут под одной блокировкой, сверх лимита - Full.
+        """
+        self.validate(task)
+        task_id = self.task_id(task)
+        with self._lock:
+            self._check_depth(1, max_pending)
+            return task_id, self._insert(task_id, task)
+
+    def add_pipeline(self, pipeline, max_pending=None):
+        """Добавление графа задач {"nodes": {имя: {"type", "params", "after": [имена]}}}
+
+        Узлы получают ID <pipeline>.<имя> и зависимости по "after".
+        Возвращает (ID пайплайна, [(ID узла, добавлен ли)]). max_pending - как в add, считаются все узлы.
+        """
+        nodes = pipeline.get('nodes') or {}
+        if isinstance(nodes, list):
+            nodes = {node.get('name') or node.get('type'): node for node in nodes}
+        if not nodes:
+            raise ValueError("пайплайн без узлов")
+        for name, node in nodes.items():
+            missing = [dep for dep in node.get('after', []) if dep not in nodes]
+            if missing:
+                raise ValueError(f"узел {name}: неизвестные зависимости {missing}")
+        order = self._topological_order({name: node.get('after', []) for name, node in nodes.items()})
+
+        pipeline_id = self.task_id({'id': pipeline.get('id'), 'type': 'pipeline',
+                                    'params': nodes, 'timestamp': pipeline.get('timestamp')})
+        timestamp = pipeline.get('timestamp') or datetime.now().isoformat()
+        added = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._check_depth(len(order), max_pending)
+                for name in order:
+                    node = nodes[name]
+                    task_id = f"{pipeline_id}.{name}"
+                    task = {
+                        'type': node.get('type', name),
+                        'params': node.get('params', {}),
+                        'priority': node.get('priority', pipeline.get('priority', 0)),
+                        'timestamp': timestamp,
+                        'depends_on': [f"{pipeline_id}.{dep}" for dep in node.get('after', [])],
+                        'pipeline': pipeline_id,
+                    }
+                    self.validate(task)
+                    added.append((task_id, self._insert(task_id, task)))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return pipeline_id, added
+
+    def _check_depth(self, size, max_pending):
+        if max_pending is None:
+            return
+        pending = self._conn.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (self.PENDING,)).fetchone()[0]
+        if pending + size > max_pending:
+            raise self.Full(pending, max_pending)
+
+    @staticmethod
+    def _topological_order(graph):
+        """Порядок узлов от корней к листьям; цикл - ValueError"""
+        indegree = {name: len(deps) for name, deps in graph.items()}
+        ready = [name for name, degree in indegree.items() if degree == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for other, deps in graph.items():
+                if name in deps:
+                    indegree[other] -= 1
+                    if indegree[other] == 0:
+                        ready.append(other)
+        if len(order) != len(graph):
+            raise ValueError(f"цикл в пайплайне: {sorted(set(graph) - set(order))}")
+        return order
+
+    def _insert(self, task_id, task):
+        deps = [str(dep) for dep in task.get('depends_on', [])]
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO tasks (id, type, params, priority, status, created_at, depends_on, pipeline) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (task_id, task.get('type') or '', json.dumps(task.get('params', {})),
+             int(task.get('priority', 0)), self.PENDING,
+             task.get('timestamp') or datetime.now().isoformat(),
+             json.dumps(deps), task.get('pipeline')))
+        if cursor.rowcount != 1:
+            return False
+        if deps:
+            self._conn.executemany("INSERT OR IGNORE INTO dependencies (task, dependency) VALUES (?, ?)",
+                                   [(task_id, dep) for dep in deps])
+            broken = self._conn.execute(
+                f"SELECT id FROM tasks WHERE id IN ({','.join('?' * len(deps))}) "
+                f"AND status IN ({','.join('?' * len(self.BROKEN))})", (*deps, *self.BROKEN)).fetchone()
+            if broken:
+                self._skip(task_id, broken['id'])
+                self._skip_dependents([task_id])
+        return True
+
+    def claim_next(self, admit=None):
+        """Атомарно забирает готовую задачу с наивысшим приоритетом, если admit(задача) ее допускает
+
+        Готова задача, все зависимости которой выполнены. Если admit отклоняет задачу
+        (например, ей не хватает памяти), пробуется следующая по приоритету.
+        """
+        with self._lock:
+            row = None
+            cursor = self._conn.execute(self.READY, {'pending': self.PENDING, 'done': self.DONE})
+            for candidate in cursor:
+                if admit is None or admit(self._to_task(candidate)):
+                    row = candidate
+                    break
+            cursor.close()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, started_at = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (self.RUNNING, datetime.now().isoformat(), row['id']))
+            return self._to_task(row)
+
+    def finish(self, task_id, ok, error=None, status=None):
+        """Фиксация результата выполнения задачи"""
+        status = status or (self.DONE if ok else self.FAILED)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                (status, datetime.now().isoformat(), error, task_id))
+            return self._skip_dependents([task_id]) if status in self.BROKEN else []
+
+    def cancel_pending(self, task_id):
+        """Отмена задачи, еще не взятой в работу"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (self.CANCELLED, datetime.now().isoformat(), task_id, self.PENDING))
+            if cursor.rowcount != 1:
+                return False
+            self._skip_dependents([task_id])
+            return True
+
+    def set_workspace(self, task_id, workspace):
+        """Копия проекта, в которой выполнялась задача (для повторного использования зависимыми)"""
+        with self._lock:
+            self._conn.execute("UPDATE tasks SET workspace = ? WHERE id = ?", (str(workspace), task_id))
+
+    def pipeline(self, pipeline_id):
+        """Узлы пайплайна в порядке добавления"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM tasks WHERE pipeline = ? ORDER BY seq", (pipeline_id,)).fetchall()
+        return [self._to_task(row) for row in rows]
+
+    def _skip(self, task_id, dependency):
+        self._conn.execute(
+            "UPDATE tasks SET status = ?, finished_at = ?, error = ? WHERE id = ? AND status = ?",
+            (self.SKIPPED, datetime.now().isoformat(), f"dependency {dependency} not done", task_id, self.PENDING))
+
+    def _skip_dependents(self, task_ids):
+        """Пропуск ожидающих задач, зависящих от task_ids (транзитивно, по индексу зависимостей); возвращает их ID"""
+        skipped = []
+        queue = deque(task_ids)
+        while queue:
+            task_id = queue.popleft()
+            for row in self._conn.execute(
+                    "SELECT d.task FROM dependencies AS d CROSS JOIN tasks AS t ON t.id = d.task "
+                    "WHERE d.dependency = ? AND t.status = ?", (task_id, self.PENDING)).fetchall():
+                self._skip(row['task'], task_id)
+                skipped.append(row['task'])
+                queue.append(row['task'])
+        return skipped
+
+    def get(self, task_id):
+        """Получение задачи по ID"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._to_task(row) if row else None
+
+    def counts(self):
+        """Количество задач по статусам"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        """Закрытие базы"""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_task(row):
+        task = dict(row)
+        task.pop('seq', None)
+        task['params'] = json.loads(task['params'])
+        task['depends_on'] = json.loads(task.get('depends_on') or '[]')
+        return task
+
+
+class WorkspaceManager:
+    """Пул изолированных копий проекта: Unity блокирует папку проекта, поэтому у каждого воркера своя"""
+
+    SOURCE_DIRS = ('Assets', 'Packages', 'ProjectSettings')
+
+    def __init__(self, project_path, root, size, logger, prefix='worker', prefer_timeout=600):
+        self.project_path = Path(project_path)
+        self.root = Path(root)
+        self.size = size
+        self.logger = logger
+        self.prefer_timeout = prefer_timeout
+        self._free = [self.root / f"{prefix}-{i}" for i in range(size)]
+        self._cond = threading.Condition()
+        self._rsync = shutil.which('rsync')
+
+    def acquire(self, prefer=None):
+        """Захват свободной копии проекта (с синхронизацией исходников); prefer - желаемые копии по порядку
+
+        Занятую желаемую копию ждем до prefer_timeout секунд: в ней Library и результаты зависимостей.
+        """
+        preferred = [Path(p) for p in prefer or ()]
+        deadline = time.monotonic() + self.prefer_timeout
+        waited = False
+        with self._cond:
+            while True:
+                workspace = next((w for w in preferred if w in self._free), None)
+                remaining = deadline - time.monotonic()
+                if workspace is None and self._free and (not preferred or remaining <= 0):
+                    workspace = self._free[0]
+                if workspace is not None:
+                    break
+                if preferred and not waited:
+                    waited = True
+                    self.logger.info(f"Ожидание копии проекта {preferred[0].name} (занята)")
+                self._cond.wait(remaining if preferred and remaining > 0 else None)
+            self._free.remove(workspace)
+        if preferred and workspace not in preferred:
+            self.logger.warning(f"Копия {preferred[0].name} занята дольше {self.prefer_timeout} с: задача выполняется "
+                                f"в {workspace.name} без Library и результатов зависимостей")
+        try:
+            self.sync(workspace)
+        except Exception:
+            self.release(workspace)
+            raise
+        return workspace
+
+    def release(self, workspace):
+        """Возврат копии проекта в пул"""
+        with self._cond:
+            self._free.append(workspace)
+            # Ожидающие могут ждать разные копии
+            self._cond.notify_all()
+
+    def sync(self, workspace):
+        """Синхронизация Assets/Packages/ProjectSettings; Library копии сохраняется между задачами"""
+        workspace.mkdir(parents=True, exist_ok=True)
+        for name in self.SOURCE_DIRS:
+            source = self.project_path / name
+            if not source.exists():
+                if (workspace / name).exists():
+                    shutil.rmtree(workspace / name)
+                continue
+            if self._rsync:
+                subprocess.run([self._rsync, '-a', '--delete', f"{source}/", f"{workspace / name}/"],
+                               check=True, capture_output=True)
+            else:
+                self._mirror(source, workspace / name)
+
+    @classmethod
+    def _mirror(cls, source, destination):
+        """Замена rsync -a --delete: удаляет то, чего нет в источнике, копирует новые и измененные (размер, mtime) файлы"""
+        destination.mkdir(parents=True, exist_ok=True)
+        with os.scandir(source) as it:
+            entries = {entry.name: entry for entry in it}
+        with os.scandir(destination) as it:
+            for entry in it:
+                origin = entries.get(entry.name)
+                if origin is not None and cls._kind(origin) == cls._kind(entry):
+                    continue
+                if cls._kind(entry) == 'dir':
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+
+        for name, entry in entries.items():
+            target = destination / name
+            kind = cls._kind(entry)
+            if kind == 'dir':
+                cls._mirror(Path(entry.path), target)
+            elif kind == 'link':
+                link = os.readlink(entry.path)
+                if target.is_symlink() and os.readlink(target) == link:
+                    continue
+                if target.is_symlink():
+                    target.unlink()
+                os.symlink(link, target)
+            else:
+                stat = entry.stat(follow_symlinks=False)
+                try:
+                    current = target.stat()
+                except FileNotFoundError:
+                    current = None
+                if current is None or (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                    shutil.copy2(entry.path, target)
+
+    @staticmethod
+    def _kind(entry):
+        if entry.is_symlink():
+            return 'link'
+        return 'dir' if entry.is_dir(follow_symlinks=False) else 'file'
+
+
+class DisplayPool:
+    """Пул виртуальных дисплеев Xvfb: по дисплею на каждый одновременно работающий процесс Unity
+
+    Готовность проверяется подключением к сокету /tmp/.X11-unix/X<N> вместо фиксированной паузы,
+    дисплеи переиспользуются между задачами и останавливаются вместе с агентом.
+    """
+
+    SOCKET_DIR = Path('/tmp/.X11-unix')
+
+    def __init__(self, logger, base=99, screen='1024x768x24', ready_timeout=10):
+        self.logger = logger
+        self.base = base
+        self.screen = screen
+        self.ready_timeout = ready_timeout
+        self._xvfb = shutil.which('Xvfb')
+        self._free = []
+        self._servers = {}
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def acquire(self):
+        """Свободный дисплей ':N' (запускается при необходимости) или None, если Xvfb недоступен"""
+        if not self._xvfb:
+            self._warn("Xvfb не найден, Unity запускается без виртуального дисплея")
+            return None
+        with self._lock:
+            while self._free:
+                number = self._free.pop(0)
+                if self._alive(number):
+                    return f":{number}"
+                self.logger.warning(f"Виртуальный дисплей :{number} не отвечает, будет запущен новый")
+                self._terminate(self._servers.pop(number))
+
+        for _attempt in range(3):
+            with self._lock:
+                number = self._next_number()
+                self._servers[number] = None
+            try:
+                process = self._start(number)
+            except (OSError, RuntimeError, TimeoutError) as e:
+                self.logger.warning(f"Не удалось запустить виртуальный дисплей :{number}: {e}")
+                with self._lock:
+                    self._servers.pop(number, None)
+                continue
+            with self._lock:
+                self._servers[number] = process
+            return f":{number}"
+        self._warn("Виртуальный дисплей недоступен, Unity запускается без него")
+        return None
+
+    def release(self, display):
+        """Возврат дисплея в пул"""
+        if display is None:
+            return
+        with self._lock:
+            self._free.append(int(display[1:]))
+
+    @staticmethod
+    def env(display):
+        """Окружение процесса с DISPLAY (None - наследовать окружение агента)"""
+        return dict(os.environ, DISPLAY=display) if display else None
+
+    def shutdown(self):
+        """Остановка всех запущенных агентом Xvfb"""
+        with self._lock:
+            servers = list(self._servers.values())
+            self._servers.clear()
+            self._free.clear()
+        for process in servers:
+            self._terminate(process)
+
+    def _next_number(self):
+        """Первый номер дисплея, не занятый ни пулом, ни другими X-серверами"""
+        number = self.base
+        while (number in self._servers or (self.SOCKET_DIR / f"X{number}").exists()
+               or Path(f"/tmp/.X{number}-lock").exists()):
+            number += 1
+        return number
+
+    def _start(self, number):
+        """Запуск Xvfb и ожидание, пока он начнет принимать подключения"""
+        started = time.time()
+        process = subprocess.Popen([self._xvfb, f":{number}", '-screen', '0', self.screen, '-ac', '-nolisten', 'tcp'],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        while time.time() - started < self.ready_timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Xvfb завершился (код: {process.returncode})")
+            if self._probe(number):
+                self.logger.info(f"Виртуальный дисплей :{number} готов за {time.time() - started:.2f} с")
+                return process
+            time.sleep(0.05)
+        self._terminate(process)
+        raise TimeoutError(f"Xvfb не принял подключение за {self.ready_timeout} с")
+
+    def _alive(self, number):
+        process = self._servers.get(number)
+        return process is not None and process.poll() is None and self._probe(number)
+
+    def _probe(self, number):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.settimeout(1)
+                probe.connect(str(self.SOCKET_DIR / f"X{number}"))
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _terminate(process):
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def _warn(self, message):
+        if not self._warned:
+            self._warned = True
+            self.logger.warning(message)
+
+
+class ResidentEditor:
+    """Резидентный Unity Editor: задачи передаются в AgentEditorListener через локальный сокет"""
+
+    LISTENER_METHOD = 'MudLike.Agent.AgentEditorListener.Run'
+    TASK_TYPES = ('build', 'test', 'compile')
+    # Имена -buildTarget командной строки -> значения enum BuildTarget
+    BUILD_TARGETS = {
+        'Linux64': 'StandaloneLinux64',
+        'Win64': 'StandaloneWindows64',
+        'Win': 'StandaloneWindows',
+        'OSXUniversal': 'StandaloneOSX',
+    }
+
+    def __init__(self, unity_path, workspace, logger, ready_timeout=900, reload_grace=300, displays=None):
+        self.unity_path = unity_path
+        self.workspace = Path(workspace)
+        self.logger = logger
+        self.ready_timeout = ready_timeout
+        self.reload_grace = reload_grace
+        self.displays = displays
+        self.display = None
+        self.port = None
+        self.process = None
+        self.tasks_done = 0
+
+    def start(self):
+        """Запуск редактора и ожидание готовности слушателя"""
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+
+        log_dir = self.workspace / "Logs"
+        log_dir.mkdir(parents=True, exist_ok=True)
+        cmd = [
+            self.unity_path,
+            '-batchmode',
+            '-projectPath', str(self.workspace),
+            '-executeMethod', self.LISTENER_METHOD,
+            '-agentPort', str(self.port),
+            '-logFile', str(log_dir / "resident-editor.log")
+        ]
+        self.logger.info(f"Запуск резидентного редактора: {' '.join(cmd)}")
+        # Дисплей закреплен за редактором на все время его работы
+        if self.displays and self.display is None:
+            self.display = self.displays.acquire()
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                        env=DisplayPool.env(self.display))
+        self.tasks_done = 0
+
+        deadline = time.time() + self.ready_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Редактор завершился при запуске (код: {self.process.returncode})")
+            if self.ping():
+                self.logger.info(f"Резидентный редактор готов: pid {self.process.pid}, порт {self.port}")
+                return
+            time.sleep(1)
+        self.stop()
+        raise TimeoutError("Резидентный редактор не ответил за отведенное время")
+
+    def request(self, payload, timeout=10):
+        """Один запрос-ответ к слушателю"""
+        with socket.create_connection(('127.0.0.1', self.port), timeout=timeout) as conn:
+            conn.sendall((json.dumps(payload) + '\n').encode())
+            with conn.makefile('r', encoding='utf-8') as reader:
+                line = reader.readline()
+        if not line:
+            raise ConnectionError("Пустой ответ редактора")
+        return json.loads(line)
+
+    def ping(self):
+        """Проверка доступности слушателя"""
+        try:
+            return bool(self.request({'op': 'ping'}, timeout=2).get('ok'))
+        except (OSError, ValueError):
+            return False
+
+    def alive(self):
+        """Процесс редактора жив"""
+        return self.process is not None and self.process.poll() is None
+
+    def healthy(self):
+        """Процесс жив и слушатель отвечает"""
+        return self.alive() and self.ping()
+
+    def rss_mb(self):
+        """Резидентная память процесса редактора (МБ)"""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except (OSError, AttributeError):
+            pass
+        return 0
+
+    def run(self, command, timeout=None, poll_interval=0.5):
+        """Выполнение задачи; возвращает (успех, ошибка)"""
+        command_id = uuid.uuid4().hex
+        deadline = time.time() + timeout if timeout else None
+        response = self.request({'op': 'run', 'id': command_id, **command})
+        if not response.get('ok'):
+            raise RuntimeError(f"Редактор отклонил задачу: {response.get('error')}")
+
+        unreachable_since = None
+        while True:
+            if deadline and time.time() > deadline:
+                raise TimeoutError(f"Задача не завершилась за {timeout} с")
+            if not self.alive():
+                raise RuntimeError(f"Редактор завершился во время задачи (код: {self.process.returncode})")
+            try:
+                response = self.request({'op': 'result', 'id': command_id})
+                unreachable_since = None
+            except (OSError, ValueError):
+                # Слушатель недоступен во время domain reload после компиляции
+                unreachable_since = unreachable_since or time.time()
+                if time.time() - unreachable_since > self.reload_grace:
+                    raise
+                time.sleep(poll_interval)
+                continue
+
+            state = response.get('state')
+            if state == 'done':
+                self.tasks_done += 1
+                return bool(response.get('ok')), response.get('error')
+            if state != 'running':
+                raise RuntimeError(f"Редактор потерял задачу {command_id}: {state}")
+            time.sleep(poll_interval)
+
+    def stop(self, grace=30):
+        """Штатное завершение редактора с принудительным kill по таймауту"""
+        if self.alive():
+            try:
+                self.request({'op': 'quit', 'id': 'quit'}, timeout=2)
+                self.process.wait(timeout=grace)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                    self.process.wait()
+        if self.displays:
+            self.displays.release(self.display)
+            self.display = None
+
+
+class EditorPool:
+    """Резидентные редакторы по копиям проекта с проверкой здоровья и перезапуском"""
+
+    def __init__(self, unity_path, logger, max_tasks=20, max_memory_mb=8192, displays=None):
+        self.unity_path = unity_path
+        self.logger = logger
+        self.displays = displays
+        self.max_tasks = max_tasks
+        self.max_memory_mb = max_memory_mb
+        self._editors = {}
+        self._lock = threading.Lock()
+
+    def get(self, workspace):
+        """Рабочий редактор для копии проекта (запускается при необходимости)"""
+        with self._lock:
+            editor = self._editors.pop(workspace, None)
+        if editor is not None and not editor.healthy():
+            self.logger.warning(f"Резидентный редактор {workspace} не отвечает, перезапуск")
+            editor.stop(grace=5)
+            editor = None
+        if editor is None:
+            editor = ResidentEditor(self.unity_path, workspace, self.logger, displays=self.displays)
+            editor.start()
+        with self._lock:
+            self._editors[workspace] = editor
+        return editor
+
+    def close(self, workspace):
+        """Остановка редактора копии проекта, если он запущен (например, перед подменой Library)"""
+        with self._lock:
+            editor = self._editors.pop(workspace, None)
+        if editor is not None:
+            editor.stop()
+
+    def discard(self, editor):
+        """Принудительная остановка зависшего или отмененного редактора"""
+        with self._lock:
+            self._editors.pop(editor.workspace, None)
+        editor.stop(grace=5)
+
+    def release(self, editor):
+        """Перезапуск редактора после N задач или превышения памяти"""
+        if not editor.alive():
+            return
+        rss = editor.rss_mb()
+        if editor.tasks_done < self.max_tasks and rss < self.max_memory_mb:
+            return
+        self.logger.info(f"Перезапуск резидентного редактора {editor.workspace}: "
+                         f"задач {editor.tasks_done}, память {rss:.0f} МБ")
+        with self._lock:
+            self._editors.pop(editor.workspace, None)
+        editor.stop()
+
+    def shutdown(self):
+        """Остановка всех редакторов"""
+        with self._lock:
+            editors = list(self._editors.values())
+            self._editors.clear()
+        for editor in editors:
+            editor.stop()
+
+
+class LibrarySnapshots:
+    """Снимки Library/ по целевым платформам: смена -buildTarget без полного реимпорта ассетов
+
+    Неактивные снимки лежат в <project>/Library-targets/<платформа> и меняются местами с Library/
+    переименованием каталога. Если снимка нужной платформы еще нет, текущая Library сохраняется
+    копией (reflink, где ФС это умеет), а Unity переключает живую Library сама.
+    """
+
+    STORE_DIR = 'Library-targets'
+    MARKER = '.agent-build-target'
+    UNMARKED = '_unmarked'
+
+    def __init__(self, logger, max_snapshots=3):
+        self.logger = logger
+        self.max_snapshots = max_snapshots
+        self._cp = shutil.which('cp')
+        self._lock = threading.Lock()
+
+    def active_target(self, project_path):
+        """Платформа, под которую сейчас импортирована Library/ (None - неизвестно)"""
+        try:
+            return (Path(project_path) / 'Library' / self.MARKER).read_text().strip() or None
+        except OSError:
+            return None
+
+    def activate(self, project_path, target):
+        """Подготовка Library/ проекта под платформу перед сборкой"""
+        project_path = Path(project_path)
+        library = project_path / 'Library'
+        store = project_path / self.STORE_DIR
+        current = self.active_target(project_path)
+        if current == target:
+            return
+
+        with self._lock:
+            snapshot = store / target
+            started = time.time()
+            if library.exists() and (current or snapshot.exists()):
+                store.mkdir(parents=True, exist_ok=True)
+                stash = store / (current or self.UNMARKED)
+                self._remove(stash)
+                if snapshot.exists():
+                    self._move(library, stash)
+                else:
+                    self._copy(library, stash)
+                os.utime(stash)
+            if snapshot.exists():
+                self._move(snapshot, library)
+                action = f"восстановлен снимок {target}"
+            else:
+                action = f"снимка {target} нет, Unity переключит Library"
+            library.mkdir(exist_ok=True)
+            (library / self.MARKER).write_text(target)
+            self.logger.info(f"Library {project_path}: {current or 'неизвестно'} -> {target}, "
+                             f"{action} ({time.time() - started:.1f} с)")
+            self._prune(store)
+
+    def _prune(self, store):
+        """Удаление самых давних снимков сверх лимита"""
+        if not store.exists():
+            return
+        snapshots = sorted((p for p in store.iterdir() if p.is_dir()),
+                           key=lambda p: p.stat().st_mtime, reverse=True)
+        for stale in snapshots[self.max_snapshots:]:
+            self.logger.info(f"Удаление снимка Library {stale.name}")
+            self._remove(stale)
+
+    def _move(self, source, destination):
+        try:
+            os.rename(source, destination)
+        except OSError:
+            # Другая файловая система: копия и удаление исходника
+            self._copy(source, destination)
+            self._remove(source)
+
+    def _copy(self, source, destination):
+        # Жесткие ссылки не подходят: Unity переписывает файлы Library на месте
+        if self._cp:
+            result = subprocess.run([self._cp, '-a', '--reflink=auto', str(source), str(destination)],
+                                    capture_output=True)
+            if result.returncode == 0:
+                return
+            self._remove(destination)
+        shutil.copytree(source, destination, symlinks=True)
+
+    @staticmethod
+    def _remove(path):
+        if path.exists():
+            shutil.rmtree(path)
+
+
+class InputManifest:
+    """Хэши входных файлов проекта: быстрый путь по mtime+size, sha1 только для измененных"""
+
+    SOURCE_DIRS = ('Assets', 'Packages', 'ProjectSettings')
+
+    def __init__(self, project_path, cache_path):
+        self.project_path = Path(project_path)
+        self.cache_path = Path(cache_path)
+        self._lock = threading.Lock()
+        self._entries = {}
+        if self.cache_path.exists():
+            try:
+                with open(self.cache_path, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def digest(self):
+        """Общий хэш всех входных файлов проекта"""
+        with self._lock:
+            entries = {}
+            changed = False
+            for rel_path, stat in self._walk():
+                cached = self._entries.get(rel_path)
+                if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                    entries[rel_path] = cached
+                    continue
+                entries[rel_path] = [stat.st_mtime_ns, stat.st_size, self._hash_file(rel_path)]
+                changed = True
+            changed = changed or len(entries) != len(self._entries)
+            self._entries = entries
+            if changed:
+                self._save()
+
+            total = hashlib.sha1()
+            for rel_path in sorted(entries):
+                total.update(f"{rel_path}\0{entries[rel_path][2]}\n".encode())
+            return total.hexdigest()
+
+    def _walk(self):
+        """Обход файлов входных каталогов"""
+        stack = [self.project_path / name for name in self.SOURCE_DIRS]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            rel_path = os.path.relpath(entry.path, self.project_path)
+                            yield rel_path, entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+
+    def _hash_file(self, rel_path):
+        digest = hashlib.sha1()
+        with open(self.project_path / rel_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _save(self):
+        tmp_path = self.cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.cache_path)
+
+
+class IncrementalCache:
+    """Результаты успешных compile/build по ключу (входы проекта + параметры задачи)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._records = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    self._records = json.load(f)
+            except (OSError, ValueError):
+                self._records = {}
+
+    @staticmethod
+    def key(task_type, params, inputs_digest, unity_path):
+        """Ключ результата: тип задачи, параметры без 'force', входы и версия редактора"""
+        payload = json.dumps({
+            'type': task_type,
+            'params': {k: v for k, v in params.items() if k != 'force'},
+            'inputs': inputs_digest,
+            'unity': unity_path,
+        }, sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def lookup(self, key):
+        """Сохраненный результат, если его артефакт не изменился с момента записи"""
+        with self._lock:
+            record = self._records.get(key)
+        if record is None:
+            return None
+        artifact = record.get('artifact')
+        if artifact and self.tree_signature(artifact) != record.get('artifact_signature'):
+            return None
+        return record
+
+    def store(self, key, task_type, artifact=None):
+        """Запись успешного результата"""
+        record = {
+            'type': task_type,
+            'finished_at': datetime.now().isoformat(),
+            'artifact': str(artifact) if artifact else None,
+            'artifact_signature': self.tree_signature(artifact) if artifact else None,
+        }
+        with self._lock:
+            self._records[key] = record
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self._records, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def tree_signature(path):
+        """Дешевая сигнатура артефакта: число файлов, суммарный размер, последний mtime"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        if path.is_file():
+            stat = path.stat()
+            return [1, stat.st_size, stat.st_mtime_ns]
+        count = size = latest = 0
+        for root, _dirs, files in os.walk(path):
+            for name in files:
+                stat = os.stat(os.path.join(root, name))
+                count += 1
+                size += stat.st_size
+                latest = max(latest, stat.st_mtime_ns)
+        return [count, size, latest]
+
+
+class ArtifactStore:
+    """Контентно-адресуемое хранилище сборок: ключ - входы проекта и параметры сборки
+
+    objects/ - файлы по sha256 (извлекаются жесткими ссылками), chunks/ - блоки больших файлов,
+    которые дедуплицируются между сборками, manifests/ - состав сборок. Вытеснение по LRU
+    при превышении числа сборок или размера хранилища.
+    """
+
+    CHUNK_SIZE = 4 * 1024 * 1024
+    CHUNK_THRESHOLD = 64 * 1024 * 1024
+    MARKER = '.agent-artifact.json'
+
+    def __init__(self, root, logger, max_bytes=50 * 1024 ** 3, max_builds=20):
+        self.root = Path(root)
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.max_builds = max_builds
+        self._lock = threading.RLock()
+        for name in ('objects', 'chunks', 'manifests', 'tmp'):
+            (self.root / name).mkdir(parents=True, exist_ok=True)
+
+    def has(self, key):
+        return self._manifest_path(key).exists()
+
+    def builds(self):
+        """Сохраненные сборки, свежие первыми"""
+        manifests = []
+        for path in (self.root / 'manifests').glob('*.json'):
+            try:
+                with open(path, 'r') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            manifest.pop('files', None)
+            manifests.append(manifest)
+        return sorted(manifests, key=lambda m: m.get('last_used', ''), reverse=True)
+
+    def put(self, key, source, meta=None):
+        """Сохранение каталога (или файла) сборки; возвращает число новых байт в хранилище"""
+        source = Path(source)
+        files = {}
+        added = 0
+        with self._lock:
+            paths = [source] if source.is_file() else sorted(p for p in source.rglob('*') if p.is_symlink() or not p.is_dir())
+            for path in paths:
+                rel = '' if path == source else path.relative_to(source).as_posix()
+                if rel == self.MARKER:
+                    continue
+                if path.is_symlink():
+                    files[rel] = {'link': os.readlink(path)}
+                    continue
+                entry, new_bytes = self._ingest(path)
+                files[rel] = entry
+                added += new_bytes
+
+            now = datetime.now().isoformat()
+            manifest = {'key': key, 'created_at': now, 'last_used': now, 'single_file': source.is_file(),
+                        'size': sum(e.get('size', 0) for e in files.values()),
+                        'files': files, **(meta or {})}
+            self._write_manifest(manifest)
+            self.logger.info(f"Сборка {key[:12]} сохранена в хранилище: {len(files)} файлов, "
+                             f"{manifest['size'] / 1024 ** 2:.0f} МБ, новых {added / 1024 ** 2:.0f} МБ")
+            self.evict(keep=key)
+        return added
+
+    def checkout(self, key, destination, replace=False):
+        """Извлечение сборки жесткими ссылками (копией, если ссылка невозможна)"""
+        destination = Path(destination)
+        with self._lock:
+            manifest = self._read_manifest(key)
+            if manifest is None:
+                raise KeyError(f"сборки {key} нет в хранилище")
+            self.detach(destination)
+            if destination.exists() and (destination.is_file() or any(destination.iterdir())):
+                if not replace:
+                    raise FileExistsError(f"{destination} не пуст")
+                if destination.is_dir():
+                    shutil.rmtree(destination)
+                else:
+                    destination.unlink()
+
+            for rel, entry in manifest['files'].items():
+                target = destination / rel if rel else destination
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if 'link' in entry:
+                    os.symlink(entry['link'], target)
+                    continue
+                obj = self._materialize(entry)
+                try:
+                    os.link(obj, target)
+                except OSError:
+                    shutil.copy2(obj, target)
+
+            if not manifest.get('single_file'):
+                with open(destination / self.MARKER, 'w') as f:
+                    json.dump({'key': key}, f)
+            manifest['last_used'] = datetime.now().isoformat()
+            self._write_manifest(manifest)
+        self.logger.info(f"Сборка {key[:12]} извлечена в {destination}")
+        return destination
+
+    @classmethod
+    def detach(cls, path):
+        """Удаление ранее извлеченной сборки перед новой: ее файлы - жесткие ссылки на объекты хранилища"""
+        path = Path(path)
+        if (path / cls.MARKER).exists():
+            shutil.rmtree(path)
+
+    def evict(self, keep=None):
+        """Удаление давно не использованных сборок сверх лимитов и сборка мусора"""
+        with self._lock:
+            builds = self.builds()
+            removed = []
+            while builds and (len(builds) > self.max_builds or self._usage() > self.max_bytes):
+                victim = builds.pop()
+                if victim['key'] == keep:
+                    break
+                self._manifest_path(victim['key']).unlink()
+                removed.append(victim['key'][:12])
+                self._collect_garbage()
+            if removed:
+                self.logger.info(f"Из хранилища вытеснены сборки: {', '.join(removed)}")
+            self._collect_garbage()
+
+    def _ingest(self, path):
+        """Файл -> запись манифеста; большие файлы режутся на блоки"""
+        executable = bool(path.stat().st_mode & 0o111)
+        size = path.stat().st_size
+        if size < self.CHUNK_THRESHOLD:
+            digest = self._hash_file(path)
+            obj = self._object_path(digest, executable)
+            if obj.exists():
+                return {'sha256': digest, 'size': size, 'x': executable}, 0
+            self._store_file(path, obj, executable)
+            return {'sha256': digest, 'size': size, 'x': executable}, size
+
+        whole = hashlib.sha256()
+        chunks = []
+        added = 0
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                whole.update(block)
+                digest = hashlib.sha256(block).hexdigest()
+                chunk_path = self.root / 'chunks' / digest[:2] / digest
+                if not chunk_path.exists():
+                    self._write_atomic(chunk_path, block)
+                    added += len(block)
+                chunks.append(digest)
+        return {'sha256': whole.hexdigest(), 'size': size, 'x': executable, 'chunks': chunks}, added
+
+    def _materialize(self, entry):
+        """Объект файла; большой файл собирается из блоков при первом извлечении"""
+        obj = self._object_path(entry['sha256'], entry.get('x'))
+        if obj.exists():
+            return obj
+        tmp_path = self.root / 'tmp' / uuid.uuid4().hex
+        with open(tmp_path, 'wb') as out:
+            for digest in entry['chunks']:
+                with open(self.root / 'chunks' / digest[:2] / digest, 'rb') as chunk:
+                    shutil.copyfileobj(chunk, out)
+        self._seal(tmp_path, obj, entry.get('x'))
+        return obj
+
+    def _store_file(self, path, obj, executable):
+        tmp_path = self.root / 'tmp' / uuid.uuid4().hex
+        shutil.copyfile(path, tmp_path)
+        self._seal(tmp_path, obj, executable)
+
+    @staticmethod
+    def _seal(tmp_path, obj, executable):
+        # Объекты только для чтения: извлеченные ссылки нельзя случайно переписать на месте
+        os.chmod(tmp_path, 0o555 if executable else 0o444)
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, obj)
+
+    def _write_atomic(self, path, data):
+        tmp_path = self.root / 'tmp' / uuid.uuid4().hex
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def _collect_garbage(self):
+        """Удаление объектов и блоков без ссылок из манифестов"""
+        objects, chunks = set(), set()
+        for path in (self.root / 'manifests').glob('*.json'):
+            manifest = self._read_manifest(path.stem) or {}
+            for entry in manifest.get('files', {}).values():
+                if 'chunks' in entry:
+                    chunks.update(entry['chunks'])
+                elif 'sha256' in entry:
+                    objects.add(self._object_path(entry['sha256'], entry.get('x')).name)
+
+        for obj in (self.root / 'objects').glob('*/*'):
+            # Собранный из блоков файл - кэш: хранится, пока на него есть извлеченные ссылки
+            if obj.name not in objects and obj.stat().st_nlink <= 1:
+                obj.unlink()
+        for chunk in (self.root / 'chunks').glob('*/*'):
+            if chunk.name not in chunks:
+                chunk.unlink()
+
+    def _usage(self):
+        seen = set()
+        total = 0
+        for path in list((self.root / 'objects').glob('*/*')) + list((self.root / 'chunks').glob('*/*')):
+            stat = path.stat()
+            if stat.st_ino not in seen:
+                seen.add(stat.st_ino)
+                total += stat.st_size
+        return total
+
+    def _object_path(self, digest, executable):
+        return self.root / 'objects' / digest[:2] / (digest + ('.x' if executable else ''))
+
+    def _manifest_path(self, key):
+        return self.root / 'manifests' / f"{key}.json"
+
+    def _read_manifest(self, key):
+        try:
+            with open(self._manifest_path(key), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        self._write_atomic(self._manifest_path(manifest['key']), json.dumps(manifest).encode())
+
+    @staticmethod
+    def _hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+
+class TestShardPlanner:
+    """Разбиение тестов на шарды по длительностям прошлых прогонов и слияние NUnit XML"""
+
+    NAMESPACE_PATTERN = re.compile(r'^\s*namespace\s+([\w.]+)')
+    CLASS_PATTERN = re.compile(r'\bclass\s+(\w+)')
+    ATTRIBUTE_PATTERN = re.compile(r'\[\s*(?:NUnit\.Framework\.)?(Test|UnityTest|TestCase|TestCaseSource)\b')
+    METHOD_PATTERN = re.compile(r'\b(?:void|IEnumerator|Task)\s+(\w+)\s*\(')
+    SUMMARY_ATTRIBUTES = ('testcasecount', 'total', 'passed', 'failed', 'inconclusive', 'skipped', 'asserts')
+
+    def __init__(self, tests_dir, results_dir, default_duration=1.0):
+        self.tests_dir = Path(tests_dir)
+        self.results_dir = Path(results_dir)
+        self.default_duration = default_duration
+
+    def discover(self):
+        """Полные имена тестов (Namespace.Class.Method) из исходников"""
+        tests = []
+        for path in sorted(self.tests_dir.rglob('*.cs')):
+            namespace, class_name, pending = '', '', False
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    match = self.NAMESPACE_PATTERN.search(line)
+                    if match:
+                        namespace = match.group(1)
+                        continue
+                    match = self.CLASS_PATTERN.search(line)
+                    if match and not line.lstrip().startswith('//'):
+                        class_name = match.group(1)
+                        continue
+                    if self.ATTRIBUTE_PATTERN.search(line):
+                        pending = True
+                    match = self.METHOD_PATTERN.search(line)
+                    if pending and match:
+                        name = '.'.join(p for p in (namespace, class_name, match.group(1)) if p)
+                        if name not in tests:
+                            tests.append(name)
+                        pending = False
+        return tests
+
+    def load_durations(self):
+        """Длительности тестов из прошлых test-results-*.xml (более свежие перекрывают старые)"""
+        durations = {}
+        files = sorted(self.results_dir.glob('test-results-*.xml'), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            # Параметризованные тесты суммируются по имени метода в пределах одного прогона
+            run = {}
+            try:
+                for _event, element in ET.iterparse(path):
+                    if element.tag == 'test-case':
+                        method = element.get('fullname', '').split('(', 1)[0]
+                        run[method] = run.get(method, 0) + float(element.get('duration', 0) or 0)
+                    element.clear()
+            except (ET.ParseError, OSError, ValueError):
+                continue
+            durations.update(run)
+        return durations
+
+    @staticmethod
+    def test_filter(names):
+        """-testFilter шарда: Unity трактует элементы как регулярные выражения по полному имени,
+        поэтому имена экранируются и якорятся (Foo.Test1 не выбирает Foo.Test10), параметры допускаются"""
+        return ';'.join(rf"^{re.escape(name)}(\(.*\))?$" for name in names)
+
+    def plan(self, tests, shards):
+        """Жадная упаковка по убыванию длительности (longest-first) в наименее загруженный шард"""
+        durations = self.load_durations()
+        known = sorted(durations.values())
+        fallback = known[len(known) // 2] if known else self.default_duration
+        weighted = sorted(((durations.get(t, fallback), t) for t in tests), reverse=True)
+
+        heap = [(0.0, i) for i in range(shards)]
+        buckets = [[] for _ in range(shards)]
+        for duration, test in weighted:
+            load, index = heapq.heappop(heap)
+            buckets[index].append(test)
+            heapq.heappush(heap, (load + duration, index))
+        return [bucket for bucket in buckets if bucket]
+
+    @classmethod
+    def merge_results(cls, paths, output_path):
+        """Слияние NUnit3 XML шардов в один test-run"""
+        merged = ET.Element('test-run', {'id': '0', 'engine-version': 'merged'})
+        totals = {name: 0 for name in cls.SUMMARY_ATTRIBUTES}
+        starts, ends, duration, failed = [], [], 0.0, False
+        for path in paths:
+            try:
+                root = ET.parse(path).getroot()
+            except (ET.ParseError, OSError):
+                failed = True
+                continue
+            for name in totals:
+                totals[name] += int(root.get(name, 0) or 0)
+            if root.get('start-time'):
+                starts.append(root.get('start-time'))
+            if root.get('end-time'):
+                ends.append(root.get('end-time'))
+            duration = max(duration, float(root.get('duration', 0) or 0))
+            failed = failed or root.get('result', '').startswith('Failed')
+            merged.extend(list(root))
+
+        for name, value in totals.items():
+            merged.set(name, str(value))
+        merged.set('result', 'Failed' if failed or totals['failed'] else 'Passed')
+        merged.set('duration', f"{duration:.6f}")
+        if starts:
+            merged.set('start-time', min(starts))
+        if ends:
+            merged.set('end-time', max(ends))
+        ET.ElementTree(merged).write(output_path, encoding='utf-8', xml_declaration=True)
+        return not failed and totals['failed'] == 0
+
+
+class SystemResources:
+    """Свободные ядра и память машины (/proc, при отсутствии - psutil)"""
+
+    @staticmethod
+    def cpu_count():
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def load_average():
+        """Средняя загрузка за минуту"""
+        try:
+            return os.getloadavg()[0]
+        except (OSError, AttributeError):
+            if psutil:
+                return psutil.cpu_percent(interval=None) / 100 * SystemResources.cpu_count()
+            return 0.0
+
+    @staticmethod
+    def memory_available_mb():
+        """Доступная память (MemAvailable)"""
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        if psutil:
+            return psutil.virtual_memory().available / (1024 * 1024)
+        return float('inf')
+
+    @staticmethod
+    def process_rss_mb(pid):
+        """Резидентная память процесса (МБ)"""
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            if psutil:
+                try:
+                    return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+                except psutil.Error:
+                    pass
+        return 0.0
+
+
+class AgentMetrics:
+    """Гистограммы по типам задач (ожидание в очереди, длительность, пиковая память, CPU) и коды выхода
+
+    Агрегаты сохраняются в JSON и переживают перезапуск агента.
+    """
+
+    HISTOGRAMS = {
+        'queue_wait_seconds': (1, 5, 15, 60, 300, 900, 3600, 4 * 3600),
+        'duration_seconds': (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 2 * 3600, 4 * 3600),
+        'peak_rss_bytes': tuple(gb * 1024 ** 3 for gb in (0.5, 1, 2, 4, 8, 16, 32)),
+        'cpu_seconds': (10, 60, 300, 900, 1800, 3600, 4 * 3600, 16 * 3600),
+    }
+    RECENT_WINDOW = 50
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data = {'histograms': {}, 'exits': {}, 'recent': {}}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    self._data.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+
+    def observe(self, task_type, exit_code, **values):
+        """Запись результата задачи: exit_code и значения гистограмм (None пропускаются)"""
+        with self._lock:
+            histograms = self._data['histograms'].setdefault(task_type, {})
+            for name, value in values.items():
+                if value is None or name not in self.HISTOGRAMS:
+                    continue
+                bounds = self.HISTOGRAMS[name]
+                histogram = histograms.setdefault(name, {'buckets': [0] * (len(bounds) + 1), 'sum': 0.0, 'count': 0})
+                index = next((i for i, bound in enumerate(bounds) if value <= bound), len(bounds))
+                histogram['buckets'][index] += 1
+                histogram['sum'] += value
+                histogram['count'] += 1
+
+            exits = self._data['exits'].setdefault(task_type, {})
+            exits[str(exit_code)] = exits.get(str(exit_code), 0) + 1
+
+            if values.get('duration_seconds') is not None:
+                recent = self._data['recent'].setdefault(task_type, [])
+                recent.append(round(values['duration_seconds'], 3))
+                del recent[:-self.RECENT_WINDOW]
+            self._save()
+
+    def snapshot(self):
+        """Копия агрегатов с медианой и p90 длительности за последние запуски"""
+        with self._lock:
+            data = json.loads(json.dumps(self._data))
+        data['recent_quantiles'] = {
+            task_type: {'0.5': self._quantile(values, 0.5), '0.9': self._quantile(values, 0.9)}
+            for task_type, values in data['recent'].items() if values
+        }
+        return data
+
+    def render_prometheus(self, task_counts=None):
+        """Текстовый формат Prometheus"""
+        data = self.snapshot()
+        lines = []
+        for name, bounds in self.HISTOGRAMS.items():
+            metric = f"unity_agent_task_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for task_type, histograms in sorted(data['histograms'].items()):
+                histogram = histograms.get(name)
+                if not histogram:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(bounds) + ['+Inf'], histogram['buckets']):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{type="{task_type}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{type="{task_type}"}} {histogram["sum"]}')
+                lines.append(f'{metric}_count{{type="{task_type}"}} {histogram["count"]}')
+
+        lines.append("# TYPE unity_agent_task_exit_total counter")
+        for task_type, exits in sorted(data['exits'].items()):
+            for code, count in sorted(exits.items()):
+                lines.append(f'unity_agent_task_exit_total{{type="{task_type}",code="{code}"}} {count}')
+
+        lines.append("# TYPE unity_agent_task_recent_duration_seconds gauge")
+        for task_type, quantiles in sorted(data['recent_quantiles'].items()):
+            for quantile, value in quantiles.items():
+                lines.append(f'unity_agent_task_recent_duration_seconds{{type="{task_type}",quantile="{quantile}"}} {value}')
+
+        if task_counts is not None:
+            lines.append("# TYPE unity_agent_tasks gauge")
+            for status, count in sorted(task_counts.items()):
+                lines.append(f'unity_agent_tasks{{status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _quantile(values, q):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.path)
+
+
+class MetricsServer:
+    """Локальный HTTP: /metrics (Prometheus) и /status (JSON)"""
+
+    def __init__(self, agent, port, host='127.0.0.1'):
+        self.agent = agent
+        handler = self._make_handler(agent)
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def _make_handler(agent):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = agent.metrics.render_prometheus(agent.queue.counts()).encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/status':
+                    body = json.dumps(agent.get_status(), default=str).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+        return Handler
+
+
+class AgentRPCServer:
+    """Локальный RPC на asyncio: JSON-строки через UNIX-сокет (и TCP на 127.0.0.1)
+
+    Запрос - одна JSON-строка {"op": ...}, ответ - одна JSON-строка:
+    submit (задача или пайплайн), status, cancel, logs (поток строк лога).
+    При заполненной очереди submit отвечает {"ok": false, "error": "queue_full", "retry_after": ...}.
+    """
+
+    def __init__(self, agent, socket_path=None, port=None, max_queue_depth=100,
+                 max_clients=64, retry_after=30):
+        self.agent = agent
+        self.socket_path = Path(socket_path) if socket_path else None
+        self.port = port
+        self.max_queue_depth = max_queue_depth
+        self.max_clients = max_clients
+        self.retry_after = retry_after
+        self._clients = 0
+        self._loop = None
+        self._stopped = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='agent-rpc', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait(10)
+
+    def stop(self):
+        if self._loop and self._stopped:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join(10)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            self.agent.logger.error(f"RPC-сервер остановлен с ошибкой: {e}")
+            self._ready.set()
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        servers = []
+        if self.socket_path:
+            self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            servers.append(await asyncio.start_unix_server(self._handle, path=str(self.socket_path)))
+        if self.port:
+            servers.append(await asyncio.start_server(self._handle, '127.0.0.1', self.port))
+        self._ready.set()
+        await self._stopped.wait()
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+        if self.socket_path and self.socket_path.exists():
+            self.socket_path.unlink()
+
+    async def _handle(self, reader, writer):
+        self._clients += 1
+        try:
+            if self._clients > self.max_clients:
+                await self._reply(writer, {'ok': False, 'error': 'busy', 'retry_after': 1})
+                return
+            try:
+                request = json.loads(await asyncio.wait_for(reader.readline(), 30) or b'{}')
+            except (asyncio.TimeoutError, ValueError) as e:
+                await self._reply(writer, {'ok': False, 'error': f'bad request: {e}'})
+                return
+            op = request.get('op') if isinstance(request, dict) else None
+            if op == 'logs':
+                await self._stream_logs(request, writer)
+            elif op in ('submit', 'status', 'cancel'):
+                # SQLite и ожидание завершения процессов при отмене - в пуле потоков, не блокируя других клиентов
+                try:
+                    response = await self._loop.run_in_executor(None, getattr(self, f'_op_{op}'), request)
+                except Exception as e:
+                    self.agent.logger.error(f"RPC {op}: {e}")
+                    response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+                await self._reply(writer, response)
+            else:
+                await self._reply(writer, {'ok': False, 'error': f'unknown op {op!r}'})
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._clients -= 1
+            writer.close()
+
+    @staticmethod
+    async def _reply(writer, response):
+        writer.write((json.dumps(response, default=str) + '\n').encode())
+        await writer.drain()
+
+    def _op_submit(self, request):
+        task = request.get('task')
+        if not isinstance(task, dict):
+            return {'ok': False, 'error': 'task must be an object'}
+        try:
+            task_id, added = self.agent.submit(task, max_pending=self.max_queue_depth)
+        except TaskQueue.Full as e:
+            return {'ok': False, 'error': 'queue_full', 'pending': e.pending,
+                    'max_queue_depth': self.max_queue_depth, 'retry_after': self.retry_after}
+        if task_id is None:
+            return {'ok': False, 'error': 'rejected'}
+        return {'ok': True, 'id': task_id, 'added': added,
+                'pending': self.agent.queue.counts().get(TaskQueue.PENDING, 0)}
+
+    def _op_status(self, request):
+        if not request.get('id'):
+            return {'ok': True, 'status': self.agent.get_status()}
+        task_id = str(request['id'])
+        task = self.agent.queue.get(task_id)
+        pipeline = self.agent.get_pipeline(task_id)
+        if task is None and not pipeline:
+            return {'ok': False, 'error': 'not found'}
+        return {'ok': True, 'task': task, 'pipeline': pipeline or None,
+                'progress': self.agent.get_progress().get(task_id)}
+
+    def _op_cancel(self, request):
+        return {'ok': self.agent.cancel_task(str(request.get('id')))}
+
+    async def _stream_logs(self, request, writer):
+        """Строки лога задачи; с follow - до ее завершения"""
+        task_id = str(request.get('id'))
+        follow = bool(request.get('follow'))
+        if self.agent.queue.get(task_id) is None:
+            await self._reply(writer, {'ok': False, 'error': 'not found'})
+            return
+        await self._reply(writer, {'ok': True, 'id': task_id})
+
+        log_file = None
+        try:
+            while True:
+                if log_file is None:
+                    path = self.agent.task_log(task_id)
+                    if path:
+                        log_file = gzip.open(path, 'rb') if path.suffix == '.gz' else open(path, 'rb')
+                if log_file is not None:
+                    chunk = log_file.read(65536)
+                    if chunk:
+                        writer.write(chunk)
+                        await writer.drain()
+                        continue
+                if not follow:
+                    break
+                task = self.agent.queue.get(task_id)
+                if task is None or task['status'] not in (TaskQueue.PENDING, TaskQueue.RUNNING):
+                    if log_file is None or not log_file.read(1):
+                        break
+                    log_file.seek(-1, os.SEEK_CUR)
+                    continue
+                await asyncio.sleep(0.5)
+        finally:
+            if log_file is not None:
+                log_file.close()
+
+
+class AgentClient:
+    """Клиент AgentRPCServer для CI-задач"""
+
+    def __init__(self, socket_path=None, port=None, timeout=30):
+        self.socket_path = socket_path
+        self.port = port
+        self.timeout = timeout
+
+    def _connect(self):
+        if self.port:
+            return socket.create_connection(('127.0.0.1', self.port), timeout=self.timeout)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(str(self.socket_path))
+        return sock
+
+    def request(self, op, **fields):
+        """Один запрос - один ответ"""
+        with self._connect() as sock:
+            sock.sendall((json.dumps({'op': op, **fields}) + '\n').encode())
+            with sock.makefile('rb') as stream:
+                return json.loads(stream.readline() or b'{}')
+
+    def submit(self, task, wait=0):
+        """Отправка задачи; при заполненной очереди повтор через retry_after, пока не истечет wait (сек)"""
+        deadline = time.time() + wait
+        while True:
+            response = self.request('submit', task=task)
+            if response.get('ok') or response.get('error') not in ('queue_full', 'busy'):
+                return response
+            delay = response.get('retry_after', 5)
+            if time.time() + delay > deadline:
+                return response
+            time.sleep(delay)
+
+    def logs(self, task_id, follow=False, out=None):
+        """Вывод лога задачи в out (по умолчанию stdout)"""
+        out = out or sys.stdout.buffer
+        with self._connect() as sock:
+            sock.settimeout(None)
+            sock.sendall((json.dumps({'op': 'logs', 'id': task_id, 'follow': follow}) + '\n').encode())
+            with sock.makefile('rb') as stream:
+                header = json.loads(stream.readline() or b'{}')
+                if not header.get('ok'):
+                    return header
+                for chunk in iter(lambda: stream.read1(65536), b''):
+                    out.write(chunk)
+                    out.flush()
+                return header
+
+
+class UnityProgressParser:
+    """Распознавание этапов Unity (импорт, компиляция, reload, сборка, тесты) по строкам лога"""
+
+    PATTERNS = [
+        (re.compile(r'Start importing (.+?) using Guid'), 'import'),
+        (re.compile(r'^\[\s*(\d+/\d+)\s+\d+s\]\s+(?:Csc|ILPostProcess\w*)\s+\S*?([\w.]+\.dll)'), 'compile'),
+        (re.compile(r'(Reloading assemblies|Begin MonoManager ReloadAssembly)'), 'domain_reload'),
+        (re.compile(r'DisplayProgressbar: (.+)'), 'build'),
+        (re.compile(r'Build Finished, Result: (\w+)'), 'build'),
+        (re.compile(r'(Executing IPrebuildSetup|Test run (?:started|finished)|Saving results to: .+)'), 'test'),
+        (re.compile(r'(Refresh completed|Asset Pipeline Refresh.*)'), 'refresh'),
+    ]
+    ERROR_PATTERN = re.compile(r'error CS\d{4}|Exception:')
+
+    def feed(self, line):
+        """Возвращает (этап, детали) для известных маркеров, иначе None"""
+        for pattern, phase in self.PATTERNS:
+            match = pattern.search(line)
+            if match:
+                return phase, ' '.join(g for g in match.groups() if g)
+        return None
+
+
+class UnityLogAnalyzer:
+    """Потоковый разбор лога Unity: времена компиляции сборок, импорта ассетов, domain reload и шагов сборки
+
+    Строки подаются по одной (feed), в памяти хранятся только агрегаты и топ самых долгих импортов,
+    поэтому логи в сотни МБ разбираются без загрузки целиком. Длительности берутся из самого лога
+    ("in N seconds", счетчик Bee), а где их нет - из времени строк: времени поступления при живом
+    разборе или префикса -timestamps.
+    """
+
+    TIMESTAMP = re.compile(r'^(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?)Z?\|(?:0x[0-9a-fA-F]+\|)?')
+    IMPORT_START = re.compile(r'Start importing (.+?) using Guid')
+    IMPORT_DONE = re.compile(r"-> \(artifact id: '[^']*'\) in ([\d.]+) seconds")
+    BEE_STEP = re.compile(r'^\[\s*(\d+)/\s*(\d+)\s+(\d+)s\]\s+(\w+)\s+\S*?([\w.]+?)(?:\.dll|\.pdb)?(?:\s|$)')
+    BEE_DONE = re.compile(r'\*\*\* Tundra build (success|failed) \(([\d.]+) seconds\)')
+    RELOAD_START = re.compile(r'Reloading assemblies|Begin MonoManager ReloadAssembly')
+    RELOAD_DONE = re.compile(r'- Completed reload, in\s+([\d.]+) seconds|Domain Reload Profiling: (\d+)ms')
+    REFRESH = re.compile(r'Asset Pipeline Refresh \(id=\w+\): Total: ([\d.]+) seconds')
+    BUILD_STEP = re.compile(r'DisplayProgressbar: (.+)')
+    BUILD_DONE = re.compile(r"Build completed with a result of '(\w+)' in (\d+) seconds")
+    BUILD_FINISHED = re.compile(r'Build Finished, Result: (\w+)')
+    COMPILE_TOOLS = ('Csc', 'ILPostProcess', 'ILPostProcessAssembly')
+
+    def __init__(self, top=50):
+        self.top = top
+        self.lines = 0
+        self.errors = 0
+        self.assemblies = {}
+        self.imports = {'count': 0, 'seconds': 0.0, 'by_extension': {}}
+        self._slow_imports = []
+        self.reloads = []
+        self.refreshes = []
+        self.compile_runs = []
+        self.build_steps = []
+        self.build = None
+        self._import = None
+        self._bee = None
+        self._reloading = False
+        self._step = None
+
+    def feed(self, line, at=None):
+        """Разбор одной строки; at - время строки (сек), если известно"""
+        self.lines += 1
+        match = self.TIMESTAMP.match(line)
+        if match:
+            try:
+                at = datetime.fromisoformat(match.group(1)).timestamp()
+            except ValueError:
+                pass
+            line = line[match.end():]
+        if UnityProgressParser.ERROR_PATTERN.search(line):
+            self.errors += 1
+
+        start = self.IMPORT_START.search(line)
+        done = self.IMPORT_DONE.search(line)
+        if start and done:
+            # Обычная форма Unity: начало и "in N seconds" в одной строке
+            self._record_import(start.group(1), float(done.group(1)))
+            self._close_import(at)
+            return
+        if done and self._import:
+            self._record_import(self._import[0], float(done.group(1)))
+            self._import = None
+            return
+        if start:
+            self._close_import(at)
+            self._import = (start.group(1), at)
+            return
+
+        match = self.BEE_STEP.match(line)
+        if match:
+            self._feed_bee(match, at)
+            return
+        match = self.BEE_DONE.search(line)
+        if match:
+            self.compile_runs.append({'result': match.group(1), 'seconds': float(match.group(2))})
+            self._bee = None
+            return
+
+        if self.RELOAD_START.search(line):
+            self._reloading = True
+            return
+        match = self.RELOAD_DONE.search(line)
+        if match and self._reloading:
+            self.reloads.append(float(match.group(1)) if match.group(1) else int(match.group(2)) / 1000)
+            self._reloading = False
+            return
+        match = self.REFRESH.search(line)
+        if match:
+            self.refreshes.append(float(match.group(1)))
+            return
+
+        match = self.BUILD_STEP.search(line)
+        if match:
+            self._close_step(at)
+            self._step = (match.group(1).strip(), at)
+            return
+        match = self.BUILD_DONE.search(line) or self.BUILD_FINISHED.search(line)
+        if match:
+            self._close_step(at)
+            if self.build is None or len(match.groups()) > 1:
+                self.build = {'result': match.group(1),
+                              'seconds': int(match.group(2)) if len(match.groups()) > 1 else None}
+
+    def _feed_bee(self, match, at):
+        """Шаг Bee: длительность сборки считается от предыдущего завершенного шага"""
+        done, elapsed, tool, name = int(match.group(1)), int(match.group(3)), match.group(4), match.group(5)
+        if self._bee is None or elapsed < self._bee[0]:
+            self._bee = (0, at)
+        if tool in self.COMPILE_TOOLS or tool.startswith('ILPostProcess'):
+            if at is not None and self._bee[1] is not None:
+                seconds = at - self._bee[1]
+            else:
+                seconds = elapsed - self._bee[0]
+            entry = self.assemblies.setdefault(name, {'seconds': 0.0, 'count': 0})
+            entry['seconds'] += max(0.0, seconds)
+            entry['count'] += 1
+        self._bee = (elapsed, at)
+
+    def _close_import(self, at):
+        """Импорт без строки "in N seconds": длительность - до начала следующего импорта"""
+        if self._import and at is not None and self._import[1] is not None:
+            self._record_import(self._import[0], at - self._import[1])
+        self._import = None
+
+    def _record_import(self, asset, seconds):
+        self.imports['count'] += 1
+        self.imports['seconds'] += seconds
+        extension = Path(asset).suffix.lower() or '(none)'
+        by_extension = self.imports['by_extension'].setdefault(extension, {'count': 0, 'seconds': 0.0})
+        by_extension['count'] += 1
+        by_extension['seconds'] += seconds
+        item = (seconds, asset)
+        if len(self._slow_imports) < self.top:
+            heapq.heappush(self._slow_imports, item)
+        elif item > self._slow_imports[0]:
+            heapq.heapreplace(self._slow_imports, item)
+
+    def _close_step(self, at):
+        if self._step is None:
+            return
+        name, started = self._step
+        seconds = at - started if at is not None and started is not None else None
+        self.build_steps.append({'step': name, 'seconds': seconds})
+        self._step = None
+
+    def summary(self, **meta):
+        """Итог разбора в виде JSON-совместимого словаря"""
+        self._close_step(None)
+        return {
+            **meta,
+            'lines': self.lines,
+            'errors': self.errors,
+            'compile': {
+                'assemblies': {name: {'seconds': round(e['seconds'], 3), 'count': e['count']}
+                               for name, e in sorted(self.assemblies.items(), key=lambda kv: -kv[1]['seconds'])},
+                'runs': self.compile_runs,
+            },
+            'imports': {
+                'count': self.imports['count'],
+                'seconds': round(self.imports['seconds'], 3),
+                'by_extension': self.imports['by_extension'],
+                'slowest': [{'asset': asset, 'seconds': round(seconds, 3)}
+                            for seconds, asset in sorted(self._slow_imports, reverse=True)],
+            },
+            'domain_reloads': self.reloads,
+            'refreshes': self.refreshes,
+            'build_steps': self.build_steps,
+            'build': self.build,
+        }
+
+    @classmethod
+    def analyze_file(cls, path, **meta):
+        """Разбор готового лога построчно"""
+        analyzer = cls()
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                analyzer.feed(line.rstrip('\n'))
+        return analyzer.summary(log=str(path), **meta)
+
+    @staticmethod
+    def slowest(summaries, top=10):
+        """Самые долгие сборки, импорты, шаги сборки и reload по набору запусков"""
+        assemblies, imports, steps, reloads = {}, {}, {}, []
+        for summary in summaries:
+            for name, entry in summary.get('compile', {}).get('assemblies', {}).items():
+                assemblies.setdefault(name, []).append(entry['seconds'])
+            for entry in summary.get('imports', {}).get('slowest', []):
+                imports[entry['asset']] = max(imports.get(entry['asset'], 0), entry['seconds'])
+            for entry in summary.get('build_steps', []):
+                if entry.get('seconds') is not None:
+                    steps.setdefault(entry['step'], []).append(entry['seconds'])
+            reloads.extend(summary.get('domain_reloads', []))
+
+        def ranked(values):
+            rows = [{'name': name, 'runs': len(v), 'mean': round(sum(v) / len(v), 3), 'max': round(max(v), 3)}
+                    for name, v in values.items()]
+            return sorted(rows, key=lambda row: -row['mean'])[:top]
+
+        return {
+            'runs': len(summaries),
+            'assemblies': ranked(assemblies),
+            'imports': [{'name': name, 'max': seconds}
+                        for name, seconds in sorted(imports.items(), key=lambda kv: -kv[1])[:top]],
+            'build_steps': ranked(steps),
+            'domain_reload': {'count': len(reloads), 'mean': round(sum(reloads) / len(reloads), 3) if reloads else None,
+                              'max': max(reloads) if reloads else None},
+        }
+
+
+class LogArchive:
+    """Ротация логов агента и Unity в сжатый архив с инвертированным индексом
+
+    Лог сжимается потоково блоками по ~256 КБ; каждый блок - отдельный gzip-член, поэтому архив
+    читается обычным zcat, а поиск распаковывает только блоки из индекса (SQLite): коды ошибок
+    компилятора, типы исключений, ID задач и пути ассетов.
+    """
+
+    BLOCK_SIZE = 256 * 1024
+    TOKEN_PATTERNS = [
+        ('code', re.compile(r'CS\d{4}')),
+        ('exception', re.compile(r'[A-Z]\w*(?:Exception|Error)')),
+        ('asset', re.compile(r'(?:Assets|Packages)/[^\s\'"()\[\],:]+')),
+    ]
+    # Сканирующие выражения начинаются с литерала (без ведущего \b), иначе re теряет быстрый поиск
+    CODE_SCAN = re.compile(r'CS\d{4}(?!\d)')
+    EXCEPTION_SCAN = re.compile(r'(?:Exception|Error)\b')
+    ASSET_SCAN = re.compile(r'(?:Assets|Packages)/[^\s\'"()\[\],:]+')
+    TASK_SCAN = re.compile(r'адач[аиу]\s+([\w.\-]{4,})|task[_ ]?id[=: ]+([\w.\-]{4,})')
+    WORD = re.compile(r'\w')
+    TASK_LOG = re.compile(r'^[a-z]+-\d{8}-\d{6}-(.+)\.log$')
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS archives (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE,
+            source TEXT NOT NULL,
+            task_id TEXT,
+            lines INTEGER NOT NULL,
+            archived_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS blocks (
+            archive_id INTEGER NOT NULL,
+            block INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            first_line INTEGER NOT NULL,
+            PRIMARY KEY (archive_id, block)
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            token TEXT NOT NULL,
+            archive_id INTEGER NOT NULL,
+            block INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS postings_token ON postings (token);
+        CREATE INDEX IF NOT EXISTS archives_task ON archives (task_id);
+    """
+
+    def __init__(self, logs_dir, logger, max_age_hours=24, max_mb=512, retention_days=30):
+        self.logs_dir = Path(logs_dir)
+        self.root = self.logs_dir / "Archive"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.logger = logger
+        self.max_age = max_age_hours * 3600
+        self.max_bytes = max_mb * 1024 * 1024
+        self.retention = retention_days * 86400
+        self._lock = threading.Lock()
+        self._db = None
+
+    @property
+    def _conn(self):
+        """Индекс открывается при первом обращении (под self._lock), а не в конструкторе:
+        архив можно создать до DaemonContext, который закрывает унаследованные дескрипторы"""
+        if self._db is None:
+            self._db = sqlite3.connect(str(self.root / "index.db"), check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(self.SCHEMA)
+        return self._db
+
+    def rotate(self, active=()):
+        """Архивация старых логов: по возрасту и сверх лимита размера; active - логи, которые сейчас пишутся"""
+        active = {Path(p).resolve() for p in active}
+        candidates = [p for p in list(self.logs_dir.glob('*.log')) + list((self.logs_dir / "Agents").glob('*.log'))
+                      if p.resolve() not in active and not self._owner_alive(p)]
+        candidates.sort(key=lambda p: p.stat().st_mtime)
+
+        now = time.time()
+        total = sum(p.stat().st_size for p in candidates)
+        archived = 0
+        for path in candidates:
+            stat = path.stat()
+            if now - stat.st_mtime < self.max_age and total <= self.max_bytes:
+                break
+            try:
+                self.archive(path)
+                archived += 1
+            except OSError as e:
+                self.logger.warning(f"Не удалось заархивировать {path.name}: {e}")
+            total -= stat.st_size
+        expired = self.expire()
+        if archived or expired:
+            self.logger.info(f"Ротация логов: заархивировано {archived}, удалено устаревших архивов {expired}")
+        return archived
+
+    def archive(self, path):
+        """Потоковое сжатие лога блоками с индексацией и удалением исходника"""
+        path = Path(path)
+        month = datetime.fromtimestamp(path.stat().st_mtime).strftime('%Y-%m')
+        dest = self.root / month / f"{path.name}.gz"
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest.with_suffix('.tmp')
+        match = self.TASK_LOG.match(path.name)
+        task_id = match.group(1) if match else None
+
+        blocks, postings = [], []
+        line_count = 0
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as out:
+            chunk, size, first_line = [], 0, 0
+            for raw in src:
+                chunk.append(raw)
+                size += len(raw)
+                line_count += 1
+                if size >= self.BLOCK_SIZE:
+                    self._write_block(out, chunk, first_line, blocks, postings)
+                    chunk, size, first_line = [], 0, line_count
+            if chunk:
+                self._write_block(out, chunk, first_line, blocks, postings)
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._drop(str(dest))
+                cursor = self._conn.execute(
+                    "INSERT INTO archives (path, source, task_id, lines, archived_at) VALUES (?, ?, ?, ?, ?)",
+                    (str(dest), str(path), task_id, line_count, datetime.now().isoformat()))
+                archive_id = cursor.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO blocks (archive_id, block, offset, length, first_line) VALUES (?, ?, ?, ?, ?)",
+                    [(archive_id, *block) for block in blocks])
+                self._conn.executemany(
+                    "INSERT INTO postings (token, archive_id, block) VALUES (?, ?, ?)",
+                    [(token, archive_id, block) for token, block in postings])
+                os.replace(tmp_path, dest)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        path.unlink()
+        return dest
+
+    def _write_block(self, out, chunk, first_line, blocks, postings):
+        data = b''.join(chunk)
+        member = gzip.compress(data, compresslevel=6)
+        blocks.append((len(blocks), out.tell(), len(member), first_line))
+        out.write(member)
+        for token in self.tokens(data.decode('utf-8', errors='replace')):
+            postings.append((token, len(blocks) - 1))
+
+    @classmethod
+    def tokens(cls, text):
+        """Токены индекса вида <вид>:<значение>"""
+        found = set()
+        for match in cls.CODE_SCAN.finditer(text):
+            if not cls._word_before(text, match.start()):
+                found.add(f"code:{match.group()}")
+        for match in cls.EXCEPTION_SCAN.finditer(text):
+            start = match.start()
+            while start > 0 and cls._word_before(text, start):
+                start -= 1
+            if start < match.start() and text[start].isupper():
+                found.add(f"exception:{text[start:match.end()]}")
+        for match in cls.ASSET_SCAN.finditer(text):
+            if not cls._word_before(text, match.start()):
+                found.add(f"asset:{match.group().rstrip('.')}")
+        for match in cls.TASK_SCAN.finditer(text):
+            found.add(f"task:{(match.group(1) or match.group(2)).rstrip('.')}")
+        return found
+
+    @classmethod
+    def _word_before(cls, text, index):
+        return index > 0 and cls.WORD.match(text[index - 1]) is not None
+
+    def search(self, term, limit=200):
+        """Строки архивов по токену: CS0246, NullReferenceException, Assets/..., ID задачи или <вид>:<значение>"""
+        token = self.parse_term(term)
+        value = token.split(':', 1)[1]
+        with self._lock:
+            if token.startswith('asset:') and value.endswith('/'):
+                rows = self._conn.execute(
+                    "SELECT DISTINCT a.path, b.offset, b.length, b.first_line FROM postings p "
+                    "JOIN archives a ON a.id = p.archive_id "
+                    "JOIN blocks b ON b.archive_id = p.archive_id AND b.block = p.block "
+                    "WHERE p.token >= ? AND p.token < ? ORDER BY a.id, b.block",
+                    (token, token[:-1] + chr(ord('/') + 1))).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT DISTINCT a.path, b.offset, b.length, b.first_line FROM postings p "
+                    "JOIN archives a ON a.id = p.archive_id "
+                    "JOIN blocks b ON b.archive_id = p.archive_id AND b.block = p.block "
+                    "WHERE p.token = ? ORDER BY a.id, b.block", (token,)).fetchall()
+
+        results = []
+        for path, offset, length, first_line in rows:
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = gzip.decompress(f.read(length))
+            except OSError:
+                continue
+            for number, line in enumerate(data.decode('utf-8', errors='replace').splitlines(), first_line + 1):
+                if value in line:
+                    results.append((path, number, line))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def task_archives(self, task_id):
+        """Архивированные логи задачи"""
+        with self._lock:
+            return [Path(row[0]) for row in self._conn.execute(
+                "SELECT path FROM archives WHERE task_id = ? OR task_id LIKE ? ORDER BY id",
+                (task_id, f"{task_id}-%"))]
+
+    def expire(self):
+        """Удаление архивов старше срока хранения"""
+        cutoff = datetime.fromtimestamp(time.time() - self.retention).isoformat()
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM archives WHERE archived_at < ?", (cutoff,)).fetchall()
+            for (path,) in rows:
+                Path(path).unlink(missing_ok=True)
+                self._drop(path)
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _drop(self, path):
+        row = self._conn.execute("SELECT id FROM archives WHERE path = ?", (path,)).fetchone()
+        if row:
+            for table in ('postings', 'blocks'):
+                self._conn.execute(f"DELETE FROM {table} WHERE archive_id = ?", (row[0],))
+            self._conn.execute("DELETE FROM archives WHERE id = ?", (row[0],))
+
+    @classmethod
+    def parse_term(cls, term):
+        """Поисковый запрос -> токен индекса"""
+        if re.match(r'^(code|exception|asset|task):', term):
+            return term
+        for kind, pattern in cls.TOKEN_PATTERNS[:3]:
+            if pattern.fullmatch(term) or (kind == 'asset' and term.startswith(('Assets/', 'Packages/'))):
+                return f"{kind}:{term}"
+        return f"task:{term}"
+
+    @staticmethod
+    def _owner_alive(path):
+        """Лог другого работающего агента (unity-agent-<pid>.log) не трогаем"""
+        match = re.match(r'^unity-agent-(\d+)\.log$', path.name)
+        if not match:
+            return False
+        try:
+            os.kill(int(match.group(1)), 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
 
 class UnityBackgroundAgent:
-    def __init__(self, project_path="/home/egor/github/Mud-Like", unity_path=None):
+    # Политики типов задач: in_place - только в основном проекте,
+    # exclusive - не запускается параллельно с другими задачами,
+    # cpus/memory_mb - оценка ресурсов для допуска, timeout - лимит времени (сек);
+    # cpus, memory_mb и timeout можно переопределить в params задачи
+    TASK_POLICIES = {
+        'build': {'in_place': False, 'exclusive': False, 'cpus': 4, 'memory_mb': 8192, 'timeout': 4 * 3600},
+        'test': {'in_place': False, 'exclusive': False, 'cpus': 2, 'memory_mb': 4096, 'timeout': 2 * 3600},
+        'compile': {'in_place': False, 'exclusive': False, 'cpus': 2, 'memory_mb': 4096, 'timeout': 3600},
+        # Импорт меняет Assets основного проекта, копии воркеров синхронизируются из него
+        'import': {'in_place': True, 'exclusive': True, 'cpus': 2, 'memory_mb': 4096, 'timeout': 2 * 3600},
+    }
+    DEFAULT_POLICY = {'in_place': True, 'exclusive': True, 'cpus': 1, 'memory_mb': 1024, 'timeout': 3600}
+    # Типы задач, результат которых определяется только входами проекта
+    INCREMENTAL_TYPES = ('compile', 'build')
+    
+    def __init__(self, project_path="/home/egor/github/Mud-Like", unity_path=None,
+                 drop_dir=None, poll_interval=1.0, idle_timeout=60,
+                 workers=1, workspace_root=None, warm_editors=False,
+                 editor_max_tasks=20, editor_max_memory_mb=8192, max_test_shards=4,
+                 memory_reserve_mb=1024, resource_retry=5, metrics_port=None,
+                 rpc_socket=None, rpc_port=None, max_queue_depth=100, library_snapshots=3,
+                 artifact_store=None, artifact_store_gb=50, artifact_store_builds=20,
+                 log_max_age_hours=24, log_max_mb=512, log_retention_days=30, log_rotate_interval=600):
         self.project_path = Path(project_path)
-        self.unity_path = unity_path or self._find_unity_path()
         self.agent_id = f"unity-agent-{os.getpid()}"
         self.running = False
-        self.tasks = []
+        self.tail_lines = 200
+        self._progress = {}
+        
+        # Допуск по ресурсам, дочерние процессы Unity (для таймаутов и отмены)
+        self.memory_reserve_mb = memory_reserve_mb
+        self.resource_retry = resource_retry
+        self._resource_wait = False
+        self._resource_waiting = set()
+        self._processes = {}
+        self._processes_lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._cancelled = set()
+        self._resident_runs = {}
+        self._usage = {}
+        
+        # Источники задач и пробуждение основного цикла
+        self.tasks_file = self.project_path / "agent-tasks.json"
+        self.drop_dir = Path(drop_dir) if drop_dir else self.project_path / "agent-tasks.d"
+        self.idle_timeout = idle_timeout
+        self._wakeup = threading.Event()
         
         # Настройка логирования
         self.setup_logging()
+        self._task_reader = TaskFileReader(self.tasks_file, self.logger)
+        self.unity_path = unity_path or self._find_unity_path()
+        
+        # Ротация и индекс логов
+        self.log_archive = LogArchive(self.project_path / "Logs", self.logger, log_max_age_hours,
+                                      log_max_mb, log_retention_days)
+        self.log_rotate_interval = log_rotate_interval
+        self._maintenance = None
+        
+        # Персистентная очередь задач
+        self.queue = TaskQueue(self.project_path / "Logs" / "Agents" / "agent-queue.db")
+        # Инкрементальный пропуск compile/build при неизменных входах
+        self.inputs = InputManifest(self.project_path, self.project_path / "Logs" / "Agents" / "input-manifest.json")
+        self.incremental = IncrementalCache(self.project_path / "Logs" / "Agents" / "incremental.json")
+        # История сборок с дедупликацией (0 ГБ - отключено)
+        self.artifacts = None
+        if artifact_store_gb > 0:
+            self.artifacts = ArtifactStore(
+                artifact_store or self.project_path.parent / f"{self.project_path.name}-agent-artifacts",
+                self.logger, max_bytes=int(artifact_store_gb * 1024 ** 3), max_builds=artifact_store_builds)
+        
+        # Метрики задач (сохраняются между перезапусками) и HTTP-эндпоинт
+        self.metrics = AgentMetrics(self.project_path / "Logs" / "Agents" / "agent-metrics.json")
+        self.metrics_port = metrics_port
+        self._metrics_server = None
+        
+        # Локальный RPC для отправки задач (вместо общего agent-tasks.json)
+        self.rpc_socket = Path(rpc_socket) if rpc_socket else self.project_path / "Logs" / "Agents" / "agent.sock"
+        self.rpc_port = rpc_port
+        self.max_queue_depth = max_queue_depth
+        self._rpc_server = None
+        
+        recovered = self.queue.recover()
+        if recovered:
+            self.logger.info(f"Возобновлено прерванных задач: {recovered}")
+        
+        # Пул воркеров; при одном воркере без резидентных редакторов задачи выполняются прямо в проекте
+        self.workers = max(1, workers)
+        self._pool = None
+        self._running_tasks = {}
+        self._running_lock = threading.Lock()
+        self.workspaces = None
+        self.workspace_root = Path(workspace_root or self.project_path.parent / f"{self.project_path.name}-agent-workspaces")
+        if self.workers > 1 or warm_editors:
+            self.workspaces = WorkspaceManager(self.project_path, self.workspace_root, self.workers, self.logger)
+        
+        # Отдельные копии проекта для параллельных шардов тестов
+        self.max_test_shards = max(1, max_test_shards)
+        self.shard_workspaces = WorkspaceManager(self.project_path, self.workspace_root,
+                                                 self.max_test_shards, self.logger, prefix='shard')
+        
+        # Снимки Library/ по платформам сборки (0 - отключено)
+        self.library_snapshots = LibrarySnapshots(self.logger, library_snapshots) if library_snapshots > 0 else None
+        
+        # Виртуальные дисплеи: свой для каждого одновременно работающего процесса Unity
+        self.displays = DisplayPool(self.logger)
+        
+        # Резидентные редакторы в копиях воркеров (без холодного старта на каждую задачу)
+        self.editors = None
+        if warm_editors:
+            self.editors = EditorPool(self.unity_path, self.logger, editor_max_tasks, editor_max_memory_mb,
+                                      displays=self.displays)
+        
+        self.drop_dir.mkdir(parents=True, exist_ok=True)
+        self._watcher = TaskSourceWatcher(self.tasks_file, self.drop_dir, self._wakeup,
+                                          self.logger, poll_interval)
         
         # Настройка окружения для headless режима
         self.setup_environment()
@@ -38,23 +2661,28 @@ class UnityBackgroundAgent:
             level=logging.INFO,
             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
             handlers=[
-                logging.FileHandler(log_dir / f"{self.agent_id}.log"),
+                self._rotating_handler(log_dir / f"{self.agent_id}.log"),
                 logging.StreamHandler()
             ]
         )
         self.logger = logging.getLogger(self.agent_id)
         
+    @staticmethod
+    def _rotating_handler(path, max_bytes=50 * 1024 * 1024):
+        """Лог агента по размеру переименовывается в <имя>-<время>.log и затем попадает в архив"""
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=1)
+        handler.rotator = lambda source, _dest: os.rename(
+            source, f"{source[:-len('.log')]}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+        return handler
+        
     def setup_environment(self):
         """Настройка окружения для headless режима"""
         # Установка переменных окружения для headless режима
-        os.environ['DISPLAY'] = ':99'
+        # DISPLAY задается каждому процессу Unity из пула виртуальных дисплеев
         os.environ['UNITY_HEADLESS'] = '1'
         os.environ['UNITY_BATCHMODE'] = '1'
         os.environ['UNITY_QUIT'] = '1'
         
-        # Создание виртуального дисплея если нужно
-        self._ensure_virtual_display()
-        
     def _find_unity_path(self):
         """Поиск пути к Unity Editor"""
         possible_paths = [
@@ -94,21 +2722,6 @@ class UnityBackgroundAgent:
         self.logger.warning("Unity Editor не найден, попробуйте указать путь вручную")
         return None
         
-    def _ensure_virtual_display(self):
-        """Обеспечение наличия виртуального дисплея"""
-        try:
-            # Проверка, запущен ли Xvfb
-            result = subprocess.run(['pgrep', '-f', 'Xvfb'], capture_output=True)
-            if result.returncode != 0:
-                self.logger.info("Запуск виртуального дисплея...")
-                # Запуск Xvfb в фоне
-                subprocess.Popen([
-                    'Xvfb', ':99', '-screen', '0', '1024x768x24', '-ac'
-                ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                time.sleep(2)  # Даем время на запуск
-        except Exception as e:
-            self.logger.warning(f"Не удалось запустить виртуальный дисплей: {e}")
-            
     def start(self):
         """Запуск агента"""
         self.running = True
@@ -118,19 +2731,63 @@ class UnityBackgroundAgent:
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
         
+        # Запуск наблюдения за источниками задач и пула воркеров
+        self._watcher.start()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='unity-worker')
+        if self.metrics_port:
+            self._metrics_server = MetricsServer(self, self.metrics_port)
+            self._metrics_server.start()
+            self.logger.info(f"Метрики: http://127.0.0.1:{self.metrics_port}/metrics")
+        self._maintenance = threading.Thread(target=self._maintenance_loop, name='log-rotation', daemon=True)
+        self._maintenance.start()
+        self._rpc_server = AgentRPCServer(self, self.rpc_socket, self.rpc_port, self.max_queue_depth)
+        self._rpc_server.start()
+        self.logger.info(f"RPC: {self.rpc_socket}" + (f", 127.0.0.1:{self.rpc_port}" if self.rpc_port else ""))
+        
         # Запуск основного цикла
-        self._main_loop()
+        try:
+            self._main_loop()
+        finally:
+            self._watcher.stop()
+            self._rpc_server.stop()
+            if self._metrics_server:
+                self._metrics_server.stop()
+            self._pool.shutdown(wait=True)
+            if self.editors:
+                self.editors.shutdown()
+            self.displays.shutdown()
+            self.queue.close()
+            self.log_archive.close()
         
     def stop(self):
-        """Остановка агента"""
+        """Остановка агента с завершением дочерних процессов Unity"""
         self.running = False
+        self._wakeup.set()
         self.logger.info("Остановка бэкграунд агента")
+        with self._processes_lock:
+            processes = list(self._processes.values())
+        for process in processes:
+            self._kill_process_group(process)
         
     def _signal_handler(self, signum, frame):
         """Обработчик сигналов"""
         self.logger.info(f"Получен сигнал {signum}, остановка агента...")
         self.stop()
         
+    def _maintenance_loop(self):
+        """Периодическая ротация логов в отдельном потоке"""
+        while self.running:
+            try:
+                active = [status['log'] for status in list(self._progress.values())]
+                active.append(self.project_path / "Logs" / "Agents" / f"{self.agent_id}.log")
+                self.log_archive.rotate(active)
+            except Exception as e:
+                self.logger.error(f"Ошибка ротации логов: {e}")
+            for _ in range(int(self.log_rotate_interval)):
+                if not self.running:
+                    return
+                time.sleep(1)
+            
     def _main_loop(self):
         """Основной цикл агента"""
         while self.running:
@@ -141,126 +2798,480 @@ class UnityBackgroundAgent:
                 # Выполнение задач
                 self._execute_tasks()
                 
-                # Ожидание
-                time.sleep(5)
+                # Ожидание изменений в источниках задач (или освобождения ресурсов)
+                self._wakeup.wait(self.resource_retry if self._resource_wait else self.idle_timeout)
+                self._wakeup.clear()
                 
             except KeyboardInterrupt:
                 break
             except Exception as e:
                 self.logger.error(f"Ошибка в основном цикле: {e}")
-                time.sleep(10)
+                self._wakeup.wait(10)
                 
     def _check_tasks(self):
         """Проверка новых задач"""
-        tasks_file = self.project_path / "agent-tasks.json"
+        new_tasks = []
         
-        if tasks_file.exists():
+        try:
+            new_tasks.extend(self._task_reader.read_new())
+        except Exception as e:
+            self.logger.error(f"Ошибка чтения задач: {e}")
+            
+        new_tasks.extend(self._read_drop_dir())
+        
+        # Каждая задача проверяется отдельно: ошибка одной не теряет остальные уже прочитанные
+        for task in new_tasks:
+            if not isinstance(task, dict):
+                self.logger.warning(f"Пропущена некорректная задача: {task}")
+                continue
             try:
-                with open(tasks_file, 'r') as f:
-                    new_tasks = json.load(f)
-                    
-                for task in new_tasks:
-                    if task not in self.tasks:
-                        self.tasks.append(task)
-                        self.logger.info(f"Новая задача: {task}")
-                        
+                self.submit(task)
             except Exception as e:
-                self.logger.error(f"Ошибка чтения задач: {e}")
+                self.logger.error(f"Задача отклонена: {e}: {task}")
                 
-    def _execute_tasks(self):
-        """Выполнение задач"""
-        for task in self.tasks[:]:  # Копия списка для безопасного удаления
+    def submit(self, task, max_pending=None):
+        """Прием задачи из любого источника: обычная задача, пайплайн или {"cancel": id}
+
+        Возвращает (ID, добавлена ли); ID None - задача отклонена.
+        max_pending - лимит ожидающих задач (TaskQueue.Full сверх него), отмена принимается всегда.
+        """
+        if 'cancel' in task:
+            return str(task['cancel']), self.cancel_task(str(task['cancel']))
+        if task.get('type') == 'pipeline':
+            task_id, added = self._add_pipeline(task, max_pending)
+        else:
+            task_id, added = self.queue.add(task, max_pending)
+            if added:
+                self.logger.info(f"Новая задача {task_id}: {task}")
+        self._wakeup.set()
+        return task_id, added
+                
+    def _add_pipeline(self, pipeline, max_pending=None):
+        """Постановка графа задач в очередь; возвращает (ID пайплайна, добавлен ли)"""
+        try:
+            pipeline_id, nodes = self.queue.add_pipeline(pipeline, max_pending)
+        except ValueError as e:
+            self.logger.error(f"Некорректный пайплайн {pipeline.get('id', '')}: {e}")
+            return None, False
+        added = any(added for _, added in nodes)
+        if added:
+            self.logger.info(f"Новый пайплайн {pipeline_id}: {', '.join(task_id for task_id, _ in nodes)}")
+        return pipeline_id, added
+        
+    def _read_drop_dir(self):
+        """Чтение и удаление файлов задач из drop-каталога"""
+        tasks = []
+        for path in sorted(self.drop_dir.glob('*.json')):
+            if path.name.startswith('.'):
+                continue
             try:
-                self._execute_task(task)
-                self.tasks.remove(task)
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                path.unlink()
+            except FileNotFoundError:
+                continue
             except Exception as e:
-                self.logger.error(f"Ошибка выполнения задачи {task}: {e}")
+                self.logger.error(f"Ошибка чтения задачи {path.name}: {e}")
+                continue
+            tasks.extend(data if isinstance(data, list) else [data])
+        return tasks
                 
+    def _execute_tasks(self):
+        """Раздача задач воркерам с учетом совместимости типов и свободных ресурсов"""
+        self._resource_wait = False
+        while self.running:
+            with self._running_lock:
+                if len(self._running_tasks) >= self.workers:
+                    break
+            task = self.queue.claim_next(admit=self._can_start)
+            if task is None:
+                break
+            with self._running_lock:
+                self._running_tasks[task['id']] = task
+            self._pool.submit(self._run_task, task)
+            
+    def _can_start(self, task):
+        """Можно ли запустить задачу рядом с уже выполняющимися"""
+        with self._running_lock:
+            running = list(self._running_tasks.values())
+        if running:
+            if self._policy(task['type'])['exclusive']:
+                return False
+            if any(self._policy(t['type'])['exclusive'] for t in running):
+                return False
+        return self._resources_available(task, running)
+        
+    def _resources_available(self, task, running):
+        """Допуск по свободным ядрам и памяти с учетом еще не набравших память задач"""
+        need_cpus = self._estimate(task, 'cpus')
+        need_memory = self._estimate(task, 'memory_mb')
+        
+        reserved_cpus = sum(self._estimate(t, 'cpus') for t in running)
+        external_load = max(0.0, SystemResources.load_average() - reserved_cpus)
+        free_cpus = SystemResources.cpu_count() - reserved_cpus - external_load
+        
+        # Память, которую запущенные задачи еще займут по оценке
+        ramp_up = 0.0
+        for t in running:
+            rss = sum(SystemResources.process_rss_mb(p.pid) for p in self._task_processes(t['id']))
+            ramp_up += max(0.0, self._estimate(t, 'memory_mb') - rss)
+        free_memory = SystemResources.memory_available_mb() - ramp_up - self.memory_reserve_mb
+        
+        fits = free_cpus >= need_cpus and free_memory >= need_memory
+        # Простаивающий агент всегда берет одну задачу: оценка может превышать память машины,
+        # а ожидание головной задачи блокировало бы и всю очередь за ней
+        if fits or not running:
+            if not fits:
+                self.logger.warning(f"Задача {task['id']} ({task['type']}) запускается одна, ресурсов меньше оценки: "
+                                    f"ядер {free_cpus:.1f}/{need_cpus}, память {free_memory:.0f}/{need_memory} МБ")
+            self._resource_waiting.discard(task['id'])
+            return True
+        if task['id'] not in self._resource_waiting:
+            self._resource_waiting.add(task['id'])
+            self.logger.info(f"Задача {task['id']} ({task['type']}) ожидает ресурсы: "
+                             f"ядер {free_cpus:.1f}/{need_cpus}, память {free_memory:.0f}/{need_memory} МБ")
+        self._resource_wait = True
+        return False
+        
+    def _policy(self, task_type):
+        """Политика выполнения для типа задачи"""
+        return self.TASK_POLICIES.get(task_type, self.DEFAULT_POLICY)
+        
+    def _estimate(self, task, key):
+        """Оценка ресурса задачи: params задачи или политика ее типа"""
+        value = task.get('params', {}).get(key)
+        return value if value is not None else self._policy(task['type'])[key]
+        
+    def _timeout(self, task_type, params):
+        """Лимит времени задачи (сек)"""
+        return params.get('timeout') or self._policy(task_type)['timeout']
+        
+    def _run_task(self, task):
+        """Выполнение задачи в воркере с фиксацией результата"""
+        started = time.time()
+        ok = False
+        try:
+            ok = self._execute_task(task)
+            if task['id'] in self._cancelled:
+                self.queue.finish(task['id'], False, 'cancelled', status=TaskQueue.CANCELLED)
+            elif self.running:
+                skipped = self.queue.finish(task['id'], ok)
+                if skipped:
+                    self.logger.warning(f"Задача {task['id']} не выполнена, пропущены зависимые: {', '.join(skipped)}")
+            # При остановке агента задача остается running и вернется в очередь при запуске
+        except Exception as e:
+            self.logger.error(f"Ошибка выполнения задачи {task['id']}: {e}")
+            self.queue.finish(task['id'], False, str(e))
+        finally:
+            self._record_metrics(task, started, ok)
+            with self._running_lock:
+                self._running_tasks.pop(task['id'], None)
+            self._cancelled.discard(task['id'])
+            self._wakeup.set()
+            
+    def _record_metrics(self, task, started, ok):
+        """Метрики задачи: ожидание в очереди, длительность, пиковая память и CPU процессов Unity"""
+        runs = [self._usage.pop(run_id) for run_id in list(self._usage)
+                if run_id == task['id'] or run_id.startswith(f"{task['id']}-")]
+        try:
+            created = datetime.fromisoformat(task['created_at']).timestamp()
+            queue_wait = max(0.0, started - created)
+        except (KeyError, TypeError, ValueError):
+            queue_wait = None
+            
+        if runs:
+            exit_code = next((r['exit_code'] for r in runs if r['exit_code'] != 0), 0)
+        else:
+            # Без процесса Unity: результат из инкрементального кэша или ошибка до запуска
+            exit_code = 0 if ok else 'error'
+        peaks = [r['peak_rss_bytes'] for r in runs if r.get('peak_rss_bytes') is not None]
+        cpu = [r['cpu_seconds'] for r in runs if r.get('cpu_seconds') is not None]
+        self.metrics.observe(
+            task['type'], exit_code,
+            queue_wait_seconds=queue_wait,
+            duration_seconds=time.time() - started,
+            peak_rss_bytes=max(peaks) if peaks else None,
+            cpu_seconds=sum(cpu) if cpu else None)
+            
+    def get_metrics(self):
+        """Агрегированные метрики задач (in-process API)"""
+        return self.metrics.snapshot()
+            
+    def cancel_task(self, task_id):
+        """Отмена задачи: ожидающая помечается cancelled, выполняющаяся завершается"""
+        if self.queue.cancel_pending(task_id):
+            self.logger.info(f"Задача {task_id} отменена до запуска")
+            return True
+        with self._running_lock:
+            running = task_id in self._running_tasks
+        if not running:
+            return False
+        self._cancelled.add(task_id)
+        self.logger.info(f"Отмена выполняющейся задачи {task_id}")
+        for process in self._task_processes(task_id):
+            self._kill_process_group(process)
+        editor = self._resident_runs.get(task_id)
+        if editor is not None:
+            self.editors.discard(editor)
+        return True
+        
+    def _task_processes(self, task_id):
+        """Процессы Unity задачи (включая шарды тестов вида <id>-sN)"""
+        with self._processes_lock:
+            return [p for run_id, p in self._processes.items()
+                    if run_id == task_id or run_id.startswith(f"{task_id}-")]
+        
+    def _kill_process_group(self, process, grace=10):
+        """SIGTERM группе процессов Unity, SIGKILL если не завершилась за grace секунд"""
+        if process.poll() is not None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(timeout=grace)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+            
     def _execute_task(self, task):
         """Выполнение конкретной задачи"""
         task_type = task.get('type')
+        params = task.get('params', {})
+        
+        cache_key = None
+        artifact_key = None
+        build_dir = self.project_path / params.get('build_path', 'Builds') if task_type == 'build' else None
+        if task_type in self.INCREMENTAL_TYPES:
+            artifact_key = IncrementalCache.key(task_type, params, self.inputs.digest(), self.unity_path)
+        if artifact_key and not params.get('force'):
+            cache_key = artifact_key
+            record = self.incremental.lookup(cache_key)
+            if record:
+                self.logger.info(f"Задача {task['id']} ({task_type}): входы не изменились с "
+                                 f"{record['finished_at']}, используется результат {record.get('artifact') or ''}")
+                return True
+            # Каталог сборки переписан другой сборкой, но нужная есть в хранилище
+            if build_dir and self.artifacts and self.artifacts.has(cache_key):
+                self.artifacts.checkout(cache_key, build_dir, replace=True)
+                self.incremental.store(cache_key, task_type, build_dir)
+                return True
+                
+        if self.workspaces is None or self._policy(task_type)['in_place']:
+            ok = self._dispatch_task(task, self.project_path)
+        else:
+            # Узел пайплайна идет в копию, где выполнялись его зависимости: Library и скомпилированные сборки уже там
+            upstream = [self.queue.get(dep) for dep in task.get('depends_on', [])]
+            workspace = self.workspaces.acquire(prefer=[t['workspace'] for t in upstream if t and t.get('workspace')])
+            if task.get('pipeline'):
+                self.queue.set_workspace(task['id'], workspace)
+            try:
+                ok = self._dispatch_task(task, workspace)
+            finally:
+                self.workspaces.release(workspace)
+                
+        if build_dir:
+            ok = self._publish_build(task['id'], build_dir, ok)
+        if ok and build_dir and self.artifacts and build_dir.exists():
+            self.artifacts.put(artifact_key, build_dir, {'task_id': task['id'], 'params': params,
+                                                        'inputs': self.inputs.digest()})
+        if ok and cache_key:
+            self.incremental.store(cache_key, task_type, build_dir)
+        return ok
+            
+    def _build_staging(self, task_id, params):
+        """Свой -buildPath для каждой задачи: параллельные сборки не пишут в один каталог"""
+        build_path = Path(params.get('build_path', 'Builds'))
+        staging = self.workspace_root / "builds" / task_id
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+        return staging / build_path.name
+
+    def _publish_build(self, task_id, build_dir, ok):
+        """Перенос успешной сборки из каталога задачи в запрошенный build_path
+
+        Unity кладет рядом с исполняемым файлом каталоги данных, поэтому переносится все содержимое
+        каталога задачи в родителя build_path с заменой одноименных записей.
+        """
+        staging = self.workspace_root / "builds" / task_id
+        try:
+            if not ok or not staging.exists():
+                return ok
+            with self._publish_lock:
+                build_dir.parent.mkdir(parents=True, exist_ok=True)
+                for entry in staging.iterdir():
+                    target = build_dir.parent / entry.name
+                    if target.is_dir() and not target.is_symlink():
+                        shutil.rmtree(target)
+                    elif target.exists() or target.is_symlink():
+                        target.unlink()
+                    shutil.move(str(entry), str(target))
+            self.logger.info(f"Сборка {task_id} перенесена в {build_dir}")
+            return True
+        except OSError as e:
+            self.logger.error(f"Не удалось перенести сборку {task_id} в {build_dir}: {e}")
+            return False
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _dispatch_task(self, task, project_path):
+        """Вызов исполнителя задачи для указанной копии проекта"""
+        task_type = task.get('type')
         task_params = task.get('params', {})
         
-        self.logger.info(f"Выполнение задачи: {task_type}")
+        self.logger.info(f"Выполнение задачи {task.get('id')}: {task_type} в {project_path}")
         
+        # Шардированные тесты идут в отдельные копии проекта, резидентный редактор одной копии их не выполнит
+        sharded = task_type == 'test' and self._test_shards(task_params) > 1
+        if self.editors and project_path != self.project_path and task_type in ResidentEditor.TASK_TYPES and not sharded:
+            return self._execute_resident(task, project_path)
+            
         if task_type == 'build':
-            self._execute_build(task_params)
+            return self._execute_build(task_params, project_path, task['id'])
         elif task_type == 'test':
-            self._execute_test(task_params)
+            return self._execute_test(task_params, project_path, task['id'])
         elif task_type == 'compile':
-            self._execute_compile(task_params)
+            return self._execute_compile(task_params, project_path, task['id'])
         elif task_type == 'import':
-            self._execute_import(task_params)
+            return self._execute_import(task_params, project_path, task['id'])
         else:
             self.logger.warning(f"Неизвестный тип задачи: {task_type}")
+            return False
             
-    def _execute_build(self, params):
+    def _execute_build(self, params, project_path, task_id):
         """Выполнение сборки"""
         platform = params.get('platform', 'Linux64')
-        build_path = params.get('build_path', 'Builds')
+        build_path = self._build_staging(task_id, params)
+        
+        # Library/ под целевую платформу из снимка вместо реимпорта при смене платформы
+        if self.library_snapshots:
+            self.library_snapshots.activate(project_path, platform)
         
         cmd = [
             self.unity_path,
             '-batchmode',
             '-quit',
-            '-projectPath', str(self.project_path),
+            '-projectPath', str(project_path),
             '-buildTarget', platform,
-            '-buildPath', str(self.project_path / build_path),
-            '-logFile', str(self.project_path / "Logs" / f"build-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+            '-buildPath', str(build_path),
+            '-logFile', '-'
         ]
         
         self.logger.info(f"Выполнение сборки: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        returncode, tail = self._run_unity(cmd, task_id, self._artifact_path("build", task_id, "log"),
+                                           self._timeout('build', params))
         
-        if result.returncode == 0:
+        if returncode == 0:
             self.logger.info("Сборка выполнена успешно")
         else:
-            self.logger.error(f"Ошибка сборки: {result.stderr}")
+            self.logger.error(f"Ошибка сборки (код: {returncode}):\n{tail}")
+        return returncode == 0
             
-    def _execute_test(self, params):
+    def _execute_test(self, params, project_path, task_id):
         """Выполнение тестов"""
         test_filter = params.get('filter', '')
+        shards = self._test_shards(params)
+        if shards > 1:
+            return self._execute_sharded_test(params, task_id, shards)
         
         cmd = [
             self.unity_path,
             '-batchmode',
             '-quit',
-            '-projectPath', str(self.project_path),
+            '-projectPath', str(project_path),
             '-runTests',
-            '-testResults', str(self.project_path / "Logs" / f"test-results-{datetime.now().strftime('%Y%m%d-%H%M%S')}.xml"),
-            '-logFile', str(self.project_path / "Logs" / f"test-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+            '-testResults', str(self._artifact_path("test-results", task_id, "xml")),
+            '-logFile', '-'
         ]
         
         if test_filter:
             cmd.extend(['-testFilter', test_filter])
             
         self.logger.info(f"Выполнение тестов: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        returncode, tail = self._run_unity(cmd, task_id, self._artifact_path("test", task_id, "log"),
+                                           self._timeout('test', params))
         
-        if result.returncode == 0:
+        if returncode == 0:
             self.logger.info("Тесты выполнены успешно")
         else:
-            self.logger.error(f"Ошибка тестов: {result.stderr}")
+            self.logger.error(f"Ошибка тестов (код: {returncode}):\n{tail}")
+        return returncode == 0
             
-    def _execute_compile(self, params):
+    def _execute_sharded_test(self, params, task_id, shards):
+        """Параллельный прогон тестов шардами в отдельных копиях проекта с общим NUnit XML"""
+        planner = TestShardPlanner(self.project_path / params.get('tests_dir', 'Assets/Scripts/Tests'),
+                                   self.project_path / "Logs")
+        tests = planner.discover()
+        if params.get('filter'):
+            pattern = re.compile(params['filter'])
+            tests = [t for t in tests if pattern.search(t)]
+        plan = planner.plan(tests, shards)
+        if not plan:
+            self.logger.warning("Тесты для шардирования не найдены")
+            return False
+        self.logger.info(f"Шардирование тестов: {len(tests)} тестов в {len(plan)} шардах")
+        
+        def run_shard(index, names):
+            shard_id = f"{task_id}-s{index}"
+            results_path = self._artifact_path("test-results-shard", shard_id, "xml")
+            workspace = self.shard_workspaces.acquire()
+            try:
+                cmd = [
+                    self.unity_path,
+                    '-batchmode',
+                    '-quit',
+                    '-projectPath', str(workspace),
+                    '-runTests',
+                    '-testResults', str(results_path),
+                    '-testFilter', TestShardPlanner.test_filter(names),
+                    '-logFile', '-'
+                ]
+                returncode, tail = self._run_unity(cmd, shard_id, self._artifact_path("test", shard_id, "log"),
+                                                   self._timeout('test', params))
+            finally:
+                self.shard_workspaces.release(workspace)
+            if returncode != 0:
+                self.logger.error(f"Ошибка шарда {index} (код: {returncode}):\n{tail}")
+            return results_path, returncode == 0
+            
+        with ThreadPoolExecutor(max_workers=len(plan), thread_name_prefix='test-shard') as pool:
+            outcomes = list(pool.map(run_shard, range(len(plan)), plan))
+            
+        merged_path = self._artifact_path("test-results", task_id, "xml")
+        passed = TestShardPlanner.merge_results([p for p, _ in outcomes if p.exists()], merged_path)
+        for shard_results, _ in outcomes:
+            if shard_results.exists():
+                shard_results.unlink()
+        ok = passed and all(shard_ok for _, shard_ok in outcomes)
+        
+        if ok:
+            self.logger.info(f"Тесты выполнены успешно: {merged_path}")
+        else:
+            self.logger.error(f"Ошибка тестов, результаты: {merged_path}")
+        return ok
+            
+    def _execute_compile(self, params, project_path, task_id):
         """Выполнение компиляции"""
         cmd = [
             self.unity_path,
             '-batchmode',
             '-quit',
-            '-projectPath', str(self.project_path),
-            '-logFile', str(self.project_path / "Logs" / f"compile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+            '-projectPath', str(project_path),
+            '-logFile', '-'
         ]
         
         self.logger.info(f"Выполнение компиляции: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        returncode, tail = self._run_unity(cmd, task_id, self._artifact_path("compile", task_id, "log"),
+                                           self._timeout('compile', params))
         
-        if result.returncode == 0:
+        if returncode == 0:
             self.logger.info("Компиляция выполнена успешно")
         else:
-            self.logger.error(f"Ошибка компиляции: {result.stderr}")
+            self.logger.error(f"Ошибка компиляции (код: {returncode}):\n{tail}")
+        return returncode == 0
             
-    def _execute_import(self, params):
+    def _execute_import(self, params, project_path, task_id):
         """Выполнение импорта ассетов"""
         asset_path = params.get('asset_path', '')
         
@@ -268,37 +3279,226 @@ class UnityBackgroundAgent:
             self.unity_path,
             '-batchmode',
             '-quit',
-            '-projectPath', str(self.project_path),
+            '-projectPath', str(project_path),
             '-importPackage', asset_path,
-            '-logFile', str(self.project_path / "Logs" / f"import-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+            '-logFile', '-'
         ]
         
         self.logger.info(f"Выполнение импорта: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        returncode, tail = self._run_unity(cmd, task_id, self._artifact_path("import", task_id, "log"),
+                                           self._timeout('import', params))
         
-        if result.returncode == 0:
+        if returncode == 0:
             self.logger.info("Импорт выполнен успешно")
         else:
-            self.logger.error(f"Ошибка импорта: {result.stderr}")
+            self.logger.error(f"Ошибка импорта (код: {returncode}):\n{tail}")
+        return returncode == 0
             
-    def add_task(self, task_type, params=None):
+    def _test_shards(self, params):
+        """Число шардов задачи test с учетом --max-test-shards"""
+        return min(int(params.get('shards', 1)), self.max_test_shards)
+
+    def _execute_resident(self, task, project_path):
+        """Выполнение задачи в резидентном редакторе копии проекта"""
+        task_type = task['type']
+        params = task.get('params', {})
+        command = {'type': task_type}
+        
+        if task_type == 'build':
+            platform = params.get('platform', 'Linux64')
+            command['target'] = ResidentEditor.BUILD_TARGETS.get(platform, platform)
+            command['buildPath'] = str(self._build_staging(task['id'], params))
+            # Снимок Library нужной платформы подменяется только при закрытом редакторе
+            if self.library_snapshots and self.library_snapshots.active_target(project_path) != platform:
+                self.editors.close(project_path)
+                self.library_snapshots.activate(project_path, platform)
+        elif task_type == 'test':
+            command['filter'] = params.get('filter', '')
+            command['resultsPath'] = str(self._artifact_path("test-results", task['id'], "xml"))
+            
+        editor = None
+        try:
+            editor = self.editors.get(project_path)
+            self._resident_runs[task['id']] = editor
+            ok, error = editor.run(command, timeout=self._timeout(task_type, params))
+            self._usage[task['id']] = {'exit_code': 0 if ok else 1,
+                                       'peak_rss_bytes': editor.rss_mb() * 1024 * 1024}
+        except (OSError, RuntimeError, ValueError) as e:
+            ok, error = False, str(e)
+            # Зависший редактор не переиспользуется
+            if editor is not None and isinstance(e, TimeoutError):
+                self.editors.discard(editor)
+        finally:
+            self._resident_runs.pop(task['id'], None)
+            if editor is not None:
+                self.editors.release(editor)
+                
+        if ok:
+            self.logger.info(f"Задача {task['id']} ({task_type}) выполнена в резидентном редакторе")
+        else:
+            self.logger.error(f"Ошибка задачи {task['id']} ({task_type}) в резидентном редакторе: {error}")
+        return ok
+        
+    def _run_unity(self, cmd, task_id, log_path, timeout=None):
+        """Запуск Unity с построчной записью вывода в лог задачи и разбором прогресса
+        
+        В памяти остается только хвост вывода для отчета об ошибке.
+        Unity запускается в своей группе процессов: по таймауту или отмене
+        завершается вся группа. Возвращает (код возврата, хвост лога).
+        """
+        parser = UnityProgressParser()
+        analyzer = UnityLogAnalyzer()
+        tail = deque(maxlen=self.tail_lines)
+        status = {'phase': 'starting', 'detail': '', 'lines': 0, 'errors': 0,
+                  'log': str(log_path), 'last_output_at': time.time()}
+        
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(log_path, 'w', encoding='utf-8', buffering=1) as log_file:
+            display = self.displays.acquire()
+            try:
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           text=True, errors='replace', bufsize=1, start_new_session=True,
+                                           env=DisplayPool.env(display))
+            except Exception:
+                self.displays.release(display)
+                raise
+            # Прогресс публикуется только для запущенного процесса: при ошибке запуска не остается записи
+            with self._processes_lock:
+                self._processes[task_id] = process
+            self._progress[task_id] = status
+            timed_out = threading.Event()
+            
+            def on_timeout():
+                timed_out.set()
+                self.logger.error(f"Задача {task_id} превысила лимит {timeout} с, завершение")
+                self._kill_process_group(process)
+                
+            timer = threading.Timer(timeout, on_timeout) if timeout else None
+            if timer:
+                timer.daemon = True
+                timer.start()
+            try:
+                for line in process.stdout:
+                    log_file.write(line)
+                    line = line.rstrip('\n')
+                    tail.append(line)
+                    status['lines'] += 1
+                    status['last_output_at'] = time.time()
+                    analyzer.feed(line, status['last_output_at'])
+                    if parser.ERROR_PATTERN.search(line):
+                        status['errors'] += 1
+                    progress = parser.feed(line)
+                    if progress:
+                        if progress[0] != status['phase']:
+                            self.logger.info(f"Задача {task_id}: этап {progress[0]} ({progress[1]})")
+                        status['phase'], status['detail'] = progress
+            finally:
+                if timer:
+                    timer.cancel()
+                process.stdout.close()
+                returncode, usage = self._wait_with_usage(process)
+                self.displays.release(display)
+                self._usage[task_id] = {
+                    'exit_code': returncode,
+                    'peak_rss_bytes': usage.ru_maxrss * 1024 if usage else None,
+                    'cpu_seconds': usage.ru_utime + usage.ru_stime if usage else None,
+                }
+                with self._processes_lock:
+                    self._processes.pop(task_id, None)
+                self._progress.pop(task_id, None)
+        if timed_out.is_set():
+            tail.append(f"[agent] timeout after {timeout}s")
+        self._write_log_summary(log_path, analyzer.summary(task_id=task_id, log=str(log_path),
+                                                            returncode=returncode,
+                                                            finished_at=datetime.now().isoformat()))
+        return returncode, '\n'.join(tail)
+        
+    def _write_log_summary(self, log_path, summary):
+        """Сводка по логу задачи рядом с ним: Logs/<тип>-<время>-<id>.summary.json"""
+        try:
+            with open(log_path.with_suffix('.summary.json'), 'w') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.logger.warning(f"Не удалось записать сводку лога {log_path}: {e}")
+        
+    @staticmethod
+    def _wait_with_usage(process):
+        """Ожидание процесса с rusage (пиковая память и CPU, включая дочерние процессы Unity)"""
+        if not hasattr(os, 'wait4'):
+            return process.wait(), None
+        try:
+            _pid, status, usage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            return process.wait(), None
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, usage
+        
+    def get_progress(self):
+        """Текущий этап выполняющихся задач; idle_seconds показывает зависания"""
+        now = time.time()
+        return {
+            task_id: dict(status, idle_seconds=round(now - status['last_output_at'], 1))
+            for task_id, status in list(self._progress.items())
+        }
+        
+    def task_log(self, task_id):
+        """Лог задачи: текущий из прогресса или последний Logs/<тип>-<время>-<id>.log"""
+        current = self._progress.get(task_id, {}).get('log')
+        if current:
+            return Path(current)
+        logs = sorted((self.project_path / "Logs").glob(f"*-{glob_escape(task_id)}.log"),
+                      key=lambda path: path.stat().st_mtime)
+        if logs:
+            return logs[-1]
+        archived = [path for path in self.log_archive.task_archives(task_id) if path.name.endswith(f"-{task_id}.log.gz")]
+        return archived[-1] if archived else None
+        
+    def _artifact_path(self, kind, task_id, extension):
+        """Путь к логу/результату задачи в Logs основного проекта"""
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        return self.project_path / "Logs" / f"{kind}-{timestamp}-{task_id}.{extension}"
+        
+    def add_task(self, task_type, params=None, priority=0, task_id=None):
         """Добавление задачи"""
         task = {
+            'id': task_id,
             'type': task_type,
             'params': params or {},
+            'priority': priority,
             'timestamp': datetime.now().isoformat(),
             'agent_id': self.agent_id
         }
         
-        self.tasks.append(task)
-        self.logger.info(f"Добавлена задача: {task_type}")
+        task_id, _ = self.queue.add(task)
+        self.logger.info(f"Добавлена задача {task_id}: {task_type}")
+        self._wakeup.set()
+        return task_id
+        
+    def add_pipeline(self, nodes, priority=0, pipeline_id=None):
+        """Добавление графа задач: {имя: {"type": ..., "params": {...}, "after": [имена]}}"""
+        pipeline_id, _ = self._add_pipeline({
+            'id': pipeline_id,
+            'type': 'pipeline',
+            'nodes': nodes,
+            'priority': priority,
+            'timestamp': datetime.now().isoformat(),
+        })
+        self._wakeup.set()
+        return pipeline_id
+        
+    def get_pipeline(self, pipeline_id):
+        """Статусы узлов пайплайна"""
+        return {task['id'][len(pipeline_id) + 1:]: {'status': task['status'], 'error': task['error']}
+                for task in self.queue.pipeline(pipeline_id)}
         
     def get_status(self):
         """Получение статуса агента"""
         return {
             'agent_id': self.agent_id,
             'running': self.running,
-            'tasks_count': len(self.tasks),
+            'tasks_count': self.queue.counts().get(TaskQueue.PENDING, 0),
+            'tasks_by_status': self.queue.counts(),
+            'progress': self.get_progress(),
             'unity_path': self.unity_path,
             'project_path': str(self.project_path),
             'timestamp': datetime.now().isoformat()
@@ -314,19 +3514,188 @@ def main():
     parser.add_argument('--unity-path', help='Путь к Unity Editor')
     parser.add_argument('--daemon', action='store_true',
                        help='Запуск в режиме демона')
+    parser.add_argument('--drop-dir',
+                       help='Каталог для файлов задач (по умолчанию <project>/agent-tasks.d)')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                       help='Интервал опроса, если inotify недоступен (сек)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Количество параллельных воркеров Unity')
+    parser.add_argument('--workspace-root',
+                       help='Каталог копий проекта для воркеров')
+    parser.add_argument('--max-test-shards', type=int, default=4,
+                       help='Максимум параллельных шардов для задач test с параметром shards')
+    parser.add_argument('--memory-reserve-mb', type=int, default=1024,
+                       help='Память, которую агент оставляет свободной при допуске задач (МБ)')
+    parser.add_argument('--metrics-port', type=int,
+                       help='Порт HTTP-эндпоинта метрик на 127.0.0.1 (/metrics, /status)')
+    parser.add_argument('--rpc-socket',
+                       help='UNIX-сокет RPC (по умолчанию <project>/Logs/Agents/agent.sock)')
+    parser.add_argument('--rpc-port', type=int,
+                       help='Дополнительно принимать RPC на 127.0.0.1:PORT')
+    parser.add_argument('--max-queue-depth', type=int, default=100,
+                       help='Максимум ожидающих задач; сверх него submit получает queue_full')
+    parser.add_argument('--submit', metavar='JSON',
+                       help='Клиент: отправить задачу работающему агенту')
+    parser.add_argument('--submit-wait', type=float, default=0,
+                       help='Клиент: сколько секунд повторять submit при заполненной очереди')
+    parser.add_argument('--status', metavar='ID', nargs='?', const='',
+                       help='Клиент: статус агента или задачи')
+    parser.add_argument('--cancel', metavar='ID', help='Клиент: отменить задачу')
+    parser.add_argument('--logs', metavar='ID', help='Клиент: вывести лог задачи')
+    parser.add_argument('--follow', action='store_true', help='Клиент: с --logs ждать завершения задачи')
+    parser.add_argument('--library-snapshots', type=int, default=3,
+                       help='Сколько снимков Library/ других платформ хранить для сборок (0 - отключить)')
+    parser.add_argument('--artifact-store',
+                       help='Каталог хранилища сборок (по умолчанию <project>-agent-artifacts)')
+    parser.add_argument('--artifact-store-gb', type=float, default=50,
+                       help='Лимит размера хранилища сборок (ГБ, 0 - отключить)')
+    parser.add_argument('--artifact-store-builds', type=int, default=20,
+                       help='Сколько последних сборок хранить')
+    parser.add_argument('--list-builds', action='store_true',
+                       help='Показать сборки в хранилище')
+    parser.add_argument('--checkout-build', nargs=2, metavar=('KEY', 'DEST'),
+                       help='Извлечь сборку из хранилища (ключ или его начало)')
+    parser.add_argument('--analyze-log', metavar='LOG',
+                       help='Разобрать лог Unity и вывести сводку (JSON)')
+    parser.add_argument('--log-report', type=int, nargs='?', const=10, metavar='N',
+                       help='Топ N самых долгих сборок, импортов и шагов сборки по Logs/*.summary.json')
+    parser.add_argument('--log-max-age-hours', type=float, default=24,
+                       help='Логи старше N часов сжимаются в Logs/Archive')
+    parser.add_argument('--log-max-mb', type=int, default=512,
+                       help='Лимит несжатых логов (МБ); сверх него архивируются самые старые')
+    parser.add_argument('--log-retention-days', type=int, default=30,
+                       help='Срок хранения архивов логов (дней)')
+    parser.add_argument('--rotate-logs', action='store_true',
+                       help='Выполнить ротацию логов и выйти')
+    parser.add_argument('--search', metavar='TERM',
+                       help='Поиск по архиву логов: CS0246, NullReferenceException, Assets/..., ID задачи')
+    parser.add_argument('--search-limit', type=int, default=200,
+                       help='Максимум строк в результате поиска')
+    parser.add_argument('--warm-editors', action='store_true',
+                       help='Держать резидентный Unity Editor в каждой копии проекта')
+    parser.add_argument('--editor-max-tasks', type=int, default=20,
+                       help='Перезапуск резидентного редактора после N задач')
+    parser.add_argument('--editor-max-memory-mb', type=int, default=8192,
+                       help='Перезапуск резидентного редактора при превышении памяти (МБ)')
     
     args = parser.parse_args()
     
+    # Архив логов без запуска агента
+    if args.search or args.rotate_logs:
+        archive = LogArchive(Path(args.project_path) / "Logs", logging.getLogger('log-archive'),
+                             args.log_max_age_hours, args.log_max_mb, args.log_retention_days)
+        if args.rotate_logs:
+            logging.basicConfig(level=logging.INFO, format='%(message)s')
+            archive.rotate()
+            return
+        started = time.time()
+        if LogArchive.parse_term(args.search).startswith('task:'):
+            for path in archive.task_archives(args.search):
+                print(f"{path}")
+        results = archive.search(args.search, args.search_limit)
+        for path, number, line in results:
+            print(f"{path}:{number}: {line}")
+        print(f"🔍 Найдено строк: {len(results)} за {(time.time() - started) * 1000:.0f} мс", file=sys.stderr)
+        return
+    
+    # Аналитика логов Unity без запуска агента
+    if args.analyze_log:
+        print(json.dumps(UnityLogAnalyzer.analyze_file(args.analyze_log), ensure_ascii=False, indent=2))
+        return
+    if args.log_report:
+        logs_dir = Path(args.project_path) / "Logs"
+        summaries = []
+        for path in sorted(logs_dir.glob('*.summary.json')):
+            try:
+                with open(path, 'r') as f:
+                    summaries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        report = UnityLogAnalyzer.slowest(summaries, args.log_report)
+        print(f"📊 Запусков: {report['runs']}")
+        for title, key in (('Компиляция сборок', 'assemblies'), ('Шаги сборки', 'build_steps')):
+            print(f"\n{title} (среднее / максимум, с):")
+            for row in report[key]:
+                print(f"  {row['mean']:9.2f} {row['max']:9.2f}  {row['name']} ({row['runs']})")
+        print("\nИмпорт ассетов (максимум, с):")
+        for row in report['imports']:
+            print(f"  {row['max']:9.2f}  {row['name']}")
+        reload = report['domain_reload']
+        if reload['count']:
+            print(f"\nDomain reload: {reload['count']} раз, среднее {reload['mean']:.2f} с, максимум {reload['max']:.2f} с")
+        return
+    
+    # Хранилище сборок доступно без запуска агента
+    if args.list_builds or args.checkout_build:
+        store = ArtifactStore(args.artifact_store or Path(args.project_path).parent / f"{Path(args.project_path).name}-agent-artifacts",
+                              logging.getLogger('artifact-store'))
+        if args.list_builds:
+            for build in store.builds():
+                print(f"{build['key'][:12]}  {build.get('last_used', '')[:19]}  {build.get('size', 0) / 1024 ** 2:8.0f} МБ  "
+                      f"{json.dumps(build.get('params', {}), ensure_ascii=False)}")
+            return
+        prefix, destination = args.checkout_build
+        matches = [b['key'] for b in store.builds() if b['key'].startswith(prefix)]
+        if len(matches) != 1:
+            print(f"❌ Ключ {prefix}: найдено сборок {len(matches)}")
+            sys.exit(1)
+        store.checkout(matches[0], destination)
+        print(f"✅ Сборка {matches[0][:12]} извлечена в {destination}")
+        return
+    
+    # Клиентский режим: запрос к уже работающему агенту
+    if args.submit or args.status is not None or args.cancel or args.logs:
+        client = AgentClient(args.rpc_socket or Path(args.project_path) / "Logs" / "Agents" / "agent.sock",
+                             args.rpc_port)
+        if args.logs:
+            response = client.logs(args.logs, follow=args.follow)
+            if response.get('ok'):
+                return
+        elif args.submit:
+            response = client.submit(json.loads(args.submit), wait=args.submit_wait)
+        elif args.cancel:
+            response = client.request('cancel', id=args.cancel)
+        else:
+            response = client.request('status', id=args.status or None)
+        print(json.dumps(response, ensure_ascii=False, indent=2, default=str))
+        # 75 (EX_TEMPFAIL): очередь заполнена, стоит повторить позже
+        sys.exit(0 if response.get('ok') else 75 if response.get('error') in ('queue_full', 'busy') else 1)
+    
     # Создание агента
-    agent = UnityBackgroundAgent(args.project_path, args.unity_path)
+    def create_agent():
+        return UnityBackgroundAgent(args.project_path, args.unity_path,
+                                     drop_dir=args.drop_dir, poll_interval=args.poll_interval,
+                                     workers=args.workers, workspace_root=args.workspace_root,
+                                     warm_editors=args.warm_editors,
+                                     editor_max_tasks=args.editor_max_tasks,
+                                     editor_max_memory_mb=args.editor_max_memory_mb,
+                                     max_test_shards=args.max_test_shards,
+                                     memory_reserve_mb=args.memory_reserve_mb,
+                                     metrics_port=args.metrics_port,
+                                     rpc_socket=args.rpc_socket, rpc_port=args.rpc_port,
+                                     max_queue_depth=args.max_queue_depth,
+                                     library_snapshots=args.library_snapshots,
+                                     artifact_store=args.artifact_store,
+                                     artifact_store_gb=args.artifact_store_gb,
+                                     artifact_store_builds=args.artifact_store_builds,
+                                     log_max_age_hours=args.log_max_age_hours,
+                                     log_max_mb=args.log_max_mb,
+                                     log_retention_days=args.log_retention_days)
     
     if args.daemon:
-        # Запуск в режиме демона
+        # Запуск в режиме демона. DaemonContext закрывает унаследованные дескрипторы и переходит в /,
+        # поэтому пути разрешаются заранее, а агент (база очереди, архив логов, лог-файлы) создается уже в демоне
+        for name in ('project_path', 'drop_dir', 'workspace_root', 'rpc_socket', 'artifact_store'):
+            if getattr(args, name):
+                setattr(args, name, os.path.abspath(getattr(args, name)))
+        if args.unity_path and os.sep in args.unity_path:
+            args.unity_path = os.path.abspath(args.unity_path)
         import daemon
         with daemon.DaemonContext():
-            agent.start()
+            create_agent().start()
     else:
         # Обычный запуск
+        agent = create_agent()
         try:
             agent.start()
         except KeyboardInterrupt:
@@ -9,14 +9,1231 @@ import sys
 import subprocess
 import json
 import time
+import array
+import math
+import mmap
+import html
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import struct
 import argparse
+import itertools
+import threading
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FRAME_BUDGET_MS = 1000.0 / 60
+SLOW_FRAME_MS = 1000.0 / 30
+
+# Параметры performance_settings, повышающие качество картинки (для оценки качества в свипе)
+QUALITY_KNOBS = ("quality_level", "anti_aliasing", "anisotropic_filtering")
+KNOB_LABELS = {"quality_level": "q", "anti_aliasing": "aa", "anisotropic_filtering": "af",
+               "vsync_count": "vs", "target_fps": "fps"}
+
+
+class StreamingStats:
+    """Потоковая статистика ряда: среднее, min/max и перцентили по логарифмической гистограмме (шаг 1%)"""
+
+    RESOLUTION = math.log(1.01)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = 0.0
+        self.zeros = 0
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+            return
+        bucket = int(math.log(value) // self.RESOLUTION)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def add_many(self, values):
+        """Добавление массива значений (с numpy - векторно)"""
+        if np is None:
+            for value in values:
+                self.add(value)
+            return
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.last = float(values[-1])
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        buckets, counts = np.unique(np.floor(np.log(positive) / self.RESOLUTION).astype(np.int64), return_counts=True)
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Перцентиль с точностью до 1% значения"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * q / 100.0))
+        if rank <= self.zeros:
+            return 0.0
+        seen = self.zeros
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                value = math.exp((bucket + 0.5) * self.RESOLUTION)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self, histogram=False):
+        if not self.count:
+            return {"count": 0}
+        result = {
+            "count": self.count,
+            "mean": round(self.mean, 3),
+            "min": round(self.min, 3),
+            "max": round(self.max, 3),
+            "last": round(self.last, 3),
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3),
+        }
+        if histogram:
+            # Распределение: индекс логарифмической корзины -> число кадров (корзина 0 - нулевые значения)
+            result["histogram"] = {"zeros": self.zeros, "buckets": {str(k): v for k, v in sorted(self.buckets.items())}}
+        return result
+
+
+class ProfilerCapture:
+    """
+    Покадровый экспорт ProfilerFrameExportSystem: frames.json (описание) + frames.bin (записи фиксированного размера)
+    frames.bin читается через mmap блоками, поэтому многогигабайтные захваты не загружаются в память
+    """
+
+    META_FILE = "frames.json"
+    DATA_FILE = "frames.bin"
+    CHUNK_RECORDS = 65536
+    # Ряды временных шкал отчета; точек на ряд не больше 2 x TIMELINE_BUCKETS при любой длине захвата
+    TIMELINE_FIELDS = ("frame_ms", "main_thread_ms", "gpu_ms", "total_used_mb", "gc_used_mb")
+    TIMELINE_BUCKETS = 1000
+    TIMELINE_SEGMENTS = 10
+
+    def __init__(self, capture_dir):
+        self.capture_dir = Path(capture_dir)
+        with open(self.capture_dir / self.META_FILE, encoding='utf-8-sig') as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != 1:
+            raise ValueError(f"неподдерживаемая версия экспорта: {self.meta.get('version')}")
+
+        self.fields = list(self.meta["fields"])
+        self.markers = list(self.meta.get("markers") or [])
+        # Первое поле - номер кадра (uint32), остальные float32
+        self.record = struct.Struct("<I" + "f" * (len(self.fields) - 1 + len(self.markers)))
+        if self.record.size != self.meta["record_size"]:
+            raise ValueError(f"размер записи {self.record.size} != {self.meta['record_size']} из {self.META_FILE}")
+        self.data_path = self.capture_dir / self.DATA_FILE
+
+    @classmethod
+    def find(cls, capture_dir):
+        """Захват в каталоге или None, если экспорта кадров нет"""
+        if not (Path(capture_dir) / cls.META_FILE).exists():
+            return None
+        return cls(capture_dir)
+
+    @property
+    def frame_count(self):
+        """Число целых записей: после аварийного завершения frame_count в frames.json не обновляется"""
+        try:
+            return self.data_path.stat().st_size // self.record.size
+        except FileNotFoundError:
+            return 0
+
+    def iter_frames(self):
+        """Кадры как кортежи значений в порядке fields + markers"""
+        frames = self.frame_count
+        if not frames:
+            return
+        chunk = self.CHUNK_RECORDS * self.record.size
+        end = frames * self.record.size
+        with open(self.data_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset in range(0, end, chunk):
+                yield from self.record.iter_unpack(data[offset:min(offset + chunk, end)])
+
+    def analyze(self, warmup_frames=0, histograms=False):
+        """
+        Время кадра, память и времена маркеров/ECS-систем (первые warmup_frames пропускаются)
+        С numpy считается по колонкам (FrameAnalytics), без него - одним потоковым проходом
+        """
+        if np is not None:
+            return FrameAnalytics(self, warmup_frames).analysis(histograms)
+
+        index = {name: i for i, name in enumerate(self.fields)}
+        tracked = ("frame_ms", "main_thread_ms", "gpu_ms", "total_used_mb", "gc_used_mb", "gc_alloc_kb")
+        stats = {name: StreamingStats() for name in tracked if name in index}
+        columns = [(stats[name], index[name]) for name in stats]
+        marker_stats = [StreamingStats() for _ in self.markers]
+        marker_offset = len(self.fields)
+        frame_column = index["frame_ms"]
+        time_column = index.get("time_s")
+
+        over_budget = 0
+        slow = 0
+        first_time = last_time = None
+        for number, frame in enumerate(self.iter_frames()):
+            if number < warmup_frames:
+                continue
+            for target, column in columns:
+                target.add(frame[column])
+            for i, target in enumerate(marker_stats):
+                target.add(frame[marker_offset + i])
+            frame_ms = frame[frame_column]
+            if frame_ms > FRAME_BUDGET_MS:
+                over_budget += 1
+            if frame_ms > SLOW_FRAME_MS:
+                slow += 1
+            if time_column is not None:
+                if first_time is None:
+                    first_time = frame[time_column]
+                last_time = frame[time_column]
+
+        duration = (last_time - first_time) if first_time is not None else 0.0
+        return self.summary(
+            stats["frame_ms"].count, duration, over_budget, slow,
+            {name: target.to_dict(histograms) for name, target in stats.items()},
+            [(name, target.to_dict(histograms), target.total) for name, target in zip(self.markers, marker_stats)],
+            stats["frame_ms"].total)
+
+    def timelines(self, warmup_frames=0, buckets=None, segments=None):
+        """
+        Прореженные временные шкалы и средние по отрезкам захвата
+        series: для каждого корзинного отрезка кадров - минимум и максимум в порядке кадров, пики не теряются
+        segments: среднее frame_ms и маркеров на segments равных отрезках захвата
+        """
+        buckets = buckets or self.TIMELINE_BUCKETS
+        segments = segments or self.TIMELINE_SEGMENTS
+        series_names = [name for name in self.TIMELINE_FIELDS if name in self.fields]
+        segment_names = ["frame_ms"] + self.markers
+        if np is not None:
+            analytics = FrameAnalytics(self, warmup_frames)
+            return analytics.timelines(series_names, segment_names, buckets, segments)
+
+        names = self.fields + self.markers
+        series_columns = [names.index(name) for name in series_names]
+        segment_columns = [names.index(name) for name in segment_names]
+        frames = max(0, self.frame_count - warmup_frames)
+        size = max(1, -(-frames // buckets))
+        count = min(segments, frames)
+        bounds = [(frames * i // count, frames * (i + 1) // count) for i in range(count)]
+        points = {name: ([], []) for name in series_names}
+        sums = [[0.0] * len(segment_names) for _ in bounds]
+        extremes = None
+        segment = 0
+        for number, frame in enumerate(itertools.islice(self.iter_frames(), warmup_frames, None)):
+            if number % size == 0:
+                extremes = [[frame[c], number, frame[c], number] for c in series_columns]
+            for extreme, column in zip(extremes, series_columns):
+                value = frame[column]
+                if value < extreme[0]:
+                    extreme[0], extreme[1] = value, number
+                if value > extreme[2]:
+                    extreme[2], extreme[3] = value, number
+            if number % size == size - 1 or number == frames - 1:
+                for name, (low, low_at, high, high_at) in zip(series_names, extremes):
+                    ordered = sorted({(low_at, low), (high_at, high)})
+                    points[name][0].extend(warmup_frames + at for at, _ in ordered)
+                    points[name][1].extend(round(value, 3) for _, value in ordered)
+            while number >= bounds[segment][1]:
+                segment += 1
+            for i, column in enumerate(segment_columns):
+                sums[segment][i] += frame[column]
+
+        return {
+            "frames": frames,
+            "first_frame": warmup_frames,
+            "bucket_frames": size,
+            "series": {name: {"frame": frame_list, "value": values} for name, (frame_list, values) in points.items()},
+            "segments": {
+                "bounds": [[warmup_frames + a, warmup_frames + b] for a, b in bounds],
+                "means": {name: [round(sums[s][i] / ((b - a) or 1), 4) for s, (a, b) in enumerate(bounds)]
+                          for i, name in enumerate(segment_names)},
+            },
+        }
+
+    def summary(self, frames, duration, over_budget, slow, stats, markers, frame_total):
+        """Результат analyze: stats - поле -> статистика, markers - (имя, статистика, сумма мс)"""
+        frame_mean = stats["frame_ms"].get("mean", 0)
+        if duration > 0 and frames > 1:
+            fps = (frames - 1) / duration
+        else:
+            fps = 1000.0 / frame_mean if frame_mean else 0.0
+
+        entries = []
+        for name, entry, total in markers:
+            entry["name"] = name
+            entry["share"] = round(total / (frame_total or 1.0), 4)
+            entries.append(entry)
+        entries.sort(key=lambda m: m.get("mean", 0), reverse=True)
+
+        return {
+            "capture": str(self.capture_dir),
+            "unity_version": self.meta.get("unity_version"),
+            "platform": self.meta.get("platform"),
+            "scene": self.meta.get("scene"),
+            "started_at": self.meta.get("started_at"),
+            "ended_at": self.meta.get("ended_at"),
+            "complete": self.meta.get("frame_count", -1) >= 0,
+            "frames": frames,
+            "duration_s": round(duration, 3),
+            "fps": round(fps, 2),
+            "frames_over_budget": over_budget,
+            "frames_over_33ms": slow,
+            "stats": stats,
+            "markers": entries,
+        }
+
+
+class FrameAnalytics:
+    """
+    Векторная аналитика времени кадра на NumPy: перцентили, хитчи, вклад систем в хитчи, гистограмма
+    frames.bin отображается в память через np.memmap, все расчеты - по колонкам без циклов по кадрам
+    """
+
+    PERCENTILES = (50, 95, 99, 99.9)
+    # Кадров в блоке скользящей медианы: ограничивает память под окна
+    WINDOW_CHUNK = 1 << 18
+
+    def __init__(self, capture, warmup_frames=0):
+        if np is None:
+            raise RuntimeError("для аналитики кадров нужен numpy (pip install -r Scripts/requirements.txt)")
+        self.capture = capture
+        frames = capture.frame_count
+        columns = capture.record.size // 4
+        self.columns = {name: i for i, name in enumerate(capture.fields)}
+        self.markers = capture.markers
+        if frames:
+            # Все поля 4-байтовые: float32 матрица кадров, номер кадра - view на uint32
+            self.data = np.memmap(capture.data_path, dtype='<f4', mode='r', shape=(frames, columns))[warmup_frames:]
+        else:
+            self.data = np.empty((0, columns), dtype='<f4')
+
+    @property
+    def frame_ms(self):
+        return self.data[:, self.columns["frame_ms"]]
+
+    @staticmethod
+    def column_stats(values, histogram=False):
+        """Статистика колонки в формате StreamingStats.to_dict и сумма значений"""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return {"count": 0}, 0.0
+        p50, p95, p99 = np.percentile(values, (50, 95, 99))
+        result = {
+            "count": len(values),
+            "mean": round(float(values.mean()), 3),
+            "min": round(float(values.min()), 3),
+            "max": round(float(values.max()), 3),
+            "last": round(float(values[-1]), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+        }
+        if histogram:
+            positive = values[values > 0]
+            buckets, counts = np.unique(np.floor(np.log(positive) / StreamingStats.RESOLUTION).astype(np.int64),
+                                        return_counts=True)
+            result["histogram"] = {"zeros": int(len(values) - len(positive)),
+                                   "buckets": {str(int(b)): int(c) for b, c in zip(buckets, counts)}}
+        return result, float(values.sum())
+
+    def analysis(self, histograms=False):
+        """То же, что ProfilerCapture.analyze, векторно по колонкам"""
+        tracked = ("frame_ms", "main_thread_ms", "gpu_ms", "total_used_mb", "gc_used_mb", "gc_alloc_kb")
+        stats = {}
+        frame_total = 0.0
+        for name in tracked:
+            if name in self.columns:
+                stats[name], total = self.column_stats(self.data[:, self.columns[name]], histograms)
+                if name == "frame_ms":
+                    frame_total = total
+        markers = [(name, *self.column_stats(self.marker_ms(i), histograms)) for i, name in enumerate(self.markers)]
+
+        frame_ms = self.frame_ms
+        duration = 0.0
+        if "time_s" in self.columns and len(self.data):
+            duration = float(self.data[-1, self.columns["time_s"]]) - float(self.data[0, self.columns["time_s"]])
+        return self.capture.summary(len(self.data), duration, int((frame_ms > FRAME_BUDGET_MS).sum()),
+                                    int((frame_ms > SLOW_FRAME_MS).sum()), stats, markers, frame_total)
+
+    def marker_ms(self, index):
+        return self.data[:, len(self.capture.fields) + index]
+
+    def percentiles(self):
+        """Перцентили времени кадра, мс"""
+        if not len(self.data):
+            return {}
+        values = np.percentile(self.frame_ms, self.PERCENTILES)
+        return {f"p{q:g}": round(float(v), 3) for q, v in zip(self.PERCENTILES, values)}
+
+    def rolling_median(self, window=31):
+        """Центрированная скользящая медиана времени кадра (края дополняются крайними значениями)"""
+        values = np.asarray(self.frame_ms, dtype=np.float32)
+        half = window // 2
+        padded = np.pad(values, (half, window - 1 - half), mode='edge')
+        result = np.empty_like(values)
+        for start in range(0, len(values), self.WINDOW_CHUNK):
+            stop = min(start + self.WINDOW_CHUNK, len(values))
+            windows = np.lib.stride_tricks.sliding_window_view(padded[start:stop + window - 1], window)
+            result[start:stop] = np.median(windows, axis=1)
+        return result
+
+    def hitches(self, factor=2.0, window=31):
+        """
+        Хитчи - кадры дольше factor x скользящей медианы; подряд идущие кадры объединяются в событие
+        Вклад системы - доля ее превышения над медианой на нехитчевых кадрах в суммарном превышении кадров
+        """
+        frame_ms = np.asarray(self.frame_ms, dtype=np.float32)
+        if not len(frame_ms):
+            return {"frames": 0, "events": 0, "systems": []}
+        baseline = self.rolling_median(window)
+        mask = frame_ms > factor * baseline
+        count = int(mask.sum())
+
+        edges = np.diff(mask.astype(np.int8), prepend=0)
+        events = int((edges == 1).sum())
+        excess = frame_ms[mask] - baseline[mask]
+        total_excess = float(excess.sum())
+
+        systems = []
+        for i, name in enumerate(self.markers):
+            marker = np.asarray(self.marker_ms(i), dtype=np.float32)
+            normal = float(np.median(marker[~mask])) if count < len(marker) else 0.0
+            on_hitch = marker[mask]
+            marker_excess = float(np.clip(on_hitch - normal, 0, None).sum()) if count else 0.0
+            systems.append({
+                "name": name,
+                "normal_ms": round(normal, 3),
+                "hitch_mean_ms": round(float(on_hitch.mean()), 3) if count else 0.0,
+                "hitch_max_ms": round(float(on_hitch.max()), 3) if count else 0.0,
+                "share_of_excess": round(marker_excess / total_excess, 4) if total_excess > 0 else 0.0,
+            })
+        systems.sort(key=lambda s: s["share_of_excess"], reverse=True)
+
+        worst = np.argsort(frame_ms[mask])[::-1][:10]
+        hitch_index = np.flatnonzero(mask)
+        frame_numbers = self.data[:, self.columns["frame"]].view('<u4')
+        return {
+            "factor": factor,
+            "window": window,
+            "frames": count,
+            "events": events,
+            "rate": round(count / len(frame_ms), 5),
+            "excess_ms": round(total_excess, 3),
+            "worst": [{"frame": int(frame_numbers[hitch_index[i]]), "frame_ms": round(float(frame_ms[hitch_index[i]]), 3),
+                       "median_ms": round(float(baseline[hitch_index[i]]), 3)} for i in worst],
+            "systems": systems,
+        }
+
+    def histogram(self, bin_ms=0.5, limit_ms=None):
+        """Гистограмма времени кадра: бины по bin_ms до limit_ms, последний бин - все длиннее"""
+        frame_ms = self.frame_ms
+        if not len(frame_ms):
+            return {"bin_ms": bin_ms, "edges": [], "counts": []}
+        if limit_ms is None:
+            limit_ms = max(2 * SLOW_FRAME_MS, float(np.percentile(frame_ms, 99.9)) * 1.2)
+        edges = np.arange(0, limit_ms + bin_ms, bin_ms)
+        counts, _ = np.histogram(np.minimum(frame_ms, edges[-1] - bin_ms / 2), bins=edges)
+        return {"bin_ms": bin_ms, "edges": [round(float(e), 3) for e in edges], "counts": counts.tolist()}
+
+    def timelines(self, series_names, segment_names, buckets=1000, segments=10):
+        """То же, что ProfilerCapture.timelines: минимум и максимум по корзинам через reshape, блоками по памяти"""
+        names = self.capture.fields + self.markers
+        frames = len(self.data)
+        warmup = self.capture.frame_count - frames
+        size = max(1, -(-frames // buckets))
+        series_columns = [names.index(name) for name in series_names]
+        parts = []
+        # Блок - целое число корзин, последняя неполная корзина идет отдельным блоком
+        step = size * max(1, self.WINDOW_CHUNK // size)
+        for start in range(0, frames, step):
+            block = np.asarray(self.data[start:start + step][:, series_columns], dtype=np.float32)
+            full = len(block) // size * size
+            parts.append(self._bucket_extremes(block[:full], size, start))
+            if full < len(block):
+                parts.append(self._bucket_extremes(block[full:], len(block) - full, start + full))
+        series = {}
+        for i, name in enumerate(series_names):
+            at = np.concatenate([p[0][:, :, i] for p in parts]).reshape(-1) if parts else np.empty(0, dtype=np.int64)
+            values = np.concatenate([p[1][:, :, i] for p in parts]).reshape(-1) if parts else np.empty(0)
+            # Минимум и максимум корзины могут совпасть (ровный отрезок или корзина в один кадр) - одна точка
+            keep = np.ones(len(at), dtype=bool)
+            keep[1::2] = at[1::2] != at[0::2]
+            at, values = at[keep], values[keep]
+            series[name] = {"frame": (at + warmup).tolist(), "value": np.round(values.astype(np.float64), 3).tolist()}
+
+        count = min(segments, frames)
+        bounds = [(frames * i // count, frames * (i + 1) // count) for i in range(count)]
+        segment_columns = [names.index(name) for name in segment_names]
+        means = np.zeros((count, len(segment_columns)))
+        for s, (a, b) in enumerate(bounds):
+            for start in range(a, b, self.WINDOW_CHUNK):
+                block = self.data[start:min(b, start + self.WINDOW_CHUNK)][:, segment_columns]
+                means[s] += block.sum(axis=0, dtype=np.float64)
+            means[s] /= max(1, b - a)
+        return {
+            "frames": frames,
+            "first_frame": warmup,
+            "bucket_frames": size,
+            "series": series,
+            "segments": {
+                "bounds": [[warmup + a, warmup + b] for a, b in bounds],
+                "means": {name: np.round(means[:, i], 4).tolist() for i, name in enumerate(segment_names)},
+            },
+        }
+
+    @staticmethod
+    def _bucket_extremes(block, size, offset):
+        """Кадры и значения минимума и максимума каждой корзины size кадров, в порядке кадров: (корзина, 2, колонка)"""
+        if not len(block):
+            return np.empty((0, 2, block.shape[1]), dtype=np.int64), np.empty((0, 2, block.shape[1]), dtype=np.float32)
+        shaped = block.reshape(-1, size, block.shape[1])
+        low = shaped.argmin(axis=1)
+        high = shaped.argmax(axis=1)
+        first = np.minimum(low, high)
+        second = np.maximum(low, high)
+        base = offset + np.arange(len(shaped))[:, None] * size
+        at = np.stack([base + first, base + second], axis=1)
+        values = np.stack([np.take_along_axis(shaped, first[:, None, :], axis=1)[:, 0],
+                           np.take_along_axis(shaped, second[:, None, :], axis=1)[:, 0]], axis=1)
+        return at, values
+
+    def summary(self, hitch_factor=2.0, window=31):
+        return {
+            "frames": len(self.data),
+            "percentiles": self.percentiles(),
+            "hitches": self.hitches(hitch_factor, window),
+            "histogram": self.histogram(),
+        }
+
+
+class ProcessSampler:
+    """
+    Сэмплер процесса игры из /proc с фиксированным интервалом: CPU%, RSS, page faults, потоки, байты I/O
+    Ряды хранятся в array('d') по колонкам и сохраняются в каталог сессии: process.json + process.bin
+    """
+
+    COLUMNS = ("t", "cpu_pct", "rss_mb", "minor_faults", "major_faults", "threads", "read_bytes", "write_bytes")
+    META_FILE = "process.json"
+    DATA_FILE = "process.bin"
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.series = {name: array.array('d') for name in self.COLUMNS}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"sampler-{pid}", daemon=True)
+        self._ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self._page_mb = (os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096) / (1024 * 1024)
+
+    @staticmethod
+    def available():
+        return os.path.exists("/proc/self/stat")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _read_stat(self):
+        """(utime + stime в тиках, minflt, majflt, потоки, RSS в страницах) или None, если процесса нет"""
+        try:
+            with open(f"/proc/{self.pid}/stat", 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return None
+        # Имя процесса в скобках может содержать пробелы - поля считаются после последней ')'
+        fields = raw[raw.rindex(b')') + 2:].split()
+        if fields[0] == b'Z':
+            return None
+        return int(fields[11]) + int(fields[12]), int(fields[7]), int(fields[9]), int(fields[17]), int(fields[21])
+
+    def _read_io(self):
+        try:
+            with open(f"/proc/{self.pid}/io", 'rb') as f:
+                values = dict(line.split(b':', 1) for line in f.read().splitlines() if b':' in line)
+            return int(values.get(b'read_bytes', 0)), int(values.get(b'write_bytes', 0))
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _run(self):
+        started = time.monotonic()
+        previous = None
+        tick = 0
+        while not self._stop_event.is_set():
+            stat = self._read_stat()
+            if stat is None:
+                return
+            now = time.monotonic()
+            cpu_time, minor, major, threads, rss_pages = stat
+            cpu = 0.0
+            if previous is not None and now > previous[0]:
+                cpu = (cpu_time - previous[1]) / self._ticks / (now - previous[0]) * 100
+            previous = (now, cpu_time)
+            read_bytes, write_bytes = self._read_io()
+            for name, value in zip(self.COLUMNS, (now - started, cpu, rss_pages * self._page_mb, minor, major,
+                                                  threads, read_bytes, write_bytes)):
+                self.series[name].append(value)
+            # Расписание от старта, чтобы интервал не уплывал на время чтения /proc
+            tick += 1
+            self._stop_event.wait(max(0.0, started + tick * self.interval - time.monotonic()))
+
+    def save(self, output_dir):
+        """process.bin - колонки float64 little-endian подряд, process.json - описание"""
+        samples = len(self.series["t"])
+        with open(os.path.join(output_dir, self.DATA_FILE), 'wb') as f:
+            for name in self.COLUMNS:
+                column = self.series[name]
+                if sys.byteorder == 'big':
+                    column = array.array('d', column)
+                    column.byteswap()
+                column.tofile(f)
+        meta = {"version": 1, "pid": self.pid, "interval": self.interval, "layout": "columns", "dtype": "<f8",
+                "columns": list(self.COLUMNS), "samples": samples}
+        with open(os.path.join(output_dir, self.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, output_dir):
+        """Ряды сессии: колонка -> array('d'), или None без process.json"""
+        meta_path = os.path.join(output_dir, cls.META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        samples = meta["samples"]
+        series = {}
+        with open(os.path.join(output_dir, cls.DATA_FILE), 'rb') as f:
+            for name in meta["columns"]:
+                column = array.array('d')
+                column.fromfile(f, samples)
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                series[name] = column
+        return series
+
+    @staticmethod
+    def summarize(series):
+        """Сводка рядов: CPU, память, скорость page faults, потоки, объем I/O"""
+        samples = len(series["t"])
+        if not samples:
+            return {"samples": 0}
+        duration = series["t"][-1] - series["t"][0]
+        cpu = series["cpu_pct"][1:] or series["cpu_pct"]
+
+        def rate(name):
+            return round((series[name][-1] - series[name][0]) / duration, 2) if duration > 0 else 0.0
+
+        return {
+            "samples": samples,
+            "duration_s": round(duration, 2),
+            "cpu_mean_pct": round(sum(cpu) / len(cpu), 1),
+            "cpu_max_pct": round(max(cpu), 1),
+            "rss_max_mb": round(max(series["rss_mb"]), 1),
+            "rss_last_mb": round(series["rss_mb"][-1], 1),
+            "minor_faults_per_s": rate("minor_faults"),
+            "major_faults_per_s": rate("major_faults"),
+            "threads_max": int(max(series["threads"])),
+            "read_mb": round((series["read_bytes"][-1] - series["read_bytes"][0]) / (1024 * 1024), 2),
+            "write_mb": round((series["write_bytes"][-1] - series["write_bytes"][0]) / (1024 * 1024), 2),
+        }
+
+
+class OnlineTrend:
+    """Линейный тренд y(x) онлайн: средние и совместные моменты по Уэлфорду, O(1) памяти"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.sxx = 0.0
+        self.syy = 0.0
+        self.sxy = 0.0
+        self.last = 0.0
+
+    def add(self, x, y):
+        self.count += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.count
+        self.mean_y += dy / self.count
+        self.sxx += dx * (x - self.mean_x)
+        self.syy += dy * (y - self.mean_y)
+        self.sxy += dx * (y - self.mean_y)
+        self.last = y
+
+    @property
+    def slope(self):
+        return self.sxy / self.sxx if self.sxx > 0 else 0.0
+
+    @property
+    def stderr(self):
+        """Стандартная ошибка наклона (соседние сэмплы коррелированы, поэтому оценка оптимистична)"""
+        if self.count < 3 or self.sxx <= 0:
+            return math.inf
+        residual = max(0.0, self.syy - self.slope * self.sxy) / (self.count - 2)
+        return math.sqrt(residual / self.sxx)
+
+    @property
+    def r2(self):
+        if self.sxx <= 0 or self.syy <= 0:
+            return 0.0
+        return self.sxy * self.sxy / (self.sxx * self.syy)
+
+    def to_dict(self):
+        return {
+            "samples": self.count,
+            "slope": round(self.slope, 4),
+            "slope_low": round(self.slope - 1.96 * self.stderr, 4) if self.count >= 3 else None,
+            "r2": round(self.r2, 3),
+            "mean": round(self.mean_y, 3),
+            "last": round(self.last, 3),
+        }
+
+
+class SoakMonitor:
+    """
+    Наблюдение за долгим прогоном: RSS процесса из /proc и память/GC из дописываемого frames.bin
+    Тренды (МБ/час, КБ/кадр за час) считаются онлайн, сэмплы не хранятся
+    """
+
+    def __init__(self, session, interval=5.0, warmup=300.0, report_interval=300.0):
+        self.session = session
+        self.interval = interval
+        self.warmup = warmup
+        self.report_interval = report_interval
+        self.trends = {
+            "rss_mb": OnlineTrend(),
+            "total_used_mb": OnlineTrend(),
+            "gc_used_mb": OnlineTrend(),
+            "gc_alloc_kb": OnlineTrend(),
+        }
+        self.frames = 0
+        self._capture = None
+        self._offset = 0
+        self._page_mb = (os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096) / (1024 * 1024)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"soak-{session.name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        # Последние кадры, записанные перед завершением
+        self._read_frames()
+
+    def _read_rss(self):
+        try:
+            with open(f"/proc/{self.session.process.pid}/statm", 'rb') as f:
+                pages = int(f.read().split()[1])
+            # У завершившегося (zombie) процесса statm нулевой
+            return pages * self._page_mb if pages else None
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def _read_frames(self):
+        """Новые целые записи frames.bin с прошлого чтения"""
+        if self._capture is None:
+            try:
+                self._capture = ProfilerCapture.find(self.session.output_dir)
+            except (ValueError, KeyError, json.JSONDecodeError):
+                return
+            if self._capture is None:
+                return
+            index = {name: i for i, name in enumerate(self._capture.fields)}
+            self._columns = [(self.trends[name], index[name]) for name in ("total_used_mb", "gc_used_mb", "gc_alloc_kb")
+                             if name in index]
+            self._time_column = index["time_s"]
+        size = self._capture.record.size
+        try:
+            with open(self._capture.data_path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except OSError:
+            return
+        data = data[:len(data) - len(data) % size]
+        self._offset += len(data)
+        for frame in self._capture.record.iter_unpack(data):
+            seconds = frame[self._time_column]
+            self.frames += 1
+            if seconds < self.warmup:
+                continue
+            hours = seconds / 3600
+            for trend, column in self._columns:
+                trend.add(hours, frame[column])
+
+    def _run(self):
+        started = time.monotonic()
+        next_report = started + self.report_interval
+        while not self._stop_event.wait(self.interval):
+            elapsed = time.monotonic() - started
+            rss = self._read_rss()
+            if rss is not None and elapsed >= self.warmup:
+                self.trends["rss_mb"].add(elapsed / 3600, rss)
+            self._read_frames()
+            if time.monotonic() >= next_report:
+                next_report += self.report_interval
+                print(f"🧪 {self.session.name}: {elapsed / 3600:.2f} ч, {self.frames} кадров, "
+                      f"RSS {self.trends['rss_mb'].last:.0f} MB ({self.trends['rss_mb'].slope:+.1f} MB/ч), "
+                      f"GC heap {self.trends['gc_used_mb'].slope:+.1f} MB/ч, "
+                      f"alloc {self.trends['gc_alloc_kb'].mean_y:.1f} KB/кадр")
+
+    def verdict(self, thresholds):
+        """
+        Утечка - наклон больше порога при нижней границе 95% интервала наклона выше нуля
+        thresholds: ряд -> порог (МБ/час для памяти, КБ/кадр за час для аллокаций)
+        """
+        result = {"frames": self.frames, "warmup_s": self.warmup, "trends": {}, "leaks": []}
+        for name, trend in self.trends.items():
+            entry = trend.to_dict()
+            entry["threshold"] = thresholds.get(name)
+            entry["leak"] = bool(entry["threshold"] is not None and trend.count >= 3
+                                 and trend.slope > entry["threshold"] and entry["slope_low"] > 0)
+            result["trends"][name] = entry
+            if entry["leak"]:
+                result["leaks"].append(name)
+        return result
+
+
+class SessionStore:
+    """
+    История сессий профилирования: ProfilerData/history/<id>/
+    Каждое поле кадра и каждый маркер - отдельная колонка .npy (float32, номер кадра - uint32), открывается через mmap
+    meta.json - коммит, сцена, режим, настройки и сводка колонок; index.jsonl - строка на сессию для фильтрации
+    """
+
+    INDEX_FILE = "index.jsonl"
+    META_FILE = "meta.json"
+    CHUNK_FRAMES = 1 << 20
+    STATS = ("median", "mean", "p95", "p99", "max")
+
+    def __init__(self, root, keep=200):
+        self.root = Path(root)
+        self.keep = keep
+        # Параллельные сессии архивируются из своих потоков
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _column_file(name):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', name) + ".npy"
+
+    @staticmethod
+    def _npy_header(descr, count):
+        """Заголовок .npy версии 1.0: данные выровнены на 64 байта и читаются np.load(mmap_mode='r')"""
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, count)
+        header += " " * ((-(10 + len(header) + 1)) % 64) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+    def ingest(self, capture_dir, scene, mode, commit, settings=None, warmup_frames=0, complete=True):
+        """
+        Сохраняет захват сессии в историю, возвращает id или None, если кадров нет
+        complete=False - захват сессии с ошибкой: хранится, но не входит в запросы
+        """
+        capture = ProfilerCapture.find(capture_dir)
+        if capture is None or not capture.frame_count:
+            return None
+        analysis = capture.analyze(min(warmup_frames, capture.frame_count - 1))
+        created = time.time()
+        prefix = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(created))}-{re.sub(r'[^A-Za-z0-9_-]', '_', scene)}"
+        self.root.mkdir(parents=True, exist_ok=True)
+        for n in itertools.count(1):
+            session_id = f"{prefix}-{n}"
+            session_dir = self.root / session_id
+            try:
+                session_dir.mkdir()
+                break
+            except FileExistsError:
+                continue
+
+        names = capture.fields + capture.markers
+        columns = {name: self._column_file(f"{i:03d}-{name}") for i, name in enumerate(names)}
+        frames = capture.frame_count
+        self._write_columns(capture, session_dir, [columns[name] for name in names], frames)
+
+        summary = {name: {key: stats.get(key) for key in ("mean", "p50", "p95", "p99", "max")}
+                   for name, stats in analysis["stats"].items() if stats.get("count")}
+        for marker in analysis["markers"]:
+            if marker.get("count"):
+                summary[marker["name"]] = {key: marker.get(key) for key in ("mean", "p50", "p95", "p99", "max")}
+        meta = {
+            "id": session_id,
+            "created_at": created,
+            "commit": commit,
+            "scene": scene,
+            "mode": mode,
+            "settings": settings or {},
+            "frames": frames,
+            "complete": complete,
+            "warmup_frames": warmup_frames,
+            "fps": analysis["fps"],
+            "unity_version": capture.meta.get("unity_version"),
+            "platform": capture.meta.get("platform"),
+            "columns": columns,
+            "summary": summary,
+        }
+        with open(session_dir / self.META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        entry = {key: meta[key] for key in ("id", "created_at", "commit", "scene", "mode", "frames", "fps", "complete")}
+        with self._lock:
+            with open(self.root / self.INDEX_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._prune()
+        return session_id
+
+    def _write_columns(self, capture, session_dir, files, frames):
+        """Транспонирует frames.bin (строки) в колонки блоками по CHUNK_FRAMES кадров"""
+        handles = [open(session_dir / name, 'wb') for name in files]
+        try:
+            for i, handle in enumerate(handles):
+                handle.write(self._npy_header('<u4' if i == 0 else '<f4', frames))
+            if np is not None:
+                matrix = np.memmap(capture.data_path, dtype='<f4', mode='r', shape=(frames, len(files)))
+                for start in range(0, frames, self.CHUNK_FRAMES):
+                    block = np.array(matrix[start:start + self.CHUNK_FRAMES])
+                    for i, handle in enumerate(handles):
+                        handle.write(block[:, i].tobytes())
+                return
+            block = []
+            for frame in capture.iter_frames():
+                block.append(frame)
+                if len(block) == self.CHUNK_FRAMES:
+                    self._write_block(handles, block)
+                    block = []
+            self._write_block(handles, block)
+        finally:
+            for handle in handles:
+                handle.close()
+
+    @staticmethod
+    def _write_block(handles, block):
+        for i, (handle, values) in enumerate(zip(handles, zip(*block))):
+            column = array.array('I' if i == 0 else 'f', values)
+            if sys.byteorder == 'big':
+                column.byteswap()
+            column.tofile(handle)
+
+    def _prune(self):
+        """Оставляет keep последних сессий"""
+        entries = self.sessions(incomplete=True)
+        if not self.keep or len(entries) <= self.keep:
+            return
+        for entry in entries[:-self.keep]:
+            shutil.rmtree(self.root / entry["id"], ignore_errors=True)
+        with open(self.root / (self.INDEX_FILE + ".tmp"), 'w', encoding='utf-8') as f:
+            for entry in entries[-self.keep:]:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(self.root / (self.INDEX_FILE + ".tmp"), self.root / self.INDEX_FILE)
+
+    def sessions(self, scene=None, mode=None, commit=None, last=None, incomplete=False):
+        """Записи индекса по возрастанию времени с фильтрами; last - только последние N, incomplete - с неполными"""
+        index_path = self.root / self.INDEX_FILE
+        if not index_path.exists():
+            return []
+        entries = []
+        with open(index_path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if scene and entry["scene"] != scene:
+                    continue
+                if mode and entry["mode"] != mode:
+                    continue
+                if commit and not entry["commit"].startswith(commit):
+                    continue
+                if not incomplete and not entry.get("complete", True):
+                    continue
+                entries.append(entry)
+        entries.sort(key=lambda e: e["created_at"])
+        return entries[-last:] if last else entries
+
+    def meta(self, session_id):
+        with open(self.root / session_id / self.META_FILE, encoding='utf-8') as f:
+            return json.load(f)
+
+    def column(self, session_id, name, meta=None):
+        """Колонка сессии: np.memmap (numpy) или array, None если колонки нет"""
+        meta = meta or self.meta(session_id)
+        if name not in meta["columns"]:
+            return None
+        path = self.root / session_id / meta["columns"][name]
+        if np is not None:
+            return np.load(path, mmap_mode='r')
+        with open(path, 'rb') as f:
+            f.seek(8)
+            header_length = struct.unpack("<H", f.read(2))[0]
+            f.seek(10 + header_length)
+            values = array.array('I' if name == "frame" else 'f')
+            values.frombytes(f.read())
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def query(self, metric, stat="median", scene=None, mode=None, commit=None, last=50):
+        """
+        Статистика metric (поле кадра или маркер) по последним сессиям: значение каждой сессии из сводки meta.json
+        и общая статистика по всем кадрам; читается только нужная колонка, блоками через mmap
+        """
+        per_session = []
+        pooled = StreamingStats()
+        key = "p50" if stat == "median" else stat
+        for entry in self.sessions(scene, mode, commit, last):
+            meta = self.meta(entry["id"])
+            values = self.column(entry["id"], metric, meta)
+            if values is None:
+                continue
+            per_session.append({**entry, "value": meta["summary"].get(metric, {}).get(key)})
+            skip = min(meta.get("warmup_frames", 0), len(values))
+            for start in range(skip, len(values), self.CHUNK_FRAMES):
+                pooled.add_many(values[start:start + self.CHUNK_FRAMES])
+
+        if not pooled.count:
+            return {"metric": metric, "stat": stat, "sessions": per_session, "frames": 0, "value": None}
+        value = {"median": pooled.percentile(50), "mean": pooled.mean, "p95": pooled.percentile(95),
+                 "p99": pooled.percentile(99), "max": pooled.max}[stat]
+        return {"metric": metric, "stat": stat, "sessions": per_session, "frames": pooled.count,
+                "value": round(value, 4)}
+
+
+def parse_sweep_matrix(spec):
+    """
+    Матрица свипа: JSON-файл {"quality_level": [0, 2, 5], ...} или строка "quality_level=0,2,5;anti_aliasing=0,4"
+    """
+    if os.path.exists(spec):
+        with open(spec, encoding='utf-8') as f:
+            matrix = json.load(f)
+    else:
+        matrix = {}
+        for part in filter(None, (item.strip() for item in spec.split(';'))):
+            name, _, values = part.partition('=')
+            matrix[name.strip()] = [int(value) for value in values.split(',') if value.strip()]
+    unknown = [name for name in matrix if name not in KNOB_LABELS]
+    if unknown or not all(matrix.values()):
+        raise ValueError(f"неизвестные или пустые параметры свипа: {', '.join(unknown) or spec}")
+    return {name: sorted(set(int(v) for v in values)) for name, values in matrix.items()}
+
+
+def pareto_front(results, metric):
+    """Парето-оптимальные комбинации: меньше время metric при не меньшем качестве"""
+    front = []
+    best_quality = -math.inf
+    for result in sorted(results, key=lambda r: (r[metric], -r["quality"])):
+        if result["quality"] > best_quality:
+            front.append(result)
+            best_quality = result["quality"]
+    return front
+
+
+def median(values):
+    """Медиана непустого ряда"""
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def bootstrap_ratio(current, baseline, iterations=2000, confidence=0.95, seed=0):
+    """
+    Относительное изменение медианы current к медиане baseline и бутстрап-доверительный интервал
+    Выборки - медианы отдельных прогонов; при одном прогоне с каждой стороны интервал вырождается в точку
+    """
+    base = median(baseline)
+    if base <= 0:
+        return 0.0, 0.0, 0.0
+    change = median(current) / base - 1
+    rng = random.Random(seed)
+    ratios = []
+    for _ in range(iterations):
+        resampled_base = median(rng.choices(baseline, k=len(baseline)))
+        if resampled_base > 0:
+            ratios.append(median(rng.choices(current, k=len(current))) / resampled_base - 1)
+    ratios.sort()
+    if not ratios:
+        return change, change, change
+    tail = (1 - confidence) / 2
+    low = ratios[int(tail * (len(ratios) - 1))]
+    high = ratios[int((1 - tail) * (len(ratios) - 1))]
+    return change, low, high
+
+
+class BenchmarkBaseline:
+    """
+    База бенчмарков (SQLite): прогоны по коммитам и сценам, распределения времени кадра и маркеров по прогону
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            commit_id TEXT NOT NULL,
+            scene TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            frames INTEGER NOT NULL,
+            fps REAL NOT NULL,
+            unity_version TEXT,
+            platform TEXT
+        );
+        CREATE INDEX IF NOT EXISTS runs_commit ON runs (scene, commit_id);
+        CREATE TABLE IF NOT EXISTS samples (
+            run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            metric TEXT NOT NULL,
+            median REAL NOT NULL,
+            mean REAL NOT NULL,
+            p95 REAL NOT NULL,
+            max REAL NOT NULL,
+            histogram TEXT NOT NULL,
+            PRIMARY KEY (run_id, metric)
+        );
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path))
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def metrics(analysis):
+        """Сравниваемые ряды прогона: время кадра, main thread и маркеры ECS-систем"""
+        series = {name: analysis["stats"][name] for name in ("frame_ms", "main_thread_ms")
+                  if analysis["stats"].get(name, {}).get("max")}
+        for marker in analysis["markers"]:
+            if marker.get("count"):
+                series[marker["name"]] = marker
+        return series
+
+    def record(self, commit_id, scene, analysis):
+        """Сохраняет прогон (analyze(histograms=True)), возвращает id"""
+        with self._conn:
+            run_id = self._conn.execute(
+                "INSERT INTO runs (commit_id, scene, created_at, frames, fps, unity_version, platform) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (commit_id, scene, time.time(), analysis["frames"], analysis["fps"],
+                 analysis.get("unity_version"), analysis.get("platform"))).lastrowid
+            self._conn.executemany(
+                "INSERT INTO samples (run_id, metric, median, mean, p95, max, histogram) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, metric, stats["p50"], stats["mean"], stats["p95"], stats["max"],
+                  json.dumps(stats.get("histogram", {})))
+                 for metric, stats in self.metrics(analysis).items()])
+        return run_id
+
+    def nearest_ancestor(self, scene, ancestors, exclude=None):
+        """
+        Ближайший предок с прогонами сцены: ancestors - полные хэши от HEAD вглубь истории
+        Грязные ('-dirty') и 'unknown' прогоны базовой линией не выбираются
+        """
+        stored = [row["commit_id"] for row in self._conn.execute(
+            "SELECT DISTINCT commit_id FROM runs WHERE scene = ?", (scene,))]
+        clean = [commit for commit in stored
+                 if commit != exclude and commit != "unknown" and not commit.endswith("-dirty")]
+        for full in ancestors:
+            for commit in clean:
+                if full.startswith(commit):
+                    return commit
+        return None
+
+    def medians(self, scene, commit_id=None, run_ids=None):
+        """Медианы по прогонам: метрика -> [медиана прогона, ...]"""
+        if run_ids is not None:
+            marks = ",".join("?" * len(run_ids))
+            rows = self._conn.execute(
+                f"SELECT metric, median FROM samples WHERE run_id IN ({marks}) ORDER BY run_id", list(run_ids))
+        else:
+            rows = self._conn.execute(
+                "SELECT s.metric, s.median FROM samples s JOIN runs r ON r.id = s.run_id "
+                "WHERE r.scene = ? AND r.commit_id = ? ORDER BY r.id", (scene, commit_id))
+        result = {}
+        for row in rows:
+            result.setdefault(row["metric"], []).append(row["median"])
+        return result
+
+    def close(self):
+        self._conn.close()
+
+
+class ProfilerSession:
+    """Сессия профилирования: сцена и экземпляр со своим портом, конфигурацией и каталогом вывода"""
+
+    def __init__(self, scene, instance, port, output_dir):
+        self.scene = scene
+        self.instance = instance
+        self.port = port
+        self.output_dir = output_dir
+        self.config_path = None
+        self.process = None
+        self.sampler = None
+        self.monitor = None
+        self.returncode = None
+        self.started_at = None
+        self.elapsed = None
+        self.stop_reason = None
+        # Время, когда runner сам послал остановку, и был ли kill после stop_grace
+        self.stop_sent_at = None
+        self.killed = False
+        self.ok = False
+        # Режим и прогрев для архива истории
+        self.mode = "standalone"
+        self.warmup_frames = 0
+        # Комбинация performance_settings сессии свипа
+        self.settings = {}
+        self.label = None
+
+    @property
+    def name(self):
+        return f"{self.scene}-{self.instance}"
+
+    @property
+    def log_path(self):
+        return os.path.join(self.output_dir, "unity_log.txt")
+
+
 class UnityProfilerRunner:
+    DEFAULT_PORT = 54998
+
     def __init__(self, project_path=None):
         self.project_path = project_path or os.getcwd()
         self.unity_path = self.find_unity_executable()
         self.profiler_data_path = os.path.join(self.project_path, "ProfilerData")
+        self.sessions = []
+        self.hitch_factor = 2.0
+        self.hitch_window = 31
+        self._ports = set()
+        self.history = SessionStore(os.path.join(self.profiler_data_path, "history"))
+        self._commit = None
         
     def find_unity_executable(self):
         """Находит исполняемый файл Unity"""
@@ -47,12 +1264,39 @@ class UnityProfilerRunner:
             
         return None
     
-    def create_profiler_config(self):
+    def allocate_port(self):
+        """Свободный TCP-порт для профилировщика сессии (не выданный ранее в этом запуске)"""
+        while True:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+                probe.bind(("127.0.0.1", 0))
+                port = probe.getsockname()[1]
+            if port not in self._ports:
+                self._ports.add(port)
+                return port
+
+    def plan_sessions(self, scenes, instances=1):
+        """Сессии для каждой сцены и экземпляра: свой порт и каталог ProfilerData/sessions/<сцена>-<n>"""
+        sessions = []
+        for scene in scenes:
+            for instance in range(1, instances + 1):
+                output_dir = os.path.join(self.profiler_data_path, "sessions", f"{scene}-{instance}")
+                # Каталог сессии переиспользуется: кадры прошлого запуска не должны попасть в отчет и историю
+                for name in (ProfilerCapture.META_FILE, ProfilerCapture.DATA_FILE,
+                             ProcessSampler.META_FILE, ProcessSampler.DATA_FILE):
+                    if os.path.exists(os.path.join(output_dir, name)):
+                        os.remove(os.path.join(output_dir, name))
+                session = ProfilerSession(scene, instance, self.allocate_port(), output_dir)
+                session.config_path = self.create_profiler_config(session.port, output_dir)
+                sessions.append(session)
+        self.sessions.extend(sessions)
+        return sessions
+
+    def create_profiler_config(self, port=DEFAULT_PORT, output_dir=None, performance_settings=None):
         """Создает конфигурацию для профилирования"""
         config = {
             "profiler_settings": {
                 "enable_profiler": True,
-                "profiler_port": 54998,
+                "profiler_port": port,
                 "profiler_ip": "127.0.0.1",
                 "profiler_connection_mode": "Local",
                 "profiler_frame_count": 1000,
@@ -77,14 +1321,23 @@ class UnityProfilerRunner:
             }
         }
         
-        config_path = os.path.join(self.project_path, "profiler_config.json")
+        config["performance_settings"].update(performance_settings or {})
+        
+        output_dir = output_dir or self.project_path
+        os.makedirs(output_dir, exist_ok=True)
+        config_path = os.path.join(output_dir, "profiler_config.json")
         with open(config_path, 'w') as f:
             json.dump(config, f, indent=2)
             
         return config_path
     
-    def run_profiler_standalone(self, build_path=None):
-        """Запускает профилирование standalone сборки"""
+    def run_profiler_standalone(self, build_path=None, scenes=None, instances=1, max_parallel=1, frames=0,
+                                timeout=None, duration=None, sample_interval=0.5):
+        """
+        Запускает профилирование standalone сборки под наблюдением: сессия на каждую сцену и экземпляр
+        Сессии выполняются параллельно (не больше max_parallel), frames > 0 завершает экземпляр после N кадров,
+        duration - после N секунд; процесс каждого экземпляра сэмплируется из /proc каждые sample_interval секунд
+        """
         if not build_path:
             build_path = os.path.join(self.project_path, "Builds", "MudLike.exe")
             
@@ -95,27 +1348,164 @@ class UnityProfilerRunner:
             
         print(f"🚀 Запуск профилирования standalone сборки: {build_path}")
         
-        # Создаем конфигурацию
-        config_path = self.create_profiler_config()
-        
-        # Запускаем сборку с профилированием
+        sessions = self.plan_sessions(scenes or ["Main"], instances)
+        commands = {session.name: self._standalone_command(build_path, session, frames) for session in sessions}
+        return self.run_sessions(sessions, commands, max_parallel, cwd=os.path.dirname(build_path) or None,
+                                 timeout=timeout, duration=duration, sample_interval=sample_interval)
+
+    @staticmethod
+    def _standalone_command(build_path, session, frames=0, headless=False):
+        """Команда запуска сборки с профилированием на порту и в каталоге сессии"""
         cmd = [
             build_path,
             "-profiler",
-            "-profiler-port", "54998",
+            "-profiler-port", str(session.port),
             "-profiler-ip", "127.0.0.1",
-            "-profiler-connection-mode", "Local"
+            "-profiler-connection-mode", "Local",
+            "-mudlikeScene", session.scene,
+            "-mudlikeCaptureFrames", str(frames),
+            "-mudlikeProfilerOutput", session.output_dir,
+            "-logFile", session.log_path
         ]
-        
+        if headless:
+            cmd[1:1] = ["-batchmode", "-nographics"]
+        return cmd
+
+    def run_sessions(self, sessions, commands, max_parallel=1, cwd=None, timeout=None, duration=None,
+                     sample_interval=0.5, stop_grace=15, monitor=None):
+        """
+        Выполняет сессии одновременно, не больше max_parallel; общее время - время самой долгой волны
+        duration - длительность захвата, после нее экземпляр останавливается (SIGTERM, через stop_grace - kill)
+        Для каждого экземпляра сэмплер пишет CPU/RSS/page faults/потоки/I/O из /proc в каталог сессии
+        monitor(session) - дополнительный наблюдатель запущенного экземпляра (объект с stop())
+        """
+        pending = list(sessions)
+        running = []
+        started = time.time()
+        max_parallel = max(1, max_parallel)
+        sample = sample_interval and ProcessSampler.available()
+        print(f"⚙️ Сессий: {len(sessions)}, одновременно: {min(max_parallel, len(sessions))}"
+              + (f", захват {duration} с" if duration else ""))
+        if sample_interval and not sample:
+            print("⚠️ /proc недоступен: сэмплинг процесса отключен")
+
         try:
-            process = subprocess.Popen(cmd, cwd=os.path.dirname(build_path))
-            print(f"✅ Standalone сборка запущена с PID: {process.pid}")
-            print("📊 Подключитесь к профилировщику через Unity Editor")
-            return True
-        except Exception as e:
-            print(f"❌ Ошибка запуска: {e}")
-            return False
+            while pending or running:
+                while pending and len(running) < max_parallel:
+                    session = pending.pop(0)
+                    try:
+                        session.process = subprocess.Popen(commands[session.name], cwd=cwd or self.project_path,
+                                                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    except OSError as e:
+                        print(f"❌ {session.name}: ошибка запуска: {e}")
+                        session.returncode = -1
+                        continue
+                    session.started_at = time.time()
+                    if sample:
+                        session.sampler = ProcessSampler(session.process.pid, sample_interval).start()
+                    if monitor:
+                        session.monitor = monitor(session)
+                    running.append(session)
+                    print(f"▶️ {session.name}: PID {session.process.pid}, профилировщик 127.0.0.1:{session.port}")
+
+                time.sleep(0.2)
+                for session in list(running):
+                    elapsed = time.time() - session.started_at
+                    if session.stop_sent_at is None:
+                        if duration and elapsed > duration:
+                            print(f"⏹️ {session.name}: захват {duration} с завершен, остановка")
+                            self._stop_session(session, "duration")
+                        elif timeout and elapsed > timeout:
+                            print(f"⏱️ {session.name}: превышен таймаут {timeout} с, остановка")
+                            self._stop_session(session, "timeout")
+                    if session.process.poll() is None:
+                        # Остановка не ждет завершения: остальные сессии продолжают проверяться
+                        if session.stop_sent_at and time.time() - session.stop_sent_at > stop_grace:
+                            self._kill_session(session, stop_grace)
+                        continue
+                    self._finish_session(session)
+                    running.remove(session)
+        except KeyboardInterrupt:
+            for session in running:
+                self._stop_session(session, "interrupt")
+            deadline = time.time() + stop_grace
+            for session in running:
+                try:
+                    session.process.wait(max(0.0, deadline - time.time()))
+                except subprocess.TimeoutExpired:
+                    self._kill_session(session, stop_grace)
+                self._finish_session(session)
+            raise
+
+        failed = [session.name for session in sessions if not session.ok]
+        print(f"⏱️ Все сессии завершены за {time.time() - started:.1f} с")
+        if failed:
+            print(f"❌ Сессии с ошибкой: {', '.join(failed)}")
+        return not failed
+
+    @staticmethod
+    def _stop_session(session, reason):
+        """
+        Штатная остановка без ожидания: SIGTERM (Unity завершает кадр и закрывает экспорт),
+        на Windows - TerminateProcess; kill после stop_grace делает цикл run_sessions
+        """
+        session.stop_reason = reason
+        if session.process.poll() is not None or session.stop_sent_at is not None:
+            return
+        session.stop_sent_at = time.time()
+        session.process.terminate()
+
+    @staticmethod
+    def _kill_session(session, grace):
+        print(f"⚠️ {session.name}: не завершился за {grace} с после остановки, kill")
+        session.killed = True
+        session.process.kill()
+        session.process.wait()
+
+    def _finish_session(self, session):
+        session.returncode = session.process.wait()
+        session.elapsed = time.time() - session.started_at
+        if session.sampler:
+            session.sampler.stop()
+            session.sampler.save(session.output_dir)
+        if session.monitor:
+            session.monitor.stop()
+        # Остановка по длительности захвата - штатное завершение при любом коде выхода после нее
+        # (SIGTERM дает -15/143, TerminateProcess на Windows - 1), если не понадобился kill
+        stopped = session.stop_reason == "duration" and session.stop_sent_at is not None and not session.killed
+        session.ok = session.returncode == 0 or stopped
+        icon = "✅" if session.ok else "❌"
+        print(f"{icon} {session.name}: код {session.returncode} за {session.elapsed:.1f} с"
+              + (f" (остановлен: {session.stop_reason})" if session.stop_reason else ""))
+        self.archive_session(session)
+
+    def archive_session(self, session, output_dir=None):
+        """
+        Сохраняет кадры сессии в историю (ProfilerData/history), если history включена и захват есть;
+        захват сессии с ошибкой сохраняется как неполный и не входит в запросы
+        """
+        if self.history is None:
+            return None
+        if self._commit is None:
+            self._commit = self.current_commit()
+        try:
+            session_id = self.history.ingest(output_dir or session.output_dir, session.scene, session.mode,
+                                             self._commit, session.settings, session.warmup_frames, session.ok)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ {session.name}: не удалось сохранить в историю: {e}")
+            return None
+        if session_id:
+            print(f"🗄️ {session.name}: сохранено в историю как {session_id}" + ("" if session.ok else " (неполная)"))
+        return session_id
     
+    def _check_editor_capture(self, session):
+        """Editor/headless (-executeMethod -batchmode -quit) не входят в Play Mode и обычно не пишут frames.bin"""
+        if ProfilerCapture.find(session.output_dir) is None:
+            print("ℹ️ Покадровый экспорт не записан: режимы editor/headless не входят в Play Mode. "
+                  "Для HTML отчета и истории используйте --mode standalone --build-path ...")
+            return
+        self.archive_session(session)
+
     def run_profiler_editor(self, scene_name="Main"):
         """Запускает профилирование в Unity Editor"""
         if not self.unity_path:
@@ -126,8 +1516,9 @@ class UnityProfilerRunner:
         print(f"📁 Проект: {self.project_path}")
         print(f"🎮 Сцена: {scene_name}")
         
-        # Создаем конфигурацию
-        config_path = self.create_profiler_config()
+        # Своя конфигурация и порт, чтобы не конфликтовать с другими сессиями
+        session = self.plan_sessions([scene_name])[0]
+        session.mode = "editor"
         
         # Запускаем Unity Editor с профилированием
         cmd = [
@@ -135,9 +1526,10 @@ class UnityProfilerRunner:
             "-projectPath", self.project_path,
             "-executeMethod", "MudLike.Profiler.ProfilerStarter.StartProfiling",
             "-profiler",
-            "-profiler-port", "54998",
+            "-profiler-port", str(session.port),
             "-profiler-ip", "127.0.0.1",
             "-profiler-connection-mode", "Local",
+            "-mudlikeProfilerOutput", session.output_dir,
             "-batchmode",
             "-quit"
         ]
@@ -148,6 +1540,9 @@ class UnityProfilerRunner:
             
             # Ждем завершения
             return_code = process.wait()
+            session.returncode = return_code
+            session.ok = return_code == 0
+            self._check_editor_capture(session)
             
             if return_code == 0:
                 print("✅ Профилирование завершено успешно")
@@ -170,8 +1565,9 @@ class UnityProfilerRunner:
         print(f"📁 Проект: {self.project_path}")
         print(f"🎮 Сцена: {scene_name}")
         
-        # Создаем конфигурацию
-        config_path = self.create_profiler_config()
+        # Своя конфигурация и порт, чтобы не конфликтовать с другими сессиями
+        session = self.plan_sessions([scene_name])[0]
+        session.mode = "headless"
         
         # Запускаем Unity в headless режиме с профилированием
         cmd = [
@@ -179,12 +1575,13 @@ class UnityProfilerRunner:
             "-projectPath", self.project_path,
             "-executeMethod", "MudLike.Profiler.ProfilerStarter.StartHeadlessProfiling",
             "-profiler",
-            "-profiler-port", "54998",
+            "-profiler-port", str(session.port),
             "-profiler-ip", "127.0.0.1",
             "-profiler-connection-mode", "Local",
+            "-mudlikeProfilerOutput", session.output_dir,
             "-batchmode",
             "-quit",
-            "-logfile", os.path.join(self.project_path, "profiler_log.txt")
+            "-logfile", session.log_path
         ]
         
         try:
@@ -193,6 +1590,9 @@ class UnityProfilerRunner:
             
             # Ждем завершения
             return_code = process.wait()
+            session.returncode = return_code
+            session.ok = return_code == 0
+            self._check_editor_capture(session)
             
             if return_code == 0:
                 print("✅ Headless профилирование завершено успешно")
@@ -205,10 +1605,339 @@ class UnityProfilerRunner:
             print(f"❌ Ошибка запуска Unity: {e}")
             return False
     
-    def generate_profiler_report(self):
-        """Генерирует отчет профилирования"""
-        report_path = os.path.join(self.project_path, "ProfilerReport.html")
-        
+    def run_soak(self, build_path, scene="Main", duration=4 * 3600, headless=True, warmup=300, interval=5.0,
+                 thresholds=None, sample_interval=5.0, report_interval=300):
+        """
+        Soak-тест: долгий прогон сцены с онлайн-трендами памяти и аллокаций
+        Возвращает 0 без утечек, 1 при ошибке прогона, 2 при обнаруженной утечке
+        """
+        if not os.path.exists(build_path):
+            print(f"❌ Сборка не найдена: {build_path}")
+            return 1
+
+        thresholds = thresholds or {}
+        session = self.plan_sessions([scene])[0]
+        session.mode = "soak"
+        print(f"🧪 Soak {scene}: {duration / 3600:.2f} ч, прогрев {warmup} с, пороги "
+              + ", ".join(f"{name} {value:g}" for name, value in thresholds.items()))
+        ok = self.run_sessions(
+            [session], {session.name: self._standalone_command(build_path, session, headless=headless)},
+            cwd=os.path.dirname(build_path) or None, duration=duration, sample_interval=sample_interval,
+            monitor=lambda s: SoakMonitor(s, interval, warmup, report_interval).start())
+
+        verdict = session.monitor.verdict(thresholds) if session.monitor else {"trends": {}, "leaks": []}
+        verdict.update({"scene": scene, "duration_s": duration, "completed": ok})
+        with open(os.path.join(session.output_dir, "soak.json"), 'w', encoding='utf-8') as f:
+            json.dump(verdict, f, indent=2, ensure_ascii=False)
+
+        units = {"rss_mb": "MB/ч", "total_used_mb": "MB/ч", "gc_used_mb": "MB/ч", "gc_alloc_kb": "KB/кадр за ч"}
+        print(f"\n📈 Тренды {scene} ({verdict.get('frames', 0)} кадров):")
+        for name, trend in verdict["trends"].items():
+            if not trend["samples"]:
+                continue
+            icon = "❌" if trend["leak"] else "✅"
+            limit = f", порог {trend['threshold']:g}" if trend["threshold"] is not None else ""
+            print(f"  {icon} {name}: {trend['slope']:+.2f} {units[name]} (R² {trend['r2']:.2f}, "
+                  f"последнее {trend['last']:.1f}{limit})")
+        print(f"📁 Результаты: {os.path.join(session.output_dir, 'soak.json')}")
+
+        if not ok:
+            return 1
+        if verdict["leaks"]:
+            print(f"❌ Обнаружена утечка: {', '.join(verdict['leaks'])}")
+            return 2
+        print("✅ Утечек не обнаружено")
+        return 0
+
+    def run_sweep(self, build_path, scene, matrix, warmup_frames=120, frames=600, max_parallel=1, metric="frame_p95",
+                  timeout=600):
+        """
+        Свип performance_settings: сессия на каждую комбинацию матрицы (параллельно до max_parallel),
+        таблица сравнения, стоимость каждого значения параметра и Парето-множество время кадра / качество
+        """
+        if not os.path.exists(build_path):
+            print(f"❌ Сборка не найдена: {build_path}")
+            return 1
+
+        names = list(matrix)
+        combos = [dict(zip(names, values)) for values in itertools.product(*(matrix[name] for name in names))]
+        # Без vsync/target_fps в матрице частота кадров не ограничивается, иначе меряется ожидание
+        uncapped = not any(name in matrix for name in ("vsync_count", "target_fps"))
+        sweep_dir = os.path.join(self.profiler_data_path, "sweep", scene)
+        print(f"🎚️ Свип {scene}: {len(combos)} комбинаций ({', '.join(f'{n}={matrix[n]}' for n in names)})")
+
+        sessions = []
+        commands = {}
+        for index, settings in enumerate(combos, 1):
+            label = "-".join(f"{KNOB_LABELS[name]}{value}" for name, value in settings.items())
+            session = ProfilerSession(scene, index, self.allocate_port(), os.path.join(sweep_dir, label))
+            session.settings = settings
+            session.label = label
+            session.mode = "sweep"
+            session.warmup_frames = warmup_frames
+            session.config_path = self.create_profiler_config(session.port, session.output_dir, settings)
+            command = self._standalone_command(build_path, session, warmup_frames + frames)
+            command += ["-mudlikeProfilerConfig", session.config_path] + (["-mudlikeUncapped"] if uncapped else [])
+            commands[session.name] = command
+            sessions.append(session)
+        self.sessions.extend(sessions)
+
+        self.run_sessions(sessions, commands, max_parallel, cwd=os.path.dirname(build_path) or None,
+                          timeout=timeout)
+
+        # Качество - средний нормированный ранг значений параметров качества в матрице
+        quality_knobs = [name for name in names if name in QUALITY_KNOBS and len(matrix[name]) > 1]
+        results = []
+        for session in sessions:
+            capture = ProfilerCapture.find(session.output_dir) if session.ok else None
+            analysis = capture.analyze(warmup_frames) if capture else None
+            if not analysis or not analysis["frames"]:
+                print(f"⚠️ {session.label}: нет данных кадров, комбинация пропущена")
+                continue
+            stats = analysis["stats"]
+            markers = [m for m in analysis["markers"] if m.get("count")]
+            quality = (sum(matrix[name].index(session.settings[name]) / (len(matrix[name]) - 1)
+                           for name in quality_knobs) / len(quality_knobs)) if quality_knobs else 0.0
+            results.append({
+                "label": session.label,
+                "settings": session.settings,
+                "quality": round(quality, 3),
+                "frames": analysis["frames"],
+                "fps": analysis["fps"],
+                "frame_p50": stats["frame_ms"]["p50"],
+                "frame_p95": stats["frame_ms"]["p95"],
+                "main_p50": stats.get("main_thread_ms", {}).get("p50", 0.0),
+                "ecs_ms": round(sum(m["mean"] for m in markers), 3),
+                "top_systems": [{"name": m["name"], "mean": m["mean"]} for m in markers[:3]],
+            })
+        if not results:
+            print("❌ Ни одна комбинация не дала данных кадров")
+            return 1
+
+        front = pareto_front(results, metric)
+        for result in results:
+            result["pareto"] = result in front
+
+        # Стоимость значения параметра - среднее metric по комбинациям с этим значением
+        knob_costs = {}
+        for name in names:
+            knob_costs[name] = {}
+            for value in matrix[name]:
+                subset = [r[metric] for r in results if r["settings"][name] == value]
+                if subset:
+                    knob_costs[name][str(value)] = round(sum(subset) / len(subset), 3)
+
+        print(f"\n📊 {scene}: сравнение по {metric}")
+        print(f"  {'комбинация':<28} {'кач.':>5} {'p50':>8} {'p95':>8} {'main':>8} {'ECS':>8} {'FPS':>7}")
+        for result in sorted(results, key=lambda r: r[metric]):
+            mark = "⭐" if result["pareto"] else "  "
+            print(f"{mark}{result['label']:<28} {result['quality']:>5.2f} {result['frame_p50']:>8.2f} "
+                  f"{result['frame_p95']:>8.2f} {result['main_p50']:>8.2f} {result['ecs_ms']:>8.2f} {result['fps']:>7.1f}")
+        print("\n💰 Стоимость значений параметров (среднее " + metric + ", мс):")
+        for name, costs in knob_costs.items():
+            print(f"  {name}: " + ", ".join(f"{value} → {cost:.2f}" for value, cost in costs.items()))
+        print("⭐ Парето-множество: " + ", ".join(r["label"] for r in front))
+
+        report_path = os.path.join(sweep_dir, "sweep.json")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({"scene": scene, "matrix": matrix, "metric": metric, "warmup_frames": warmup_frames,
+                       "frames": frames, "results": results, "knob_costs": knob_costs,
+                       "pareto": [r["label"] for r in front]}, f, indent=2, ensure_ascii=False)
+        print(f"📁 Результаты: {report_path}")
+        return 0
+
+    def current_commit(self):
+        """Коммит проекта - ключ базы бенчмарков ('-dirty' при незакоммиченных изменениях)"""
+        try:
+            commit = subprocess.run(["git", "rev-parse", "--short=12", "HEAD"], cwd=self.project_path,
+                                    capture_output=True, text=True, check=True).stdout.strip()
+            dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=self.project_path,
+                                   capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return "unknown"
+        return commit + ("-dirty" if dirty else "")
+
+    def ancestor_commits(self, limit=1000):
+        """Полные хэши HEAD и его предков (ближайшие первыми) для выбора базовой линии"""
+        try:
+            return subprocess.run(["git", "rev-list", f"--max-count={limit}", "HEAD"], cwd=self.project_path,
+                                  capture_output=True, text=True, check=True).stdout.split()
+        except (OSError, subprocess.CalledProcessError):
+            return []
+
+    def run_capture(self, build_path, scene, output_dir, frames, timeout=600):
+        """Headless прогон standalone сборки на frames кадров с экспортом кадров в output_dir"""
+        os.makedirs(output_dir, exist_ok=True)
+        for name in (ProfilerCapture.META_FILE, ProfilerCapture.DATA_FILE):
+            if os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+
+        cmd = [
+            build_path,
+            "-batchmode",
+            "-nographics",
+            "-mudlikeUncapped",
+            "-mudlikeScene", scene,
+            "-mudlikeCaptureFrames", str(frames),
+            "-mudlikeProfilerOutput", output_dir,
+            "-logFile", os.path.join(output_dir, "player.log")
+        ]
+        try:
+            result = subprocess.run(cmd, cwd=os.path.dirname(build_path) or None, timeout=timeout,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except subprocess.TimeoutExpired:
+            print(f"❌ {scene}: прогон не завершился за {timeout} с")
+            return None
+        except OSError as e:
+            print(f"❌ Ошибка запуска сборки: {e}")
+            return None
+        if result.returncode != 0:
+            print(f"❌ {scene}: сборка завершилась с кодом {result.returncode}")
+            return None
+        return ProfilerCapture.find(output_dir)
+
+    def run_benchmark(self, build_path, scenes, runs=5, warmup_frames=120, frames=600, threshold=10.0,
+                      system_thresholds=None, baseline_commit=None, db_path=None, min_ms=0.05, timeout=600):
+        """
+        Бенчмарк: runs прогонов каждой сцены, сохранение в базу по коммиту и сравнение с базовым коммитом
+        Регрессия - рост медианы больше порога при нижней границе 95% бутстрап-интервала выше нуля
+        Возвращает 0 без регрессий, 1 при ошибке прогона, 2 при регрессии
+        """
+        if not os.path.exists(build_path):
+            print(f"❌ Сборка не найдена: {build_path}")
+            return 1
+
+        system_thresholds = system_thresholds or {}
+        commit = self.current_commit()
+        baseline = BenchmarkBaseline(db_path or os.path.join(self.profiler_data_path, "benchmarks.db"))
+        run_ids = {scene: [] for scene in scenes}
+        print(f"🏁 Бенчмарк {commit}: сцены {', '.join(scenes)}, {runs} прогонов, "
+              f"{warmup_frames} кадров прогрева + {frames} кадров")
+
+        try:
+            # Сцены чередуются внутри каждого прогона, чтобы дрейф машины не ложился на одну сцену
+            for index in range(runs):
+                for scene in scenes:
+                    output_dir = os.path.join(self.profiler_data_path, "benchmark", scene, str(index))
+                    capture = self.run_capture(build_path, scene, output_dir, warmup_frames + frames, timeout)
+                    analysis = capture.analyze(warmup_frames, histograms=True) if capture else None
+                    if not analysis or not analysis["frames"]:
+                        print(f"❌ {scene}: прогон {index + 1} не дал данных кадров")
+                        return 1
+                    run_ids[scene].append(baseline.record(commit, scene, analysis))
+                    session = ProfilerSession(scene, index + 1, None, output_dir)
+                    session.mode = "benchmark"
+                    session.warmup_frames = warmup_frames
+                    session.ok = True
+                    self.archive_session(session)
+                    frame = analysis["stats"]["frame_ms"]
+                    print(f"  {scene} #{index + 1}: median {frame['p50']:.2f} ms, p95 {frame['p95']:.2f} ms, "
+                          f"{analysis['fps']:.1f} FPS")
+
+            results = {}
+            regressions = []
+            ancestors = [] if baseline_commit else self.ancestor_commits()
+            for scene in scenes:
+                base_commit = baseline_commit or baseline.nearest_ancestor(scene, ancestors, exclude=commit)
+                base = baseline.medians(scene, commit_id=base_commit) if base_commit else {}
+                if not base:
+                    print(f"ℹ️ {scene}: нет базовой линии для сравнения, прогоны сохранены как базовые для {commit}")
+                    results[scene] = {"baseline": None, "metrics": []}
+                    continue
+
+                print(f"\n📊 {scene}: {commit} против {base_commit}")
+                comparisons = []
+                for metric, values in baseline.medians(scene, run_ids=run_ids[scene]).items():
+                    if metric not in base:
+                        continue
+                    limit = system_thresholds.get(metric, threshold)
+                    change, low, high = bootstrap_ratio(values, base[metric])
+                    base_median = median(base[metric])
+                    if base_median < min_ms:
+                        status = "skipped"
+                    elif change * 100 > limit and low > 0:
+                        status = "regression"
+                    elif change * 100 < -limit and high < 0:
+                        status = "improved"
+                    else:
+                        status = "ok"
+                    comparisons.append({
+                        "metric": metric, "baseline_ms": round(base_median, 3),
+                        "current_ms": round(median(values), 3),
+                        "change_pct": round(change * 100, 2), "ci_low_pct": round(low * 100, 2),
+                        "ci_high_pct": round(high * 100, 2), "threshold_pct": limit, "status": status,
+                    })
+                    icon = {"regression": "❌", "improved": "🚀", "skipped": "➖"}.get(status, "✅")
+                    print(f"  {icon} {metric}: {base_median:.3f} → {comparisons[-1]['current_ms']:.3f} ms "
+                          f"({change * 100:+.1f}%, 95% CI {low * 100:+.1f}..{high * 100:+.1f}%, порог {limit}%)")
+                    if status == "regression":
+                        regressions.append(f"{scene}/{metric}")
+                results[scene] = {"baseline": base_commit, "metrics": comparisons}
+        finally:
+            baseline.close()
+
+        report_path = os.path.join(self.profiler_data_path, f"benchmark-{commit}.json")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({"commit": commit, "runs": runs, "warmup_frames": warmup_frames, "frames": frames,
+                       "threshold_pct": threshold, "scenes": results}, f, indent=2, ensure_ascii=False)
+        print(f"\n📁 Результаты: {report_path}")
+
+        if regressions:
+            print(f"❌ Регрессии производительности: {', '.join(regressions)}")
+            return 2
+        print("✅ Регрессий не обнаружено")
+        return 0
+
+    def analyze_frames(self, capture_dir=None, warmup_frames=0):
+        """Перцентили, хитчи и гистограмма времени кадра (FrameAnalytics); None без numpy или захвата"""
+        capture = ProfilerCapture.find(capture_dir or self.profiler_data_path)
+        if capture is None or not capture.frame_count:
+            return None
+        if np is None:
+            print("⚠️ numpy не установлен: перцентили p99.9, хитчи и гистограмма в отчет не войдут")
+            return None
+        return FrameAnalytics(capture, warmup_frames).summary(self.hitch_factor, self.hitch_window)
+
+    @staticmethod
+    def _grade(value, good, warning, higher_is_better=False):
+        """CSS-класс метрики по порогам good/warning"""
+        if higher_is_better:
+            return "good" if value >= good else "warning" if value >= warning else "error"
+        return "good" if value <= good else "warning" if value <= warning else "error"
+
+    def _metric(self, title, value, css):
+        return f'        <div class="metric">\n            <strong>{title}:</strong> <span class="{css}">{value}</span>\n        </div>'
+
+    def generate_profiler_report(self, capture_dir=None, report_dir=None):
+        """Генерирует отчет профилирования по покадровому экспорту (HTML + JSON)"""
+        capture_dir = capture_dir or self.profiler_data_path
+        report_dir = report_dir or self.project_path
+        report_path = os.path.join(report_dir, "ProfilerReport.html")
+        json_path = os.path.join(report_dir, "ProfilerReport.json")
+
+        try:
+            capture = ProfilerCapture.find(capture_dir)
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            print(f"❌ Поврежденный экспорт кадров в {capture_dir}: {e}")
+            capture = None
+        analysis = capture.analyze() if capture else None
+
+        if analysis and analysis["frames"]:
+            analysis["frame_analytics"] = self.analyze_frames(capture_dir)
+            analysis["timelines"] = capture.timelines()
+            series = ProcessSampler.load(capture_dir)
+            analysis["process"] = ProcessSampler.summarize(series) if series else None
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(analysis, f, indent=2, ensure_ascii=False)
+            body = self._render_analysis(analysis)
+        else:
+            analysis = None
+            body = f"""    <div class="section">
+        <h2>📊 Performance Metrics</h2>
+        <p class="error">No frame data captured in {html.escape(str(capture_dir))}.</p>
+        <p>Run the project with ProfilerFrameExportSystem enabled (MudLike.Profiler.ProfilerStarter) to produce frames.json / frames.bin.</p>
+    </div>"""
+
         report_content = f"""
 <!DOCTYPE html>
 <html>
@@ -222,6 +1951,11 @@ class UnityProfilerRunner:
         .good {{ color: #27ae60; }}
         .warning {{ color: #f39c12; }}
         .error {{ color: #e74c3c; }}
+        table {{ border-collapse: collapse; }}
+        th, td {{ padding: 4px 12px; text-align: right; border-bottom: 1px solid #eee; }}
+        th:first-child, td:first-child {{ text-align: left; }}
+        .chart {{ display: block; width: 100%; max-width: 960px; margin: 10px 0; }}
+        .chart text {{ font-size: 11px; fill: #555; }}
     </style>
 </head>
 <body>
@@ -230,69 +1964,399 @@ class UnityProfilerRunner:
         <p>Generated: {time.strftime('%Y-%m-%d %H:%M:%S')}</p>
     </div>
     
-    <div class="section">
+{body}
+</body>
+</html>
+        """
+        
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(report_content)
+            
+        if analysis:
+            print(f"📊 Отчет профилирования создан: {report_path} ({analysis['frames']} кадров, {analysis['fps']} FPS)")
+        else:
+            print(f"⚠️ Данных кадров нет, отчет без метрик: {report_path}")
+        return report_path
+
+    def _render_analysis(self, analysis):
+        """HTML-секции отчета по результату ProfilerCapture.analyze"""
+        stats = analysis["stats"]
+        frame = stats["frame_ms"]
+        frames = analysis["frames"]
+        over_budget = analysis["frames_over_budget"] / frames * 100
+        slow = analysis["frames_over_33ms"] / frames * 100
+
+        metrics = [
+            self._metric("FPS", f"{analysis['fps']:.1f}", self._grade(analysis["fps"], 55, 30, higher_is_better=True)),
+            self._metric("Frame time (mean / p95 / p99)",
+                         f"{frame['mean']:.2f} / {frame['p95']:.2f} / {frame['p99']:.2f} ms",
+                         self._grade(frame["p95"], FRAME_BUDGET_MS, SLOW_FRAME_MS)),
+            self._metric("Max frame", f"{frame['max']:.2f} ms", self._grade(frame["max"], SLOW_FRAME_MS, 100)),
+            self._metric("Frames &gt; 16.7 ms", f"{over_budget:.1f}%", self._grade(over_budget, 1, 5)),
+            self._metric("Frames &gt; 33.3 ms", f"{slow:.1f}%", self._grade(slow, 0.1, 1)),
+        ]
+        for name, title in (("main_thread_ms", "Main thread (mean / p95)"), ("gpu_ms", "GPU (mean / p95)")):
+            if stats.get(name, {}).get("max"):
+                metrics.append(self._metric(title, f"{stats[name]['mean']:.2f} / {stats[name]['p95']:.2f} ms",
+                                            self._grade(stats[name]["p95"], FRAME_BUDGET_MS, SLOW_FRAME_MS)))
+
+        memory = []
+        if stats.get("total_used_mb", {}).get("max"):
+            used = stats["total_used_mb"]
+            memory.append(self._metric("Total used (max / last)", f"{used['max']:.0f} / {used['last']:.0f} MB",
+                                       self._grade(used["max"], 2048, 4096)))
+        if stats.get("gc_used_mb", {}).get("max"):
+            gc = stats["gc_used_mb"]
+            memory.append(self._metric("GC heap (max / last)", f"{gc['max']:.0f} / {gc['last']:.0f} MB",
+                                       self._grade(gc["max"], 256, 512)))
+        if "gc_alloc_kb" in stats and stats["gc_alloc_kb"]["count"]:
+            alloc = stats["gc_alloc_kb"]
+            memory.append(self._metric("GC alloc per frame (mean / max)", f"{alloc['mean']:.1f} / {alloc['max']:.1f} KB",
+                                       self._grade(alloc["mean"], 0, 1)))
+
+        rows = []
+        for marker in analysis["markers"]:
+            if not marker.get("count"):
+                continue
+            css = self._grade(marker["p95"], 1.0, 3.0)
+            rows.append(f"            <tr><td><strong>{html.escape(marker['name'])}</strong></td>"
+                        f"<td class=\"{css}\">{marker['mean']:.3f}</td><td>{marker['p50']:.3f}</td>"
+                        f"<td class=\"{css}\">{marker['p95']:.3f}</td><td>{marker['p99']:.3f}</td>"
+                        f"<td>{marker['max']:.3f}</td><td>{marker['share'] * 100:.1f}%</td></tr>")
+        if rows:
+            systems = ("        <table>\n            <tr><th>Marker</th><th>mean, ms</th><th>p50, ms</th><th>p95, ms</th>"
+                       "<th>p99, ms</th><th>max, ms</th><th>% of frame</th></tr>\n"
+                       + "\n".join(rows) + "\n        </table>")
+        else:
+            systems = "        <p>No ECS system / profiler markers were recorded in this capture.</p>"
+
+        findings = []
+        if over_budget > 1:
+            findings.append(f"⚠️ {over_budget:.1f}% of frames exceed the 16.7 ms budget (p99 {frame['p99']:.2f} ms)")
+        else:
+            findings.append(f"✅ {100 - over_budget:.1f}% of frames fit the 16.7 ms budget")
+        heavy = [m for m in analysis["markers"] if m.get("count") and m["p95"] > 1.0]
+        for marker in heavy[:3]:
+            findings.append(f"⚠️ {html.escape(marker['name'])}: p95 {marker['p95']:.2f} ms, {marker['share'] * 100:.1f}% of frame time")
+        if "gc_alloc_kb" in stats and stats["gc_alloc_kb"].get("mean", 0) > 0:
+            findings.append(f"⚠️ Managed allocations every frame: {stats['gc_alloc_kb']['mean']:.1f} KB on average")
+        analytics = analysis.get("frame_analytics")
+        if analytics and analytics["hitches"]["events"]:
+            hitches = analytics["hitches"]
+            culprit = hitches["systems"][0] if hitches["systems"] and hitches["systems"][0]["share_of_excess"] > 0 else None
+            findings.append(f"⚠️ {hitches['events']} hitches (frames &gt; {hitches['factor']:g}x rolling median)"
+                            + (f", {html.escape(culprit['name'])} explains {culprit['share_of_excess'] * 100:.0f}% of hitch time"
+                               if culprit else ""))
+        if not analysis["complete"]:
+            findings.append("⚠️ Capture was not finalized (process crashed or was killed); frame count taken from frames.bin size")
+
+        source = (f"{html.escape(str(analysis['scene']))} · {html.escape(str(analysis['platform']))} · "
+                  f"Unity {html.escape(str(analysis['unity_version']))} · {frames} frames / {analysis['duration_s']:.1f} s")
+
+        timelines = analysis.get("timelines")
+        charts = {}
+        if timelines and timelines["frames"]:
+            series = timelines["series"]
+            duration = analysis["duration_s"]
+            charts["frame"] = self._render_timeline(
+                [(name, series[name], color) for name, color in
+                 (("frame_ms", "#2c3e50"), ("main_thread_ms", "#3498db"), ("gpu_ms", "#9b59b6"))
+                 if name in series and max(series[name]["value"] or [0]) > 0],
+                timelines["first_frame"], timelines["frames"], duration, "ms", limits=(FRAME_BUDGET_MS, SLOW_FRAME_MS))
+            charts["memory"] = "\n".join(
+                self._render_timeline([(name, series[name], color)], timelines["first_frame"], timelines["frames"],
+                                      duration, "MB")
+                for name, color in (("total_used_mb", "#e67e22"), ("gc_used_mb", "#27ae60"))
+                if name in series and max(series[name]["value"] or [0]) > 0)
+            if timelines["bucket_frames"] > 1:
+                charts["note"] = (f"        <p>{timelines['frames']} frames; each {timelines['bucket_frames']}-frame bucket "
+                                  f"is drawn as its min and max, so single-frame spikes stay visible.</p>")
+
+        return f"""    <div class="section">
         <h2>📊 Performance Metrics</h2>
-        <div class="metric">
-            <strong>FPS:</strong> <span class="good">60+</span>
-        </div>
-        <div class="metric">
-            <strong>Memory:</strong> <span class="good">&lt;2GB</span>
-        </div>
-        <div class="metric">
-            <strong>CPU Usage:</strong> <span class="good">&lt;50%</span>
-        </div>
-        <div class="metric">
-            <strong>GPU Usage:</strong> <span class="good">&lt;80%</span>
-        </div>
+        <p>{source}</p>
+{chr(10).join(metrics)}
+    </div>
+    
+    <div class="section">
+        <h2>📉 Frame Time Timeline</h2>
+{charts.get("note", "")}
+{charts.get("frame") or "        <p>No frame timeline available.</p>"}
+    </div>
+    
+    <div class="section">
+        <h2>💾 Memory</h2>
+{chr(10).join(memory) or "        <p>No memory counters were recorded.</p>"}
+{charts.get("memory", "")}
     </div>
     
     <div class="section">
         <h2>🔧 ECS Systems Performance</h2>
-        <ul>
-            <li><strong>VehicleMovementSystem:</strong> <span class="good">~0.1ms</span></li>
-            <li><strong>AdvancedWheelPhysicsSystem:</strong> <span class="good">~0.5ms</span></li>
-            <li><strong>TerrainDeformationSystem:</strong> <span class="good">~1.0ms</span></li>
-            <li><strong>MainMenuSystem:</strong> <span class="good">~0.05ms</span></li>
-            <li><strong>LobbySystem:</strong> <span class="good">~0.1ms</span></li>
-        </ul>
+{systems}
     </div>
     
+{self._render_segments(timelines, analysis["markers"]) if timelines and timelines["frames"] else ""}
+{self._render_frame_analytics(analytics) if analytics else ""}
+{self._render_process(analysis["process"]) if analysis.get("process", {}) and analysis["process"]["samples"] else ""}
     <div class="section">
-        <h2>🎯 Recommendations</h2>
+        <h2>🎯 Findings</h2>
         <ul>
-            <li>✅ All ECS systems are optimized with Burst Compiler</li>
-            <li>✅ Job System is used for parallel processing</li>
-            <li>✅ Memory usage is within acceptable limits</li>
-            <li>✅ Frame rate is stable at 60+ FPS</li>
+{chr(10).join(f"            <li>{item}</li>" for item in findings)}
         </ul>
+    </div>"""
+
+    def _render_timeline(self, lines, first, frames, duration, unit, limits=()):
+        """Inline SVG прореженных рядов кадров first..first+frames: lines - (имя, {frame, value}, цвет), limits - пороги"""
+        width, height, left, top, bottom = 960, 200, 50, 10, 20
+        plot_width, plot_height = width - left - 10, height - top - bottom
+        span = max(1, frames - 1)
+        peak = max([max(line[1]["value"] or [0]) for line in lines] + [0]) * 1.05 or 1.0
+
+        def x(frame):
+            return left + (frame - first) / span * plot_width
+
+        def y(value):
+            return top + plot_height * (1 - min(value, peak) / peak)
+
+        parts = [f'        <svg class="chart" viewBox="0 0 {width} {height}" preserveAspectRatio="none">',
+                 f'            <rect x="{left}" y="{top}" width="{plot_width}" height="{plot_height}" fill="#fafafa" stroke="#ddd"/>']
+        for i in range(5):
+            value = peak * i / 4
+            parts.append(f'            <text x="{left - 4}" y="{y(value) + 4:.1f}" text-anchor="end">{value:.0f}</text>')
+            frame = first + span * i / 4
+            seconds = f" ({duration * i / 4:.0f} s)" if duration else ""
+            parts.append(f'            <text x="{x(frame):.1f}" y="{height - 4}" text-anchor="middle">#{frame:.0f}{seconds}</text>')
+        for limit in limits:
+            if limit < peak:
+                parts.append(f'            <line x1="{left}" x2="{left + plot_width}" y1="{y(limit):.1f}" y2="{y(limit):.1f}" '
+                             f'stroke="#e74c3c" stroke-dasharray="4 3"/>')
+        for name, line, color in lines:
+            points = " ".join(f"{x(f):.1f},{y(v):.1f}" for f, v in zip(line["frame"], line["value"]))
+            parts.append(f'            <polyline fill="none" stroke="{color}" stroke-width="1" points="{points}"/>')
+        parts.append("        </svg>")
+        legend = " · ".join(f'<span style="color: {color}">■</span> {html.escape(name)}' for name, _, color in lines)
+        parts.append(f"        <p>{legend}, {unit}</p>")
+        return "\n".join(parts)
+
+    def _render_segments(self, timelines, markers):
+        """Таблица средних времен кадра и систем по равным отрезкам захвата"""
+        segments = timelines["segments"]
+        means = segments["means"]
+        header = "".join(f"<th>#{a}–{b - 1}</th>" for a, b in segments["bounds"])
+        rows = ["            <tr><td><strong>Frame</strong></td>" + "".join(
+            f'<td class="{self._grade(value, FRAME_BUDGET_MS, SLOW_FRAME_MS)}">{value:.2f}</td>' for value in means["frame_ms"])
+                + "</tr>"]
+        for marker in markers:
+            values = means.get(marker["name"])
+            if not marker.get("count") or not values or not any(values):
+                continue
+            rows.append(f"            <tr><td><strong>{html.escape(marker['name'])}</strong></td>" + "".join(
+                f'<td class="{self._grade(value, 1.0, 3.0)}">{value:.3f}</td>' for value in values) + "</tr>")
+        return f"""    <div class="section">
+        <h2>🧩 Systems over Time</h2>
+        <p>Mean ms per frame in {len(segments['bounds'])} equal parts of the capture.</p>
+        <table>
+            <tr><th>Marker</th>{header}</tr>
+{chr(10).join(rows)}
+        </table>
     </div>
-</body>
-</html>
-        """
-        
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(report_content)
-            
-        print(f"📊 Отчет профилирования создан: {report_path}")
-        return report_path
+    """
+
+    def _render_process(self, process):
+        """HTML-секция сэмплов процесса из /proc"""
+        metrics = [
+            self._metric("CPU (mean / max)", f"{process['cpu_mean_pct']:.0f} / {process['cpu_max_pct']:.0f}%",
+                         self._grade(process["cpu_mean_pct"], 100, 200)),
+            self._metric("RSS (max / last)", f"{process['rss_max_mb']:.0f} / {process['rss_last_mb']:.0f} MB",
+                         self._grade(process["rss_max_mb"], 2048, 4096)),
+            self._metric("Page faults (minor / major)",
+                         f"{process['minor_faults_per_s']:.0f} / {process['major_faults_per_s']:.1f} per s",
+                         self._grade(process["major_faults_per_s"], 1, 10)),
+            self._metric("Threads (max)", str(process["threads_max"]), "good"),
+            self._metric("Disk I/O (read / write)", f"{process['read_mb']:.1f} / {process['write_mb']:.1f} MB", "good"),
+        ]
+        return f"""    <div class="section">
+        <h2>🖥️ Process (sampled from /proc)</h2>
+        <p>{process['samples']} samples over {process['duration_s']:.1f} s</p>
+{chr(10).join(metrics)}
+    </div>
+    """
+
+    def _render_frame_analytics(self, analytics):
+        """HTML-секции перцентилей, хитчей и гистограммы времени кадра"""
+        percentiles = [self._metric(name, f"{value:.2f} ms", self._grade(value, FRAME_BUDGET_MS, SLOW_FRAME_MS))
+                       for name, value in analytics["percentiles"].items()]
+
+        hitches = analytics["hitches"]
+        rows = []
+        for system in hitches["systems"]:
+            css = self._grade(system["share_of_excess"] * 100, 10, 30)
+            rows.append(f"            <tr><td><strong>{html.escape(system['name'])}</strong></td>"
+                        f"<td>{system['normal_ms']:.3f}</td><td>{system['hitch_mean_ms']:.3f}</td>"
+                        f"<td>{system['hitch_max_ms']:.3f}</td><td class=\"{css}\">{system['share_of_excess'] * 100:.1f}%</td></tr>")
+        worst = ", ".join(f"#{item['frame']} {item['frame_ms']:.1f} ms" for item in hitches["worst"][:5])
+        hitch_table = ""
+        if rows and hitches["frames"]:
+            hitch_table = ("        <table>\n            <tr><th>Marker</th><th>normal, ms</th><th>on hitch, ms</th>"
+                           "<th>max on hitch, ms</th><th>% of hitch time</th></tr>\n" + "\n".join(rows) + "\n        </table>")
+
+        histogram = analytics["histogram"]
+        peak = max(histogram["counts"] or [0]) or 1
+        bars = []
+        for low, count in zip(histogram["edges"], histogram["counts"]):
+            if not count:
+                continue
+            css = self._grade(low, FRAME_BUDGET_MS, SLOW_FRAME_MS)
+            width = max(1, round(count / peak * 400))
+            bars.append(f"            <tr><td>{low:.1f}</td><td style=\"text-align: left\">"
+                        f"<span class=\"{css}\" style=\"display: inline-block; width: {width}px; background: currentColor\">&nbsp;</span>"
+                        f" {count}</td></tr>")
+
+        return f"""    <div class="section">
+        <h2>⏱️ Frame Time Percentiles</h2>
+{chr(10).join(percentiles)}
+    </div>
+    
+    <div class="section">
+        <h2>⚡ Hitches</h2>
+        <p>{hitches['frames']} frames in {hitches['events']} events above {hitches['factor']:g}x rolling median
+        ({hitches['window']} frames), {hitches['rate'] * 100:.3f}% of frames, {hitches['excess_ms']:.1f} ms over median.</p>
+        {f"<p>Worst: {worst}</p>" if worst else ""}
+{hitch_table}
+    </div>
+    
+    <div class="section">
+        <h2>📈 Frame Time Histogram</h2>
+        <table>
+            <tr><th>from, ms</th><th style="text-align: left">frames</th></tr>
+{chr(10).join(bars)}
+        </table>
+    </div>
+    """
 
 def main():
     parser = argparse.ArgumentParser(description='Unity Profiler Runner для Mud-Like')
     parser.add_argument('--mode', choices=['editor', 'headless', 'standalone'], default='editor',
                        help='Режим профилирования')
-    parser.add_argument('--scene', default='Main', help='Имя сцены для профилирования')
+    parser.add_argument('--scene', help='Имя сцены для профилирования (или список через запятую, по умолчанию Main)')
+    parser.add_argument('--instances', type=int, default=1, help='Экземпляров standalone сборки на каждую сцену')
+    parser.add_argument('--core-budget', type=int, default=os.cpu_count() or 1,
+                       help='Ядер на все одновременные сессии standalone')
+    parser.add_argument('--duration', type=float, help='Длительность захвата standalone, секунд (затем SIGTERM)')
+    parser.add_argument('--sample-interval', type=float, default=0.5,
+                       help='Интервал сэмплинга процесса из /proc, секунд (0 - выключить)')
+    parser.add_argument('--soak', action='store_true',
+                       help='Soak-тест сцены на --duration секунд (по умолчанию 4 ч) с поиском утечек (код 2)')
+    parser.add_argument('--soak-warmup', type=float, default=300, help='Секунд от старта, не входящих в тренды')
+    parser.add_argument('--soak-interval', type=float, default=5.0, help='Интервал чтения RSS и кадров, секунд')
+    parser.add_argument('--leak-rss', type=float, default=50.0, help='Порог роста RSS, МБ/час')
+    parser.add_argument('--leak-native', type=float, default=50.0, help='Порог роста Total Used Memory, МБ/час')
+    parser.add_argument('--leak-gc', type=float, default=10.0, help='Порог роста GC heap, МБ/час')
+    parser.add_argument('--leak-alloc', type=float, default=1.0, help='Порог роста GC аллокаций, КБ/кадр за час')
+    parser.add_argument('--sweep', metavar='MATRIX',
+                       help='Свип performance_settings: "quality_level=0,2,5;anti_aliasing=0,4" или JSON-файл')
+    parser.add_argument('--sweep-metric', choices=['frame_p95', 'frame_p50', 'main_p50', 'ecs_ms'], default='frame_p95',
+                       help='Метрика времени для Парето-множества свипа')
+    parser.add_argument('--hitch-factor', type=float, default=2.0,
+                       help='Хитч - кадр дольше N x скользящей медианы (отчет)')
+    parser.add_argument('--hitch-window', type=int, default=31, help='Окно скользящей медианы для хитчей, кадров')
+    parser.add_argument('--cores-per-session', type=int, default=2, help='Ядер на одну сессию')
     parser.add_argument('--build-path', help='Путь к standalone сборке')
     parser.add_argument('--project-path', help='Путь к проекту Unity')
     parser.add_argument('--report', action='store_true', help='Генерировать отчет')
+    parser.add_argument('--capture', metavar='DIR',
+                       help='Построить отчет по готовому экспорту кадров (frames.json/frames.bin) без запуска Unity')
+    parser.add_argument('--benchmark', action='store_true',
+                       help='Бенчмарк сборки со сравнением с базовой линией (код 2 при регрессии)')
+    parser.add_argument('--scenes', default='Main,KrazTest', help='Сцены бенчмарка через запятую')
+    parser.add_argument('--runs', type=int, default=5, help='Прогонов каждой сцены')
+    parser.add_argument('--warmup-frames', type=int, default=120, help='Кадров прогрева, не входящих в статистику')
+    parser.add_argument('--frames', type=int,
+                       help='Измеряемых кадров на прогон (бенчмарк: 600; standalone: завершить после N кадров)')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Допустимый рост медианы, %%')
+    parser.add_argument('--system-threshold', action='append', default=[], metavar='NAME=PCT',
+                       help='Порог для отдельной системы/маркера, например TerrainDeformationSystem=5')
+    parser.add_argument('--baseline', metavar='COMMIT', help='Коммит базовой линии (по умолчанию последний другой)')
+    parser.add_argument('--baseline-db', help='База бенчмарков (по умолчанию ProfilerData/benchmarks.db)')
+    parser.add_argument('--run-timeout', type=int, default=600, help='Таймаут одного прогона, секунд')
+    parser.add_argument('--history', action='store_true', help='Список сессий из истории (ProfilerData/history)')
+    parser.add_argument('--query', metavar='METRIC',
+                       help='Статистика поля кадра или маркера по истории, например VehicleMovementSystem')
+    parser.add_argument('--stat', choices=SessionStore.STATS, default='median', help='Статистика для --query')
+    parser.add_argument('--last', type=int, default=50, help='Последних сессий для --history/--query')
+    parser.add_argument('--history-mode', help='Фильтр истории по режиму (standalone, benchmark, sweep, soak, ...)')
+    parser.add_argument('--commit', help='Фильтр истории по коммиту (префикс)')
+    parser.add_argument('--history-keep', type=int, default=200, help='Сессий, хранимых в истории (0 - все)')
+    parser.add_argument('--no-history', action='store_true', help='Не сохранять сессии в историю')
     
     args = parser.parse_args()
     
     # Создаем runner
     runner = UnityProfilerRunner(args.project_path)
+    runner.hitch_factor = args.hitch_factor
+    runner.hitch_window = args.hitch_window
+    runner.history = None if args.no_history else SessionStore(runner.history.root, args.history_keep)
     
     print("🚗 Mud-Like Unity Profiler Runner")
     print("=" * 50)
     
+    if args.history or args.query:
+        return print_history(runner, args)
+    
+    if args.capture:
+        if not ProfilerCapture.find(args.capture):
+            print(f"❌ Экспорт кадров не найден: {args.capture}")
+            return 1
+        runner.generate_profiler_report(args.capture)
+        return 0
+    
+    if args.benchmark:
+        system_thresholds = {}
+        for item in args.system_threshold:
+            name, _, value = item.rpartition('=')
+            if not name:
+                parser.error(f"--system-threshold ожидает NAME=PCT: {item}")
+            system_thresholds[name] = float(value)
+        build_path = args.build_path or os.path.join(runner.project_path, "Builds", "MudLike.exe")
+        scenes = [scene.strip() for scene in args.scenes.split(',') if scene.strip()]
+        return runner.run_benchmark(build_path, scenes, runs=args.runs, warmup_frames=args.warmup_frames,
+                                    frames=args.frames or 600, threshold=args.threshold,
+                                    system_thresholds=system_thresholds, baseline_commit=args.baseline,
+                                    db_path=args.baseline_db, timeout=args.run_timeout)
+    
+    scenes = [scene.strip() for scene in (args.scene or 'Main').split(',') if scene.strip()]
+    
+    if args.sweep:
+        try:
+            matrix = parse_sweep_matrix(args.sweep)
+        except (ValueError, json.JSONDecodeError) as e:
+            parser.error(f"--sweep: {e}")
+        build_path = args.build_path or os.path.join(runner.project_path, "Builds", "MudLike.exe")
+        max_parallel = max(1, args.core_budget // max(1, args.cores_per_session))
+        return runner.run_sweep(build_path, scenes[0], matrix, warmup_frames=args.warmup_frames,
+                                frames=args.frames or 600, max_parallel=max_parallel, metric=args.sweep_metric,
+                                timeout=args.run_timeout)
+    
+    if args.soak:
+        build_path = args.build_path or os.path.join(runner.project_path, "Builds", "MudLike.exe")
+        result = runner.run_soak(build_path, scenes[0], duration=args.duration or 4 * 3600,
+                                 headless=args.mode != 'standalone', warmup=args.soak_warmup,
+                                 interval=args.soak_interval, sample_interval=args.sample_interval,
+                                 thresholds={"rss_mb": args.leak_rss, "total_used_mb": args.leak_native,
+                                             "gc_used_mb": args.leak_gc, "gc_alloc_kb": args.leak_alloc})
+        if args.report:
+            for session in runner.sessions:
+                runner.generate_profiler_report(session.output_dir, session.output_dir)
+        return result
+    
+    # Standalone запускает только сборку, Unity Editor не нужен
+    if args.mode == 'standalone':
+        max_parallel = max(1, args.core_budget // max(1, args.cores_per_session))
+        success = runner.run_profiler_standalone(args.build_path, scenes, args.instances, max_parallel,
+                                                 frames=args.frames or 0, duration=args.duration,
+                                                 sample_interval=args.sample_interval)
+        return finish_sessions(runner, success, args.report)
+    
     # Проверяем Unity
     if not runner.unity_path:
         print("❌ Unity 6000.0.57f1 не найден!")
@@ -302,26 +2366,59 @@ def main():
     print(f"✅ Unity найден: {runner.unity_path}")
     print(f"📁 Проект: {runner.project_path}")
     
-    # Запускаем профилирование
-    success = False
+    # Запускаем профилирование: редактор блокирует проект, поэтому сцены идут по очереди
+    success = True
     
-    if args.mode == 'editor':
-        success = runner.run_profiler_editor(args.scene)
-    elif args.mode == 'headless':
-        success = runner.run_profiler_headless(args.scene)
-    elif args.mode == 'standalone':
-        success = runner.run_profiler_standalone(args.build_path)
+    for scene in scenes:
+        if args.mode == 'editor':
+            success = runner.run_profiler_editor(scene) and success
+        elif args.mode == 'headless':
+            success = runner.run_profiler_headless(scene) and success
+    
+    return finish_sessions(runner, success, args.report)
+
+
+def print_history(runner, args):
+    """--history: список сессий; --query: статистика метрики по последним сессиям"""
+    store = runner.history or SessionStore(os.path.join(runner.profiler_data_path, "history"))
+    if not args.query:
+        entries = store.sessions(args.scene, args.history_mode, args.commit, args.last, incomplete=True)
+        if not entries:
+            print(f"ℹ️ История пуста: {store.root}")
+            return 0
+        print(f"🗄️ Сессии ({len(entries)}):")
+        for entry in entries:
+            print(f"  {entry['id']}  {entry['mode']:<10} {entry['commit']:<18} {entry['frames']:>8} кадров  "
+                  f"{entry['fps']:.1f} FPS" + ("" if entry.get("complete", True) else "  (неполная)"))
+        return 0
+
+    result = store.query(args.query, args.stat, args.scene, args.history_mode, args.commit, args.last)
+    if not result["sessions"]:
+        print(f"❌ В истории нет сессий с метрикой {args.query}")
+        return 1
+    print(f"📊 {args.stat} {args.query}" + (f", сцена {args.scene}" if args.scene else "")
+          + f": последние {len(result['sessions'])} сессий")
+    for entry in result["sessions"]:
+        value = "-" if entry["value"] is None else f"{entry['value']:.3f}"
+        print(f"  {entry['id']}  {entry['commit']:<18} {value}")
+    print(f"✅ По всем кадрам ({result['frames']}): {result['value']}")
+    return 0
+
+
+def finish_sessions(runner, success, report):
+    """Отчеты по сессиям и итог запуска"""
+    if report:
+        for session in runner.sessions:
+            runner.generate_profiler_report(session.output_dir, session.output_dir)
     
     if success:
         print("✅ Профилирование завершено успешно!")
         
-        if args.report:
-            runner.generate_profiler_report()
-        
         print("\n📊 Для анализа результатов:")
         print("1. Откройте Unity Editor")
         print("2. Window → Analysis → Profiler")
-        print("3. Подключитесь к localhost:54998")
+        for session in runner.sessions:
+            print(f"3. Подключитесь к localhost:{session.port} ({session.name}, данные: {session.output_dir})")
         
         return 0
     else:
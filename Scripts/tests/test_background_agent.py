@@ -0,0 +1,657 @@
+"""
+Тесты background-agent.py
+Запуск: python -m pytest -q Scripts/tests (или python -m unittest discover -s Scripts/tests)
+"""
+
+import importlib.util
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parent.parent
+_spec = importlib.util.spec_from_file_location("background_agent", SCRIPTS / "background-agent.py")
+agent = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(agent)
+
+LOGGER = logging.getLogger("background-agent-tests")
+
+
+class TaskFileReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "tasks.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def append(self, text):
+        with open(self.path, 'a') as f:
+            f.write(text)
+
+    def test_json_lines_incremental(self):
+        reader = agent.TaskFileReader(self.path, LOGGER)
+        self.assertEqual(reader.read_new(), [])
+        self.append('{"type": "build"}\n')
+        self.assertEqual(reader.read_new(), [{'type': 'build'}])
+        self.append('{"type": "test"}\n')
+        self.assertEqual(reader.read_new(), [{'type': 'test'}])
+        self.assertEqual(reader.read_new(), [])
+
+    def test_malformed_line_is_skipped(self):
+        """Некорректная строка не блокирует следующие задачи"""
+        reader = agent.TaskFileReader(self.path, LOGGER)
+        self.append('{"type": "build"\n{"type": "test"}\n')
+        with self.assertLogs(LOGGER, level='WARNING'):
+            self.assertEqual(reader.read_new(), [{'type': 'test'}])
+
+    def test_tail_without_newline(self):
+        """Законченный объект без перевода строки отдается сразу, незаконченный - после дописывания"""
+        reader = agent.TaskFileReader(self.path, LOGGER)
+        self.append('{"type": "build"}')
+        self.assertEqual(reader.read_new(), [{'type': 'build'}])
+        self.append('\n{"type": "te')
+        self.assertEqual(reader.read_new(), [])
+        self.append('st"}\n')
+        self.assertEqual(reader.read_new(), [{'type': 'test'}])
+
+    def test_json_array_returns_only_new_entries(self):
+        reader = agent.TaskFileReader(self.path, LOGGER)
+        self.path.write_text(json.dumps([{'type': 'build'}]))
+        self.assertEqual(reader.read_new(), [{'type': 'build'}])
+        self.path.write_text(json.dumps([{'type': 'build'}, {'type': 'test', 'params': {'a': 1}}]))
+        self.assertEqual(reader.read_new(), [{'type': 'test', 'params': {'a': 1}}])
+        self.path.write_text(json.dumps([{'type': 'build'}, {'type': 'test', 'params': {'a': 1}}, {'type': 'compile'}],
+                                        indent=2))
+        self.assertEqual(reader.read_new(), [{'type': 'compile'}])
+
+    def test_json_array_appended_tail_only(self):
+        """Дописанный в конец массив разбирается с конца прежнего последнего элемента"""
+        reader = agent.TaskFileReader(self.path, LOGGER)
+        self.path.write_text('[]')
+        self.assertEqual(reader.read_new(), [])
+        self.path.write_text('[\n  {"type": "build"}\n]\n')
+        self.assertEqual(reader.read_new(), [{'type': 'build'}])
+        self.path.write_text('[\n  {"type": "build"},\n  {"type": "te')
+        with self.assertLogs(LOGGER, level='WARNING'):
+            self.assertEqual(reader.read_new(), [])
+        self.path.write_text('[\n  {"type": "build"},\n  {"type": "test"}\n]\n')
+        self.assertEqual(reader.read_new(), [{'type': 'test'}])
+        self.assertEqual(reader._array_end, len('[\n  {"type": "build"},\n  {"type": "test"}'))
+
+    def test_json_array_rewrite(self):
+        """Перезаписанный массив: отдаются все элементы, которых не было при прошлом чтении"""
+        reader = agent.TaskFileReader(self.path, LOGGER)
+        a, b, c, d = ({'type': 'build', 'params': {'n': n}} for n in range(4))
+        self.path.write_text(json.dumps([a]))
+        self.assertEqual(reader.read_new(), [a])
+        self.path.write_text(json.dumps([b, c]))
+        self.assertEqual(reader.read_new(), [b, c])
+        self.path.write_text(json.dumps([d, a]))
+        self.assertEqual(reader.read_new(), [d, a])
+        self.path.write_text(json.dumps([a, c]))
+        self.assertEqual(reader.read_new(), [c])
+
+    def test_json_array_being_written(self):
+        """Недописанный массив перечитывается при следующем изменении"""
+        reader = agent.TaskFileReader(self.path, LOGGER)
+        self.path.write_text('[{"type": "build"}, ')
+        with self.assertLogs(LOGGER, level='WARNING'):
+            self.assertEqual(reader.read_new(), [])
+        self.path.write_text('[{"type": "build"}, {"type": "test"}]')
+        self.assertEqual(reader.read_new(), [{'type': 'build'}, {'type': 'test'}])
+
+
+class TaskQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = agent.TaskQueue(Path(self.tmp.name) / "tasks.db")
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def test_validate(self):
+        for task in ({'type': 'build', 'priority': 'high'}, {'type': 'build', 'priority': True},
+                     {'type': 'build', 'priority': [1]}, {'type': 'build', 'params': [1]}):
+            with self.assertRaises(ValueError):
+                self.queue.add(task)
+        self.assertEqual(self.queue.counts(), {})
+        self.assertTrue(self.queue.add({'type': 'build', 'priority': '5'})[1])
+
+    def test_duplicates_and_nonce(self):
+        """Одинаковая задача добавляется один раз, nonce позволяет ее повторить"""
+        task = {'type': 'build', 'params': {'target': 'Linux64'}}
+        first, added = self.queue.add(task)
+        self.assertTrue(added)
+        self.assertEqual(self.queue.add(dict(task)), (first, False))
+        second, added = self.queue.add({**task, 'nonce': 1})
+        self.assertTrue(added)
+        self.assertNotEqual(first, second)
+
+    def test_priority_order(self):
+        self.queue.add({'id': 'low', 'type': 'test', 'priority': 1})
+        self.queue.add({'id': 'high', 'type': 'build', 'priority': 10})
+        self.queue.add({'id': 'low2', 'type': 'test', 'priority': 1})
+        self.assertEqual([self.queue.claim_next()['id'] for _ in range(3)], ['high', 'low', 'low2'])
+        self.assertIsNone(self.queue.claim_next())
+
+    def test_admit_rejection_keeps_task_pending(self):
+        self.queue.add({'id': 'a', 'type': 'build'})
+        self.assertIsNone(self.queue.claim_next(admit=lambda task: False))
+        self.assertEqual(self.queue.get('a')['status'], agent.TaskQueue.PENDING)
+
+    def test_rejected_task_does_not_block_next(self):
+        """Задача, которую admit не допускает, не задерживает следующие по приоритету"""
+        self.queue.add({'id': 'big', 'type': 'build', 'priority': 10})
+        self.queue.add({'id': 'small', 'type': 'test', 'priority': 1})
+        self.assertEqual(self.queue.claim_next(admit=lambda task: task['id'] != 'big')['id'], 'small')
+        self.assertEqual(self.queue.get('big')['status'], agent.TaskQueue.PENDING)
+        self.assertEqual(self.queue.claim_next()['id'], 'big')
+
+    def test_dependencies(self):
+        """Неизвестная зависимость ждет появления задачи, уже проваленная - пропускает зависимую сразу"""
+        self.queue.add({'id': 'b', 'type': 'test', 'depends_on': ['a']})
+        self.assertIsNone(self.queue.claim_next())
+        self.queue.add({'id': 'a', 'type': 'build'})
+        self.assertEqual(self.queue.claim_next()['id'], 'a')
+        self.queue.finish('a', True)
+        self.assertEqual(self.queue.claim_next()['id'], 'b')
+        self.queue.finish('b', False)
+        self.queue.add({'id': 'c', 'type': 'deploy', 'depends_on': ['b']})
+        self.assertEqual(self.queue.get('c')['status'], agent.TaskQueue.SKIPPED)
+        self.assertEqual(self.queue.get('c')['error'], 'dependency b not done')
+
+    def test_migrates_dependencies(self):
+        """База старой версии: зависимости из depends_on переносятся в индексированную таблицу"""
+        self.queue.add({'id': 'a', 'type': 'build'})
+        self.queue.add({'id': 'b', 'type': 'test', 'depends_on': ['a']})
+        self.queue.add({'id': 'x', 'type': 'build'})
+        self.queue.add({'id': 'y', 'type': 'test', 'depends_on': ['x']})
+        self.queue._conn.execute("UPDATE tasks SET status = ? WHERE id = 'x'", (agent.TaskQueue.FAILED,))
+        self.queue._conn.execute("DROP TABLE dependencies")
+        self.queue.close()
+        self.queue = agent.TaskQueue(Path(self.tmp.name) / "tasks.db")
+        self.assertEqual(self.queue.get('y')['status'], agent.TaskQueue.SKIPPED)
+        self.assertEqual(self.queue.claim_next()['id'], 'a')
+        self.assertIsNone(self.queue.claim_next())
+
+    def test_pipeline_dependencies(self):
+        """Зависимая задача ждет предшественника и пропускается при его провале"""
+        pipeline_id, added = self.queue.add_pipeline({'id': 'p', 'nodes': {
+            'build': {'type': 'build'},
+            'test': {'type': 'test', 'after': ['build']},
+            'deploy': {'type': 'deploy', 'after': ['test']},
+        }})
+        self.assertEqual([task_id for task_id, _ in added], ['p.build', 'p.test', 'p.deploy'])
+        self.assertEqual(self.queue.claim_next()['id'], 'p.build')
+        self.assertIsNone(self.queue.claim_next())
+        self.assertEqual(self.queue.finish('p.build', False), ['p.test', 'p.deploy'])
+        self.assertEqual(self.queue.get('p.deploy')['status'], agent.TaskQueue.SKIPPED)
+
+    def test_pipeline_cycle_and_bad_node(self):
+        with self.assertRaises(ValueError):
+            self.queue.add_pipeline({'nodes': {'a': {'after': ['b']}, 'b': {'after': ['a']}}})
+        with self.assertRaises(ValueError):
+            self.queue.add_pipeline({'nodes': {'a': {'type': 'build'}, 'b': {'type': 'test', 'priority': 'x'}}})
+        self.assertEqual(self.queue.counts(), {})
+
+    def test_recover(self):
+        self.queue.add({'id': 'a', 'type': 'build'})
+        self.queue.claim_next()
+        self.assertEqual(self.queue.recover(), 1)
+        self.assertEqual(self.queue.get('a')['status'], agent.TaskQueue.PENDING)
+
+
+class WorkspaceManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.project = Path(self.tmp.name) / "Project"
+        (self.project / "Assets" / "Vehicles").mkdir(parents=True)
+        (self.project / "Assets" / "Vehicles" / "Truck.cs").write_text("class Truck {}")
+        (self.project / "Assets" / "Car.cs").write_text("class Car {}")
+        (self.project / "Packages").mkdir()
+        (self.project / "Packages" / "manifest.json").write_text("{}")
+        self.manager = agent.WorkspaceManager(self.project, Path(self.tmp.name) / "workspaces", 1, LOGGER)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def tree(self, root):
+        return sorted(str(path.relative_to(root)) for path in root.rglob('*'))
+
+    def test_sync_without_rsync_mirrors_deletions(self):
+        """Без rsync копия повторяет исходники: удаленные и переименованные файлы не остаются в ней"""
+        self.manager._rsync = None
+        workspace = self.manager.acquire()
+        (workspace / "Library").mkdir()
+        self.manager.release(workspace)
+
+        (self.project / "Assets" / "Vehicles" / "Truck.cs").rename(self.project / "Assets" / "Vehicles" / "Kraz.cs")
+        (self.project / "Assets" / "Car.cs").write_text("class Car { int speed; }")
+        os.symlink("Car.cs", self.project / "Assets" / "Alias.cs")
+        (self.project / "Packages" / "manifest.json").unlink()
+        (self.project / "Packages").rmdir()
+
+        workspace = self.manager.acquire()
+        self.assertEqual(self.tree(workspace / "Assets"), self.tree(self.project / "Assets"))
+        self.assertEqual((workspace / "Assets" / "Car.cs").read_text(), "class Car { int speed; }")
+        self.assertEqual(os.readlink(workspace / "Assets" / "Alias.cs"), "Car.cs")
+        self.assertFalse((workspace / "Packages").exists())
+        self.assertTrue((workspace / "Library").is_dir())
+
+
+class UnityProgressParserTest(unittest.TestCase):
+    def test_phases(self):
+        parser = agent.UnityProgressParser()
+        self.assertEqual(parser.feed("Start importing Assets/Textures/mud.png using Guid(1) -> (artifact id: 'a')"),
+                         ('import', 'Assets/Textures/mud.png'))
+        self.assertEqual(parser.feed("[ 5/123  2s] Csc Library/Bee/artifacts/1900b0aE.dag/Mud.Core.dll"),
+                         ('compile', '5/123 Mud.Core.dll'))
+        self.assertEqual(parser.feed("Reloading assemblies after forced synchronous recompile."),
+                         ('domain_reload', 'Reloading assemblies'))
+        self.assertEqual(parser.feed("DisplayProgressbar: Build player"), ('build', 'Build player'))
+        self.assertIsNone(parser.feed("Refreshing native plugins compatible for Editor"))
+
+    def test_error_pattern(self):
+        pattern = agent.UnityProgressParser.ERROR_PATTERN
+        self.assertTrue(pattern.search("Assets/Scripts/Car.cs(10,5): error CS0246: type not found"))
+        self.assertTrue(pattern.search("NullReferenceException: Object reference not set"))
+        self.assertFalse(pattern.search("warning CS0618: obsolete"))
+
+
+class IncrementalCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        (self.root / "Assets" / "Scripts").mkdir(parents=True)
+        (self.root / "Assets" / "Scripts" / "Car.cs").write_text("class Car {}")
+        (self.root / "ProjectSettings").mkdir()
+        (self.root / "ProjectSettings" / "ProjectSettings.asset").write_text("version: 1")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_manifest_rehashes_only_changed_files(self):
+        first = agent.InputManifest(self.root, self.root / "manifest.json").digest()
+        manifest = agent.InputManifest(self.root, self.root / "manifest.json")
+        hash_file = manifest._hash_file
+        hashed = []
+        manifest._hash_file = lambda rel_path: hashed.append(rel_path) or hash_file(rel_path)
+        self.assertEqual(manifest.digest(), first)
+        self.assertEqual(hashed, [])
+        car = self.root / "Assets" / "Scripts" / "Car.cs"
+        car.write_text("class Car { int speed; }")
+        os.utime(car, ns=(car.stat().st_mtime_ns + 10 ** 9,) * 2)
+        self.assertNotEqual(manifest.digest(), first)
+        self.assertEqual(hashed, [os.path.join("Assets", "Scripts", "Car.cs")])
+
+    def test_digest_follows_content(self):
+        manifest = agent.InputManifest(self.root, self.root / "manifest.json")
+        first = manifest.digest()
+        (self.root / "Assets" / "Scripts" / "Boat.cs").write_text("class Boat {}")
+        second = manifest.digest()
+        self.assertNotEqual(first, second)
+        (self.root / "Assets" / "Scripts" / "Boat.cs").unlink()
+        self.assertEqual(manifest.digest(), first)
+
+    def test_key_and_lookup(self):
+        """'force' не входит в ключ, измененный артефакт делает запись недействительной"""
+        key = agent.IncrementalCache.key('build', {'target': 'Linux64'}, 'inputs', '/opt/unity')
+        self.assertEqual(agent.IncrementalCache.key('build', {'target': 'Linux64', 'force': True}, 'inputs', '/opt/unity'), key)
+        self.assertNotEqual(agent.IncrementalCache.key('build', {'target': 'Linux64'}, 'other', '/opt/unity'), key)
+
+        build = self.root / "Builds" / "Game"
+        build.parent.mkdir()
+        build.write_bytes(b"exe")
+        cache = agent.IncrementalCache(self.root / "results.json")
+        self.assertIsNone(cache.lookup(key))
+        cache.store(key, 'build', build)
+        self.assertEqual(agent.IncrementalCache(self.root / "results.json").lookup(key)['artifact'], str(build))
+        build.write_bytes(b"patched")
+        self.assertIsNone(cache.lookup(key))
+
+
+class TestShardPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        (self.root / "Tests").mkdir()
+        (self.root / "Logs").mkdir()
+        self.planner = agent.TestShardPlanner(self.root / "Tests", self.root / "Logs")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_results(self, name, cases, mtime):
+        body = ''.join(f'<test-case fullname="{fullname}" duration="{duration}" />' for fullname, duration in cases)
+        path = self.root / "Logs" / f"test-results-{name}.xml"
+        path.write_text(f'<test-run>{body}</test-run>')
+        os.utime(path, (mtime, mtime))
+
+    def test_discover(self):
+        (self.root / "Tests" / "VehicleTests.cs").write_text(
+            "namespace Mud.Tests\n{\n    public class VehicleTests\n    {\n"
+            "        [Test]\n        public void Drives() {}\n"
+            "        [TestCase(1)]\n        [TestCase(2)]\n        public void Gears(int gear) {}\n"
+            "        public void Helper() {}\n"
+            "        [UnityTest]\n        public IEnumerator Sinks() { yield return null; }\n    }\n}\n")
+        self.assertEqual(self.planner.discover(),
+                         ['Mud.Tests.VehicleTests.Drives', 'Mud.Tests.VehicleTests.Gears', 'Mud.Tests.VehicleTests.Sinks'])
+
+    def test_durations_sum_parameterized_cases_per_run(self):
+        """Параметризованные случаи суммируются в пределах прогона, свежий прогон перекрывает старый"""
+        self.write_results("old", [("A.Slow", 9), ("A.Case(1)", 5)], 1000)
+        self.write_results("new", [("A.Case(1)", 1), ("A.Case(2)", 2)], 2000)
+        self.assertEqual(self.planner.load_durations(), {'A.Slow': 9.0, 'A.Case': 3.0})
+
+    def test_plan_longest_first(self):
+        self.write_results("run", [("A.a", 8), ("A.b", 5), ("A.c", 4), ("A.d", 3)], 1000)
+        shards = self.planner.plan(['A.a', 'A.b', 'A.c', 'A.d'], 2)
+        self.assertEqual(sorted(map(sorted, shards)), [['A.a', 'A.d'], ['A.b', 'A.c']])
+        self.assertEqual(len(self.planner.plan(['A.a'], 4)), 1)
+
+    def test_filter_is_anchored_and_escaped(self):
+        """Unity делит -testFilter по ';' и ищет каждое выражение в полном имени теста"""
+        patterns = [re.compile(p) for p in agent.TestShardPlanner.test_filter(['Foo.Test1', 'Bar.Case']).split(';')]
+        selected = lambda name: any(p.search(name) for p in patterns)
+        self.assertTrue(selected('Foo.Test1'))
+        self.assertTrue(selected('Bar.Case(1,"a")'))
+        self.assertFalse(selected('Foo.Test10'))
+        self.assertFalse(selected('FooXTest1'))
+
+    def test_merge_results(self):
+        for i, result in enumerate(('Passed', 'Failed')):
+            (self.root / f"shard{i}.xml").write_text(
+                f'<test-run total="2" passed="{2 - i}" failed="{i}" result="{result}" duration="{i + 1}">'
+                f'<test-suite name="s{i}" /></test-run>')
+        output = self.root / "merged.xml"
+        ok = agent.TestShardPlanner.merge_results([self.root / "shard0.xml", self.root / "shard1.xml"], output)
+        self.assertFalse(ok)
+        merged = agent.ET.parse(output).getroot()
+        self.assertEqual((merged.get('total'), merged.get('failed'), merged.get('result')), ('4', '1', 'Failed'))
+        self.assertEqual(len(merged.findall('test-suite')), 2)
+
+
+class ResidentEditorDispatchTest(unittest.TestCase):
+    """Маршрутизация задач при --warm-editors без запуска Unity"""
+
+    class Editors:
+        def __init__(self, snapshots):
+            self.snapshots = snapshots
+            self.calls = []
+
+        def close(self, workspace):
+            self.calls.append(('close', workspace))
+
+        def get(self, workspace):
+            self.calls.append(('get', self.snapshots.active_target(workspace)))
+            return self
+
+        def run(self, command, timeout=None):
+            return True, None
+
+        def rss_mb(self):
+            return 0
+
+        def release(self, editor):
+            pass
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workspace = Path(self.tmp.name) / "worker-0"
+        (self.workspace / "Library").mkdir(parents=True)
+        self.agent = agent.UnityBackgroundAgent.__new__(agent.UnityBackgroundAgent)
+        self.agent.logger = LOGGER
+        self.agent.project_path = Path(self.tmp.name) / "Project"
+        self.agent.max_test_shards = 4
+        self.agent.library_snapshots = agent.LibrarySnapshots(LOGGER)
+        self.agent.editors = self.Editors(self.agent.library_snapshots)
+        self.agent._resident_runs = {}
+        self.agent._usage = {}
+        self.agent._build_staging = lambda task_id, params: Path(self.tmp.name) / "builds" / task_id
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sharded_tests_bypass_resident_editor(self):
+        routed = []
+        self.agent._execute_resident = lambda task, project_path: routed.append(('resident', task['id']))
+        self.agent._execute_test = lambda params, project_path, task_id: routed.append(('test', task_id))
+        self.agent._dispatch_task({'id': 'one', 'type': 'test', 'params': {}}, self.workspace)
+        self.agent._dispatch_task({'id': 'sharded', 'type': 'test', 'params': {'shards': 3}}, self.workspace)
+        self.assertEqual(routed, [('resident', 'one'), ('test', 'sharded')])
+
+    def test_resident_build_activates_library_snapshot(self):
+        """Смена платформы: редактор останавливается до подмены Library, та же платформа - без перезапуска"""
+        for task_id in ('android', 'android-again'):
+            ok = self.agent._execute_resident(
+                {'id': task_id, 'type': 'build', 'params': {'platform': 'Android', 'timeout': 60}}, self.workspace)
+            self.assertTrue(ok)
+        self.assertEqual(self.agent.editors.calls, [('close', self.workspace), ('get', 'Android'), ('get', 'Android')])
+
+
+class AgentMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "metrics.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_observe_and_render(self):
+        metrics = agent.AgentMetrics(self.path)
+        metrics.observe('build', 0, duration_seconds=45, queue_wait_seconds=None)
+        metrics.observe('build', 1, duration_seconds=700)
+        text = agent.AgentMetrics(self.path).render_prometheus({'pending': 2})
+        self.assertIn('unity_agent_task_duration_seconds_bucket{type="build",le="60"} 1', text)
+        self.assertIn('unity_agent_task_duration_seconds_bucket{type="build",le="+Inf"} 2', text)
+        self.assertIn('unity_agent_task_duration_seconds_sum{type="build"} 745', text)
+        self.assertIn('unity_agent_task_exit_total{type="build",code="1"} 1', text)
+        self.assertIn('unity_agent_tasks{status="pending"} 2', text)
+        self.assertNotIn('queue_wait_seconds_count', text)
+
+    def test_recent_quantiles(self):
+        metrics = agent.AgentMetrics(self.path)
+        for seconds in range(1, 11):
+            metrics.observe('test', 0, duration_seconds=seconds)
+        self.assertEqual(metrics.snapshot()['recent_quantiles']['test'], {'0.5': 6, '0.9': 10})
+
+
+class AgentRPCServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.agent = agent.UnityBackgroundAgent.__new__(agent.UnityBackgroundAgent)
+        self.agent.logger = LOGGER
+        self.agent.queue = agent.TaskQueue(Path(self.tmp.name) / "tasks.db")
+        self.agent._wakeup = threading.Event()
+        self.server = agent.AgentRPCServer(self.agent, max_queue_depth=5)
+
+    def tearDown(self):
+        self.agent.queue.close()
+        self.tmp.cleanup()
+
+    def test_concurrent_submits_respect_queue_depth(self):
+        """Проверка глубины очереди и запись задачи атомарны: параллельные submit не превышают лимит"""
+        responses = []
+        barrier = threading.Barrier(20)
+
+        def submit(n):
+            barrier.wait()
+            responses.append(self.server._op_submit({'task': {'type': 'build', 'params': {'n': n}}}))
+
+        threads = [threading.Thread(target=submit, args=(n,)) for n in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(response['ok'] for response in responses), 5)
+        self.assertEqual({response['error'] for response in responses if not response['ok']}, {'queue_full'})
+        self.assertEqual(self.agent.queue.counts(), {agent.TaskQueue.PENDING: 5})
+
+    def test_pipeline_over_limit_is_not_added(self):
+        self.agent.queue.add({'id': 'a', 'type': 'build'})
+        nodes = {f'n{i}': {'type': 'test'} for i in range(5)}
+        response = self.server._op_submit({'task': {'type': 'pipeline', 'id': 'p', 'nodes': nodes}})
+        self.assertEqual((response['ok'], response['error'], response['pending']), (False, 'queue_full', 1))
+        self.assertEqual(self.agent.queue.pipeline('p'), [])
+        response = self.server._op_submit({'task': {'cancel': 'a'}})
+        self.assertTrue(response['ok'])
+        self.assertTrue(self.server._op_submit({'task': {'type': 'pipeline', 'id': 'p', 'nodes': nodes}})['ok'])
+
+
+class ArtifactStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.store = agent.ArtifactStore(self.root / "store", LOGGER, max_builds=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_build(self, name, content):
+        build = self.root / name
+        (build / "Game_Data").mkdir(parents=True)
+        (build / "Game").write_bytes(b"exe")
+        os.chmod(build / "Game", 0o755)
+        (build / "Game_Data" / "level0").write_bytes(content)
+        return build
+
+    def test_put_and_checkout(self):
+        """Одинаковые файлы сборок хранятся один раз, извлеченная сборка совпадает с исходной"""
+        self.assertEqual(self.store.put('k1', self.make_build('b1', b'level-1')), len(b'exe') + len(b'level-1'))
+        self.assertEqual(self.store.put('k2', self.make_build('b2', b'level-2')), len(b'level-2'))
+        destination = self.store.checkout('k1', self.root / "out")
+        self.assertEqual((destination / "Game_Data" / "level0").read_bytes(), b'level-1')
+        self.assertTrue(os.access(destination / "Game", os.X_OK))
+        with self.assertRaises(FileExistsError):
+            self.store.checkout('k2', self.root / "b1")
+        self.store.checkout('k2', self.root / "out", replace=True)
+        self.assertEqual((self.root / "out" / "Game_Data" / "level0").read_bytes(), b'level-2')
+        with self.assertRaises(KeyError):
+            self.store.checkout('missing', self.root / "out3")
+
+    def test_lru_eviction(self):
+        for i in range(3):
+            self.store.put(f'k{i}', self.make_build(f'b{i}', f'level-{i}'.encode()))
+        self.assertFalse(self.store.has('k0'))
+        self.assertEqual({build['key'] for build in self.store.builds()}, {'k1', 'k2'})
+
+
+class UnityLogAnalyzerTest(unittest.TestCase):
+    def feed(self, lines):
+        analyzer = agent.UnityLogAnalyzer()
+        for line, at in lines:
+            analyzer.feed(line, at)
+        return analyzer.summary()
+
+    def test_single_line_imports(self):
+        """Начало и "in N seconds" в одной строке: каждый импорт со своей длительностью"""
+        summary = self.feed([
+            ("Start importing Assets/Textures/mud.png using Guid(1) -> (artifact id: 'a') in 0.5 seconds", 10.0),
+            ("Start importing Assets/Models/rock.fbx using Guid(2) -> (artifact id: 'b') in 2.0 seconds", 11.0),
+        ])
+        self.assertEqual(summary['imports']['count'], 2)
+        self.assertAlmostEqual(summary['imports']['seconds'], 2.5)
+        self.assertEqual(summary['imports']['slowest'][0], {'asset': 'Assets/Models/rock.fbx', 'seconds': 2.0})
+        self.assertEqual(summary['imports']['by_extension']['.png']['count'], 1)
+
+    def test_multi_line_import(self):
+        """Длительность из отдельной строки "-> (artifact id) in N seconds" """
+        summary = self.feed([
+            ("Start importing Assets/Scenes/Main.unity using Guid(3)", 1.0),
+            ("  -> (artifact id: 'c') in 1.25 seconds", 2.0),
+        ])
+        self.assertEqual(summary['imports']['count'], 1)
+        self.assertEqual(summary['imports']['slowest'][0]['seconds'], 1.25)
+
+    def test_import_without_duration_uses_line_times(self):
+        """Импорт без "in N seconds" длится до начала следующего"""
+        summary = self.feed([
+            ("Start importing Assets/a.asset using Guid(4)", 5.0),
+            ("Start importing Assets/b.asset using Guid(5) -> (artifact id: 'd') in 0.1 seconds", 8.0),
+        ])
+        self.assertEqual(summary['imports']['count'], 2)
+        seconds = {entry['asset']: entry['seconds'] for entry in summary['imports']['slowest']}
+        self.assertEqual(seconds, {'Assets/a.asset': 3.0, 'Assets/b.asset': 0.1})
+
+    def test_bee_compile_and_reload(self):
+        summary = self.feed([
+            ("[ 1/ 3  0s] Csc Library/Bee/artifacts/Mud.Core.dll", None),
+            ("[ 2/ 3  4s] Csc Library/Bee/artifacts/Mud.Vehicles.dll", None),
+            ("*** Tundra build success (4.50 seconds), 3 items updated", None),
+            ("Reloading assemblies after forced synchronous recompile.", None),
+            ("- Completed reload, in  1.750 seconds", None),
+        ])
+        self.assertEqual(summary['compile']['assemblies']['Mud.Vehicles'], {'seconds': 4.0, 'count': 1})
+        self.assertEqual(summary['compile']['runs'], [{'result': 'success', 'seconds': 4.5}])
+        self.assertEqual(summary['domain_reloads'], [1.75])
+
+    def test_timestamps_prefix(self):
+        """Префикс -timestamps задает время строки"""
+        summary = self.feed([
+            ("2026-01-01T10:00:00.000Z|0x1|DisplayProgressbar: Compile scripts", None),
+            ("2026-01-01T10:00:30.000Z|0x1|DisplayProgressbar: Build player", None),
+            ("2026-01-01T10:01:00.000Z|0x1|Build completed with a result of 'Succeeded' in 60 seconds", None),
+        ])
+        self.assertEqual(summary['build_steps'], [{'step': 'Compile scripts', 'seconds': 30.0},
+                                                  {'step': 'Build player', 'seconds': 30.0}])
+        self.assertEqual(summary['build'], {'result': 'Succeeded', 'seconds': 60})
+
+    def test_slowest_across_runs(self):
+        first = self.feed([("Start importing Assets/x.png using Guid(1) -> (artifact id: 'a') in 1 seconds", None)])
+        second = self.feed([("Start importing Assets/x.png using Guid(1) -> (artifact id: 'a') in 3 seconds", None)])
+        slowest = agent.UnityLogAnalyzer.slowest([first, second])
+        self.assertEqual(slowest['runs'], 2)
+        self.assertEqual(slowest['imports'], [{'name': 'Assets/x.png', 'max': 3.0}])
+
+
+class LogArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.logs = Path(self.tmp.name)
+        self.archive = agent.LogArchive(self.logs, LOGGER)
+
+    def tearDown(self):
+        self.archive.close()
+        self.tmp.cleanup()
+
+    def test_tokens(self):
+        tokens = agent.LogArchive.tokens(
+            "Assets/Scripts/Car.cs(10,5): error CS0246: type not found\n"
+            "NullReferenceException: Object reference\nABCS1234 задача build-42 started")
+        self.assertEqual(tokens, {'code:CS0246', 'exception:NullReferenceException',
+                                  'asset:Assets/Scripts/Car.cs', 'task:build-42'})
+
+    def test_archive_and_search(self):
+        log = self.logs / "build-20260101-100000-abc123.log"
+        log.write_text("line one\nAssets/Scripts/Car.cs(1,1): error CS0246: missing\nline three\n")
+        dest = self.archive.archive(log)
+        self.assertFalse(log.exists())
+        self.assertEqual(self.archive.search('CS0246'),
+                         [(str(dest), 2, 'Assets/Scripts/Car.cs(1,1): error CS0246: missing')])
+        self.assertEqual(len(self.archive.search('Assets/Scripts/')), 1)
+        self.assertEqual(self.archive.task_archives('abc123'), [dest])
+
+    def test_index_opened_on_first_use(self):
+        """Конструктор не открывает index.db: дескриптор не должен пережить демонизацию"""
+        index = self.logs / "Archive" / "index.db"
+        self.assertFalse(index.exists())
+        self.assertEqual(self.archive.search('CS0246'), [])
+        self.assertTrue(index.exists())
+        self.archive.close()
+        self.assertEqual(self.archive.search('CS0246'), [])
+
+    def test_parse_term(self):
+        self.assertEqual(agent.LogArchive.parse_term('CS0103'), 'code:CS0103')
+        self.assertEqual(agent.LogArchive.parse_term('InvalidOperationException'), 'exception:InvalidOperationException')
+        self.assertEqual(agent.LogArchive.parse_term('Packages/com.unity'), 'asset:Packages/com.unity')
+        self.assertEqual(agent.LogArchive.parse_term('abc123'), 'task:abc123')
+
+
+if __name__ == '__main__':
+    unittest.main()
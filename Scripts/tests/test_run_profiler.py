@@ -0,0 +1,337 @@
+"""
+Тесты run_profiler.py
+Запуск: python -m pytest -q Scripts/tests (или python -m unittest discover -s Scripts/tests)
+"""
+import contextlib
+import importlib.util
+import io
+import json
+import math
+import os
+import struct
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parent.parent
+_spec = importlib.util.spec_from_file_location("run_profiler", SCRIPTS / "run_profiler.py")
+profiler = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(profiler)
+
+FIELDS = ["frame", "time_s", "frame_ms", "main_thread_ms", "gpu_ms", "total_used_mb", "gc_used_mb", "gc_alloc_kb"]
+
+
+def write_capture(directory, frame_ms, markers=None, complete=True):
+    """Экспорт кадров в формате ProfilerFrameExportSystem; markers - имя -> время маркера по кадрам"""
+    markers = markers or {}
+    record = struct.Struct("<I" + "f" * (len(FIELDS) - 1 + len(markers)))
+    os.makedirs(directory, exist_ok=True)
+    meta = {"version": 1, "record_size": record.size, "fields": FIELDS, "markers": list(markers),
+            "unity_version": "6000.0.57f1", "platform": "LinuxPlayer", "scene": "Main",
+            "frame_count": len(frame_ms) if complete else -1}
+    with open(os.path.join(directory, "frames.json"), 'w') as f:
+        json.dump(meta, f)
+    with open(os.path.join(directory, "frames.bin"), 'wb') as f:
+        elapsed = 0.0
+        for i, value in enumerate(frame_ms):
+            elapsed += value / 1000
+            f.write(record.pack(i, elapsed, value, value * 0.8, 2.0, 500.0 + i, 50.0, 1.0,
+                                *(series[i] for series in markers.values())))
+
+
+@contextlib.contextmanager
+def without_numpy():
+    """Потоковый путь без numpy"""
+    saved = profiler.np
+    profiler.np = None
+    try:
+        yield
+    finally:
+        profiler.np = saved
+
+
+class StreamingStatsTest(unittest.TestCase):
+    def test_percentiles_within_one_percent(self):
+        stats = profiler.StreamingStats()
+        for value in range(1, 1001):
+            stats.add(float(value))
+        self.assertEqual((stats.count, stats.min, stats.max, stats.last), (1000, 1.0, 1000.0, 1000.0))
+        self.assertAlmostEqual(stats.mean, 500.5)
+        for q, expected in ((50, 500), (95, 950), (99, 990)):
+            self.assertLessEqual(abs(stats.percentile(q) - expected) / expected, 0.01)
+
+    def test_zeros_and_empty(self):
+        self.assertEqual(profiler.StreamingStats().to_dict(), {"count": 0})
+        stats = profiler.StreamingStats()
+        for value in (0.0, 0.0, 0.0, 5.0):
+            stats.add(value)
+        self.assertEqual(stats.percentile(50), 0.0)
+        self.assertLessEqual(abs(stats.percentile(100) - 5.0), 0.05)
+        self.assertEqual(stats.to_dict(histogram=True)["histogram"]["zeros"], 3)
+
+    def test_add_many_matches_add(self):
+        values = [0.0, 0.5, 3.25, 16.7, 16.7, 40.0, 120.0]
+        single = profiler.StreamingStats()
+        for value in values:
+            single.add(value)
+        bulk = profiler.StreamingStats()
+        bulk.add_many(values)
+        self.assertEqual(bulk.to_dict(histogram=True), single.to_dict(histogram=True))
+        with without_numpy():
+            fallback = profiler.StreamingStats()
+            fallback.add_many(values)
+        self.assertEqual(fallback.to_dict(histogram=True), single.to_dict(histogram=True))
+
+
+class ProfilerCaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_find_without_export(self):
+        self.assertIsNone(profiler.ProfilerCapture.find(self.dir))
+
+    def test_analyze_skips_warmup(self):
+        write_capture(self.dir, [100.0] * 10 + [10.0] * 89 + [40.0], {"VehicleMovementSystem": [1.0] * 100})
+        capture = profiler.ProfilerCapture.find(self.dir)
+        self.assertEqual(capture.frame_count, 100)
+        analysis = capture.analyze(warmup_frames=10)
+        self.assertEqual(analysis["frames"], 90)
+        self.assertTrue(analysis["complete"])
+        self.assertEqual(analysis["stats"]["frame_ms"]["max"], 40.0)
+        self.assertEqual(analysis["frames_over_budget"], 1)
+        self.assertEqual(analysis["frames_over_33ms"], 1)
+        self.assertEqual(analysis["markers"][0]["name"], "VehicleMovementSystem")
+        self.assertAlmostEqual(analysis["markers"][0]["share"], 90 / (89 * 10 + 40), places=4)
+
+    def test_incomplete_capture(self):
+        """После падения frame_count в frames.json не обновлен: кадры считаются по размеру frames.bin"""
+        write_capture(self.dir, [10.0] * 20, complete=False)
+        with open(os.path.join(self.dir, "frames.bin"), 'ab') as f:
+            f.write(b"\0" * 5)
+        capture = profiler.ProfilerCapture.find(self.dir)
+        self.assertEqual(capture.frame_count, 20)
+        self.assertFalse(capture.analyze()["complete"])
+
+    def test_record_size_mismatch(self):
+        write_capture(self.dir, [10.0])
+        with open(os.path.join(self.dir, "frames.json")) as f:
+            meta = json.load(f)
+        meta["record_size"] += 4
+        with open(os.path.join(self.dir, "frames.json"), 'w') as f:
+            json.dump(meta, f)
+        with self.assertRaises(ValueError):
+            profiler.ProfilerCapture(self.dir)
+
+    @unittest.skipIf(profiler.np is None, "нужен numpy")
+    def test_numpy_and_streaming_paths_agree(self):
+        frame_ms = [8.0 + (i * 7919 % 97) / 10 for i in range(500)]
+        write_capture(self.dir, frame_ms, {"Physics": [v / 4 for v in frame_ms]})
+        capture = profiler.ProfilerCapture(self.dir)
+        vectorized = capture.analyze(warmup_frames=20)
+        with without_numpy():
+            streamed = capture.analyze(warmup_frames=20)
+        for key in ("frames", "frames_over_budget", "frames_over_33ms", "duration_s", "fps"):
+            self.assertEqual(vectorized[key], streamed[key], key)
+        for name in ("frame_ms", "total_used_mb"):
+            for key in ("count", "mean", "min", "max"):
+                self.assertAlmostEqual(vectorized["stats"][name][key], streamed["stats"][name][key], places=2)
+            # Потоковые перцентили - с точностью логарифмической корзины (1%)
+            self.assertLessEqual(abs(vectorized["stats"][name]["p95"] / streamed["stats"][name]["p95"] - 1), 0.01)
+
+    def test_timelines_keep_peaks(self):
+        """Прореживание по корзинам сохраняет минимум и максимум каждой корзины"""
+        frame_ms = [10.0] * 1000
+        frame_ms[200], frame_ms[537] = 2.0, 80.0
+        write_capture(self.dir, frame_ms, {"Physics": [1.0] * 1000})
+        capture = profiler.ProfilerCapture(self.dir)
+        with without_numpy():
+            streamed = capture.timelines(buckets=10, segments=4)
+        series = streamed["series"]["frame_ms"]
+        self.assertEqual(streamed["bucket_frames"], 100)
+        self.assertEqual(len(series["frame"]), 12)
+        self.assertEqual(dict(zip(series["frame"], series["value"]))[537], 80.0)
+        self.assertEqual(dict(zip(series["frame"], series["value"]))[200], 2.0)
+        self.assertEqual(streamed["segments"]["means"]["frame_ms"], [9.968, 10.0, 10.28, 10.0])
+        if profiler.np is not None:
+            self.assertEqual(capture.timelines(buckets=10, segments=4), streamed)
+
+
+@unittest.skipIf(profiler.np is None, "нужен numpy")
+class FrameAnalyticsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        frame_ms = [10.0] * 200
+        physics = [2.0] * 200
+        frame_ms[120] = frame_ms[121] = 45.0
+        physics[120] = physics[121] = 30.0
+        frame_ms[60] = 30.0
+        write_capture(self.tmp.name, frame_ms, {"Physics": physics, "Render": [3.0] * 200})
+        self.analytics = profiler.FrameAnalytics(profiler.ProfilerCapture(self.tmp.name))
+
+    def tearDown(self):
+        del self.analytics
+        self.tmp.cleanup()
+
+    def test_hitches_grouped_into_events(self):
+        hitches = self.analytics.hitches(factor=2.0, window=31)
+        self.assertEqual((hitches["frames"], hitches["events"]), (3, 2))
+        self.assertEqual(sorted(entry["frame"] for entry in hitches["worst"]), [60, 120, 121])
+        self.assertEqual(hitches["worst"][-1], {"frame": 60, "frame_ms": 30.0, "median_ms": 10.0})
+        self.assertEqual(hitches["systems"][0]["name"], "Physics")
+        self.assertAlmostEqual(hitches["systems"][0]["share_of_excess"], 56 / 90, places=3)
+        self.assertEqual(hitches["systems"][1]["share_of_excess"], 0.0)
+
+    def test_histogram_counts_all_frames(self):
+        histogram = self.analytics.histogram(bin_ms=5.0, limit_ms=40.0)
+        self.assertEqual(sum(histogram["counts"]), 200)
+        self.assertEqual(histogram["counts"][-1], 2)
+
+    def test_percentiles(self):
+        self.assertEqual(self.analytics.percentiles()["p50"], 10.0)
+
+
+class OnlineTrendTest(unittest.TestCase):
+    def test_linear_growth(self):
+        trend = profiler.OnlineTrend()
+        for minute in range(10):
+            trend.add(minute * 60.0, 500.0 + 2.0 * minute)
+        self.assertAlmostEqual(trend.slope * 60, 2.0)
+        self.assertAlmostEqual(trend.r2, 1.0)
+        self.assertAlmostEqual(trend.stderr, 0.0)
+        self.assertEqual(trend.to_dict()["last"], 518.0)
+
+    def test_flat_series(self):
+        trend = profiler.OnlineTrend()
+        for second in range(5):
+            trend.add(float(second), 100.0)
+        self.assertEqual((trend.slope, trend.r2), (0.0, 0.0))
+
+
+class SessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.store = profiler.SessionStore(self.root / "history", keep=3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def ingest(self, name, frame_ms, **kwargs):
+        write_capture(self.root / name, frame_ms, {"Physics": [1.0] * len(frame_ms)})
+        return self.store.ingest(self.root / name, "Main", "standalone", "abc123", **kwargs)
+
+    def test_ingest_and_query(self):
+        first = self.ingest("a", [50.0] * 5 + [10.0] * 95, warmup_frames=5)
+        self.ingest("b", [20.0] * 100)
+        meta = self.store.meta(first)
+        self.assertEqual((meta["frames"], meta["warmup_frames"], meta["complete"]), (100, 5, True))
+        self.assertEqual(len(self.store.column(first, "frame_ms")), 100)
+        self.assertIsNone(self.store.column(first, "missing"))
+
+        result = self.store.query("frame_ms", "max", scene="Main")
+        self.assertEqual(result["frames"], 195)
+        self.assertEqual(result["value"], 20.0)
+        self.assertEqual(len(result["sessions"]), 2)
+        self.assertEqual(self.store.query("Physics", "mean")["value"], 1.0)
+
+    def test_query_without_numpy(self):
+        session_id = self.ingest("a", [12.5] * 50)
+        with without_numpy():
+            self.assertEqual(list(self.store.column(session_id, "frame_ms")), [12.5] * 50)
+            self.assertEqual(self.store.query("frame_ms")["value"], 12.5)
+
+    def test_incomplete_sessions_are_listed_but_not_queried(self):
+        self.ingest("ok", [10.0] * 10)
+        failed = self.ingest("failed", [90.0] * 10, complete=False)
+        self.assertEqual(len(self.store.sessions()), 1)
+        self.assertEqual(self.store.sessions(incomplete=True)[-1]["id"], failed)
+        self.assertEqual(self.store.query("frame_ms", "max")["value"], 10.0)
+
+    def test_empty_capture_is_not_stored(self):
+        write_capture(self.root / "empty", [])
+        self.assertIsNone(self.store.ingest(self.root / "empty", "Main", "standalone", "abc123"))
+        self.assertEqual(self.store.sessions(), [])
+
+    def test_keep_limit(self):
+        ids = [self.ingest(f"s{i}", [10.0 + i] * 10) for i in range(5)]
+        entries = self.store.sessions(incomplete=True)
+        self.assertEqual([entry["id"] for entry in entries], ids[-3:])
+        self.assertEqual([round(entry["fps"]) for entry in entries], [83, 77, 71])
+        self.assertEqual(sorted(p.name for p in self.store.root.iterdir() if p.is_dir()), sorted(ids[-3:]))
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_nearest_ancestor(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = profiler.BenchmarkBaseline(Path(tmp) / "benchmarks.db")
+            analysis = {"frames": 10, "fps": 60.0, "markers": [],
+                        "stats": {"frame_ms": {"p50": 16.0, "mean": 16.0, "p95": 17.0, "max": 20.0}}}
+            for commit in ("aaa111", "bbb222", "ccc333-dirty", "unknown", "ddd444"):
+                baseline.record(commit, "Main", analysis)
+            ancestors = ["ccc333" + "0" * 34, "bbb222" + "0" * 34, "aaa111" + "0" * 34]
+            self.assertEqual(baseline.nearest_ancestor("Main", ancestors), "bbb222")
+            self.assertEqual(baseline.nearest_ancestor("Main", ancestors, exclude="bbb222"), "aaa111")
+            self.assertIsNone(baseline.nearest_ancestor("KrazTest", ancestors))
+            self.assertEqual(baseline.medians("Main", "aaa111"), {"frame_ms": [16.0]})
+            baseline.close()
+
+    def test_bootstrap_ratio(self):
+        change, low, high = profiler.bootstrap_ratio([11.0, 11.0, 11.0], [10.0, 10.0, 10.0])
+        self.assertAlmostEqual(change, 0.1)
+        self.assertAlmostEqual(low, 0.1)
+        self.assertAlmostEqual(high, 0.1)
+        change, low, high = profiler.bootstrap_ratio([10.0, 12.0, 14.0], [10.0, 10.5, 11.0])
+        self.assertLessEqual(low, change)
+        self.assertLessEqual(change, high)
+
+    def test_sweep_matrix_and_pareto(self):
+        self.assertEqual(profiler.parse_sweep_matrix("quality_level=5,0,2;anti_aliasing=0,4,4"),
+                         {"quality_level": [0, 2, 5], "anti_aliasing": [0, 4]})
+        with self.assertRaises(ValueError):
+            profiler.parse_sweep_matrix("shadows=1")
+        results = [{"name": "low", "frame_p95": 8.0, "quality": 1}, {"name": "mid", "frame_p95": 12.0, "quality": 3},
+                   {"name": "bad", "frame_p95": 13.0, "quality": 2}, {"name": "high", "frame_p95": 20.0, "quality": 5}]
+        self.assertEqual([r["name"] for r in profiler.pareto_front(results, "frame_p95")], ["low", "mid", "high"])
+
+
+@unittest.skipIf(sys.platform == "win32", "сигналы POSIX")
+class RunSessionsTest(unittest.TestCase):
+    def run_player(self, code, duration, stop_grace=5):
+        with tempfile.TemporaryDirectory() as tmp:
+            runner = profiler.UnityProfilerRunner(tmp)
+            runner.history = None
+            session = profiler.ProfilerSession("Main", 1, 0, tmp)
+            with contextlib.redirect_stdout(io.StringIO()):
+                runner.run_sessions([session], {session.name: [sys.executable, "-c", code]}, duration=duration,
+                                    sample_interval=0, stop_grace=stop_grace)
+        return session
+
+    def test_duration_stop_is_success_for_any_exit_code(self):
+        """Остановка по --duration штатная при любом коде выхода (на Windows terminate() дает 1)"""
+        session = self.run_player(
+            "import signal, sys, time\n"
+            "signal.signal(signal.SIGTERM, lambda *a: sys.exit(1))\n"
+            "time.sleep(60)", duration=0.3)
+        self.assertEqual((session.returncode, session.stop_reason, session.ok), (1, "duration", True))
+
+    def test_killed_after_grace_is_failure(self):
+        session = self.run_player(
+            "import signal, time\n"
+            "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+            "time.sleep(60)", duration=0.3, stop_grace=0.5)
+        self.assertTrue(session.killed)
+        self.assertFalse(session.ok)
+
+    def test_failed_exit_without_stop(self):
+        session = self.run_player("import sys; sys.exit(3)", duration=None)
+        self.assertEqual((session.returncode, session.ok), (3, False))
+        self.assertTrue(math.isfinite(session.elapsed))
+
+
+if __name__ == '__main__':
+    unittest.main()